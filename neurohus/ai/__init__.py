@@ -4,32 +4,58 @@
 import re
 import json
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Union
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import spacy
-from textblob import TextBlob
-import openai
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
+
+from .modeller import lat_modul, hämta_nlp, hämta_sentiment_analyzer, värm_upp
+from .sentiment import SentimentCache, poängsätt_texter
+from .empatilager import EmpatiLager, poängsätt_recensioner
+from .rekommendationscache import (RekommendationsCache, katalog_fingeravtryck, profil_fingeravtryck,
+                                   recensions_fingeravtryck)
+from .regelmotor import Regelmotor, Träffar, foga_in, regelversion
+from .modereringscache import ModereringsCache
+from .maskering import PERSONUPPGIFTS_BÖRJAN, Maskerare
+
+# Tunga bibliotek importeras först när de används
+np = lat_modul("numpy")
+sklearn_text = lat_modul("sklearn.feature_extraction.text")
+teman = lat_modul(__name__ + ".teman")
+trendlager = lat_modul(__name__ + ".trendlager")
+tidsindelning = lat_modul(__name__ + ".tidsindelning")
+trendackumulator = lat_modul(__name__ + ".trendackumulator")
+gruppanalys = lat_modul(__name__ + ".gruppanalys")
+kandidatmatris = lat_modul(__name__ + ".kandidatmatris")
+spatialt = lat_modul(__name__ + ".spatialt")
+förfilter = lat_modul(__name__ + ".förfilter")
+textmatchning = lat_modul(__name__ + ".textmatchning")
+batchmoderering = lat_modul(__name__ + ".batchmoderering")
 
 # Konfiguration
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Ladda svensk språkmodell för NLP
-try:
-    nlp = spacy.load("sv_core_news_sm")
-except OSError:
-    logger.warning("Svensk språkmodell inte tillgänglig, använder engelsk som fallback")
-    nlp = spacy.load("en_core_web_sm")
+# Publika klasser i tunga undermoduler, importeras vid första åtkomst
+_LATA_EXPORTER = {
+    'TemaIndex': 'teman',
+    'TrendStore': 'trendlager',
+    'OnlineTrend': 'trendackumulator',
+    'TrendAckumulatorer': 'trendackumulator',
+    'KandidatMatris': 'kandidatmatris',
+    'SpatialtIndex': 'spatialt',
+    'Urval': 'förfilter',
+    'TextIndex': 'textmatchning',
+}
 
-# Ladda sentimentanalys-modell
-sentiment_analyzer = pipeline("sentiment-analysis", 
-                            model="KBLab/sentence-bert-swedish-cased",
-                            tokenizer="KBLab/sentence-bert-swedish-cased")
+def __getattr__(namn: str) -> Any:
+    """Bakåtkompatibla modellnamn och lata exporter som laddas vid första åtkomst"""
+    if namn == "nlp":
+        return hämta_nlp()
+    if namn == "sentiment_analyzer":
+        return hämta_sentiment_analyzer()
+    if namn in _LATA_EXPORTER:
+        return getattr(lat_modul(f"{__name__}.{_LATA_EXPORTER[namn]}"), namn)
+    raise AttributeError(f"module {__name__!r} has no attribute {namn!r}")
 
 @dataclass
 class AnvändarProfil:
@@ -42,6 +68,7 @@ class AnvändarProfil:
     diagnoser: List[str]
     åldersgrupp: str
     behov: List[str]
+    koordinater: Optional[Tuple[float, float]] = None  # (latitud, longitud)
 
 @dataclass
 class VerksamhetsProfil:
@@ -55,17 +82,45 @@ class VerksamhetsProfil:
     kapacitet: int
     recensioner: List[Dict[str, Any]]
     kvalitetsindikatorer: Dict[str, float]
+    koordinater: Optional[Tuple[float, float]] = None  # (latitud, longitud)
+    beskrivning: Optional[str] = None
 
 class EmpatiRekommendation:
     """AI-modul för empatiska rekommendationer"""
     
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer(
-            max_features=1000,
-            stop_words='english',  # Byt till svenska när tillgängligt
-            ngram_range=(1, 2)
-        )
-        
+    def __init__(self, empati_lager: Optional[EmpatiLager] = None,
+                 resultat_cache: Optional[RekommendationsCache] = None,
+                 kontrollera_katalog: bool = True):
+        self._vectorizer = None
+        # Empatipoäng per verksamhet, uppdateras när recensioner skrivs
+        self.empati_lager = empati_lager or EmpatiLager()
+        # Kompilerade kandidater, listan de byggdes från och dess innehållsfingeravtryck
+        self.kandidater = None
+        self._kandidat_källa = None
+        self._katalog_fingeravtryck = None
+        # Recensionernas fingeravtryck per verksamhet vid senaste kompilering
+        self._recensionsavtryck: Dict[str, int] = {}
+        # Utan kontroll jämförs inte innehållet när samma lista skickas igen; ändringar
+        # anmäls i stället via registrera_recension och uppdatera_verksamhet
+        self.kontrollera_katalog = kontrollera_katalog
+        self._katalog_ändrad = False
+        # Räknas upp vid varje ändring av verksamheter eller recensioner så att cachade resultat blir inaktuella
+        self.katalogversion = 0
+        self.resultat_cache = resultat_cache or RekommendationsCache()
+        # Textindex över beskrivningar och recensioner, byggs vid första fritextsökning
+        self.textindex = None
+
+    @property
+    def vectorizer(self):
+        """TF-IDF-vektoriserare som skapas vid första användning"""
+        if self._vectorizer is None:
+            self._vectorizer = sklearn_text.TfidfVectorizer(
+                max_features=1000,
+                stop_words='english',  # Byt till svenska när tillgängligt
+                ngram_range=(1, 2)
+            )
+        return self._vectorizer
+
     def beräkna_matchning(self, användar_profil: AnvändarProfil, 
                          verksamhets_profil: VerksamhetsProfil) -> float:
         """
@@ -76,12 +131,14 @@ class EmpatiRekommendation:
             # Grundläggande matchning baserat på kriterier
             grundpoäng = self._beräkna_grundmatchning(användar_profil, verksamhets_profil)
             
-            # Empatisk analys av recensioner
-            empati_poäng = self._analysera_empati_i_recensioner(verksamhets_profil.recensioner)
+            # Empatisk analys av recensioner, förberäknad per verksamhet
+            empati_poäng = self._empati_poäng(verksamhets_profil)
             
             # Kommunspecifik anpassning
             kommun_poäng = self._beräkna_kommunmatchning(användar_profil.kommun, 
-                                                        verksamhets_profil.kommun)
+                                                        verksamhets_profil.kommun,
+                                                        användar_profil.koordinater,
+                                                        verksamhets_profil.koordinater)
             
             # Viktad summa av alla faktorer
             total_poäng = (
@@ -128,61 +185,196 @@ class EmpatiRekommendation:
         if not recensioner:
             return 0.5  # Neutral poäng om inga recensioner
         
-        empati_nyckelord = [
-            'empati', 'förståelse', 'trygg', 'respekt', 'varm', 'omsorg',
-            'professionell', 'kompetent', 'stödjande', 'inkluderande',
-            'individuell', 'personcentrerad', 'värdig', 'värdighet'
-        ]
-        
-        empati_poäng = []
-        
-        for recension in recensioner:
-            text = recension.get('innehåll', '').lower()
-            
-            # Räkna empati-nyckelord
-            empati_träffar = sum(1 for ord in empati_nyckelord if ord in text)
-            
-            # Sentimentanalys
-            try:
-                sentiment = sentiment_analyzer(text)
-                sentiment_poäng = sentiment[0]['score'] if sentiment[0]['label'] == 'POSITIVE' else 1 - sentiment[0]['score']
-            except:
-                sentiment_poäng = 0.5
-            
-            # Kombinera empati-nyckelord och sentiment
-            kombinerad_poäng = (empati_träffar / len(empati_nyckelord) * 0.6 + 
-                              sentiment_poäng * 0.4)
-            empati_poäng.append(kombinerad_poäng)
-        
-        return np.mean(empati_poäng) if empati_poäng else 0.5
+        return float(np.mean(poängsätt_recensioner(recensioner)))
     
     def _beräkna_kommunmatchning(self, användar_kommun: str, 
-                                verksamhet_kommun: str) -> float:
-        """Beräknar matchning baserat på kommun"""
+                                verksamhet_kommun: str,
+                                användar_koordinater: Optional[Tuple[float, float]] = None,
+                                verksamhet_koordinater: Optional[Tuple[float, float]] = None) -> float:
+        """Beräknar matchning baserat på avstånd när koordinater finns, annars kommun"""
+        if användar_koordinater and verksamhet_koordinater:
+            avstånd = spatialt.haversine_km(*användar_koordinater, *verksamhet_koordinater)
+            return float(spatialt.närhetspoäng(avstånd))
+        
         if användar_kommun == verksamhet_kommun:
             return 1.0
         else:
             # Ge lägre poäng för annan kommun, men inte noll
             return 0.3
     
+    def _empati_poäng(self, verksamhet: VerksamhetsProfil) -> float:
+        """Läser verksamhetens empatipoäng ur lagret, recensionerna läses in första gången"""
+        poäng = self.empati_lager.hämta(verksamhet.verksamhet_id)
+        if poäng is None:
+            self.empati_lager.backfill([verksamhet])
+            poäng = self.empati_lager.hämta(verksamhet.verksamhet_id)
+        return poäng
+    
+    def _empati_för_verksamheter(self, verksamheter: List[VerksamhetsProfil]) -> "np.ndarray":
+        """Empatipoäng per verksamhet, recensioner som saknas i lagret poängsätts i en batch"""
+        self.empati_lager.backfill(verksamheter)
+        return np.array([self.empati_lager.hämta(v.verksamhet_id) for v in verksamheter], dtype=np.float64)
+    
+    def registrera_recension(self, verksamhet: VerksamhetsProfil, recension: Dict[str, Any]) -> float:
+        """
+        Lägger till en ny recension och uppdaterar verksamhetens empatipoäng direkt,
+        utan att övriga recensioner läses om
+        """
+        if verksamhet.verksamhet_id not in self.empati_lager:
+            self.empati_lager.backfill([verksamhet])
+        verksamhet.recensioner.append(recension)
+        poäng = self.empati_lager.registrera_recension(verksamhet.verksamhet_id, recension)
+        if self.kandidater is not None:
+            self.kandidater.uppdatera_empati(verksamhet.verksamhet_id, self.empati_lager.hämta(verksamhet.verksamhet_id))
+            # Kandidaterna är redan uppdaterade, så den nya recensionen ska inte leda till omkompilering
+            self._recensionsavtryck[verksamhet.verksamhet_id] = recensions_fingeravtryck(verksamhet.recensioner)
+            if self.kontrollera_katalog:
+                self._katalog_fingeravtryck = katalog_fingeravtryck(self._kandidat_källa)
+            self.textindex = None
+        self.invalidera_katalog()
+        return poäng
+
+    def uppdatera_verksamhet(self, verksamhet: VerksamhetsProfil):
+        """
+        Anmäler att en verksamhet eller dess recensioner redigerats på plats.
+        Kandidaterna kompileras om vid nästa rekommendation och cachade resultat blir inaktuella
+        """
+        self._katalog_ändrad = True
+        self.invalidera_katalog()
+    
+    def invalidera_katalog(self):
+        """Markerar alla cachade rekommendationer som inaktuella, t.ex. efter ändringar direkt i databasen"""
+        self.katalogversion += 1
+    
+    def kompilera_kandidater(self, verksamheter: List[VerksamhetsProfil], fingeravtryck: Optional[int] = None):
+        """
+        Kompilerar verksamheterna till en kandidatmatris som återanvänds av
+        rekommendera_verksamheter. Anropas igen när verksamheter ändrats.
+        Verksamheter vars recensioner lagts till, tagits bort eller redigerats
+        sedan förra kompileringen får sin empatipoäng omräknad
+        """
+        recensionsavtryck = {v.verksamhet_id: recensions_fingeravtryck(v.recensioner) for v in verksamheter}
+        ändrade = [v for v in verksamheter
+                   if self._recensionsavtryck.get(v.verksamhet_id, recensionsavtryck[v.verksamhet_id])
+                   != recensionsavtryck[v.verksamhet_id]]
+        if ändrade:
+            self.empati_lager.backfill(ändrade, skriv_över=True)
+        self.kandidater = kandidatmatris.KandidatMatris(verksamheter, self._empati_för_verksamheter(verksamheter))
+        self._kandidat_källa = verksamheter
+        self._katalog_fingeravtryck = fingeravtryck if fingeravtryck is not None else katalog_fingeravtryck(verksamheter)
+        self._recensionsavtryck = recensionsavtryck
+        self._katalog_ändrad = False
+        self.textindex = None
+        self.invalidera_katalog()
+        return self.kandidater
+    
+    def _säkerställ_kandidater(self, alla_verksamheter: Optional[List[VerksamhetsProfil]]):
+        """
+        Kompilerar om kandidaterna när katalogens innehåll ändrats, oavsett om
+        det kommer i samma lista eller en ny. Samma innehåll behåller katalogversionen.
+        Utan `kontrollera_katalog` litar samma lista på anmälda ändringar och
+        slipper fingeravtrycket, som är linjärt i katalogens storlek
+        """
+        if alla_verksamheter is None or (not self.kontrollera_katalog
+                                         and alla_verksamheter is self._kandidat_källa):
+            if self._katalog_ändrad and self._kandidat_källa is not None:
+                self.kompilera_kandidater(self._kandidat_källa)
+            return
+        fingeravtryck = katalog_fingeravtryck(alla_verksamheter)
+        if self._katalog_ändrad or fingeravtryck != self._katalog_fingeravtryck:
+            self.kompilera_kandidater(alla_verksamheter, fingeravtryck)
+    
     def rekommendera_verksamheter(self, användar_profil: AnvändarProfil,
-                                 alla_verksamheter: List[VerksamhetsProfil],
-                                 antal: int = 5) -> List[Tuple[str, float]]:
-        """Rekommenderar verksamheter baserat på användarprofil"""
-        rekommendationer = []
+                                 alla_verksamheter: Optional[List[VerksamhetsProfil]] = None,
+                                 antal: int = 5,
+                                 max_avstånd_km: Optional[float] = None,
+                                 urval: Optional["förfilter.Urval"] = None) -> List[Tuple[str, float]]:
+        """
+        Rekommenderar verksamheter baserat på användarprofil
+        Utan `alla_verksamheter` används senast kompilerade kandidater.
+        Med `max_avstånd_km` och koordinater på profilen filtreras verksamheter på reseavstånd,
+        med `urval` även på typ, gemensam diagnos och åldersgrupp innan poängsättning.
+        Resultatet cachas per profilfingeravtryck och katalogversion
+        """
+        self._säkerställ_kandidater(alla_verksamheter)
+        if self.kandidater is None:
+            return []
         
-        for verksamhet in alla_verksamheter:
-            matchning = self.beräkna_matchning(användar_profil, verksamhet)
-            rekommendationer.append((verksamhet.verksamhet_id, matchning))
+        try:
+            fingeravtryck = profil_fingeravtryck(användar_profil, antal=antal,
+                                                 max_avstånd_km=max_avstånd_km, urval=urval)
+            katalogversion = self.katalogversion
+            resultat = self.resultat_cache.hämta(fingeravtryck, katalogversion)
+            if resultat is None:
+                resultat = self.kandidater.topp(användar_profil, antal, max_avstånd_km=max_avstånd_km, urval=urval)
+                self.resultat_cache.spara(fingeravtryck, katalogversion, resultat)
+            return resultat
+        except Exception as e:
+            logger.error(f"Fel vid rekommendation av verksamheter: {e}")
+            return []
+
+    def matcha_text(self, fritext: str,
+                    alla_verksamheter: Optional[List[VerksamhetsProfil]] = None,
+                    antal: int = 10) -> List[Tuple[str, float]]:
+        """
+        Verksamheter vars beskrivning och recensioner liknar användarens fritext om behov,
+        som (verksamhet_id, cosinuslikhet). Indexet byggs en gång per kompilerad katalog
+        """
+        self._säkerställ_kandidater(alla_verksamheter)
+        if self._kandidat_källa is None:
+            return []
         
-        # Sortera efter matchning och returnera topp-rekommendationer
-        rekommendationer.sort(key=lambda x: x[1], reverse=True)
-        return rekommendationer[:antal]
+        try:
+            if self.textindex is None:
+                verksamheter = self._kandidat_källa
+                self.textindex = textmatchning.TextIndex(self.vectorizer).bygg(
+                    [v.verksamhet_id for v in verksamheter],
+                    [textmatchning.verksamhetstext(v) for v in verksamheter])
+            return self.textindex.sök(fritext, antal)
+        except Exception as e:
+            logger.error(f"Fel vid textmatchning: {e}")
+            return []
+
+    def cache_statistik(self) -> Dict[str, Any]:
+        """Träffar och missar i resultatcachen samt aktuell katalogversion"""
+        return {**self.resultat_cache.statistik(), 'katalogversion': self.katalogversion}
+
+    def förfilter_statistik(self) -> Dict[str, Any]:
+        """Beskärningsgrad för förfiltreringen av kandidater"""
+        if self.kandidater is None:
+            return {}
+        return self.kandidater.förfilter.statistik()
+
+    def nollställ_förfilter_statistik(self):
+        """Nollställer beskärningsstatistiken, t.ex. mellan mätningar av olika urval"""
+        if self.kandidater is not None:
+            self.kandidater.nollställ_förfilter_statistik()
+
+    def rekommendera_för_många(self, användar_profiler: List[AnvändarProfil],
+                               alla_verksamheter: Optional[List[VerksamhetsProfil]] = None,
+                               antal: int = 5,
+                               max_minne_mb: float = 32,
+                               max_avstånd_km: Optional[float] = None,
+                               urval: Optional["förfilter.Urval"] = None) -> List[List[Tuple[str, float]]]:
+        """
+        Rekommendationer för många användare samtidigt, t.ex. en handläggares alla klienter.
+        Poängmatrisen användare x verksamheter beräknas blockvis med begränsat minne.
+        Returnerar en topplista per profil i samma ordning som `användar_profiler`
+        """
+        self._säkerställ_kandidater(alla_verksamheter)
+        if self.kandidater is None:
+            return [[] for _ in användar_profiler]
+
+        try:
+            return self.kandidater.topp_för_många(användar_profiler, antal, max_minne_mb, max_avstånd_km, urval)
+        except Exception as e:
+            logger.error(f"Fel vid rekommendation för flera användare: {e}")
+            return [[] for _ in användar_profiler]
 
 class EmpatiModerering:
     """AI-modul för empatisk moderering av innehåll"""
     
-    def __init__(self):
+    def __init__(self, cache: Optional[ModereringsCache] = None):
         self.negativa_nyckelord = [
             'hat', 'diskriminering', 'kränkande', 'nedvärderande',
             'förnedrande', 'hot', 'mobbning', 'trakasseri'
@@ -192,21 +384,72 @@ class EmpatiModerering:
             'respekt', 'förståelse', 'empati', 'stöd', 'hjälp',
             'tack', 'uppskattning', 'värdefull', 'viktig'
         ]
+        
+        self.roll_termer = {
+            # Familjer bör undvika specifika medicinska termer utan kontext
+            'familj': ['diagnos', 'behandling', 'terapi'],
+            # Assistenter bör använda professionellt språk
+            'assistent': ['brukare', 'omsorg', 'stöd', 'assistans']
+        }
+        
+        # Enkel implementation - i verkligheten skulle detta vara mer sofistikerat
+        self.förbättringar = {
+            'inte bra': 'kan förbättras',
+            'dålig': 'utvecklingspotential',
+            'problem': 'utmaning',
+            'fel': 'förbättringsområde'
+        }
+        
+        self.maskerare = Maskerare()
+        self.cache = cache if cache is not None else ModereringsCache.delad()
+        self.kompilera_regler()
+    
+    def kompilera_regler(self):
+        """Kompilerar om regelmotorn efter ändrade regler och byter regelversion för cachen"""
+        self.regler = Regelmotor(
+            ordlistor={
+                'negativ': self.negativa_nyckelord,
+                'empatisk': self.empatiska_nyckelord,
+                **{f'roll:{roll}': termer for roll, termer in self.roll_termer.items()},
+                'förbättring': list(self.förbättringar)
+            },
+            mönster={'personuppgift': self.maskerare.alla_mönster},
+            mönster_början=PERSONUPPGIFTS_BÖRJAN
+        )
+        self.regelversion = regelversion(type(self).__module__, type(self).__qualname__,
+                                         self.regler.version, self.förbättringar, self.maskerare.etiketter)
     
     def moderera_text(self, text: str, användare_roll: str) -> Dict[str, Any]:
         """
         Modererar text med fokus på empati och respekt
         Returnerar modereringsresultat med rekommendationer
         """
+        nyckel = self.cache.nyckel(self.regelversion, 'text', text, användare_roll)
+        resultat = self.cache.hämta(nyckel)
+        if resultat is None:
+            resultat = self._moderera(text, användare_roll)
+            self.cache.spara(nyckel, resultat)
+        elif 'säkerhets_resultat' in resultat:
+            # Cachen sparar inte personuppgifterna, de läses ur texten igen när de kan finnas
+            säkerhet = resultat['säkerhets_resultat']
+            personuppgifter = [] if säkerhet['säker'] else [
+                text[start:slut] for _, start, slut in self.maskerare.spann(text)]
+            resultat['säkerhets_resultat'] = {**säkerhet, 'personuppgifter': personuppgifter}
+        return resultat
+    
+    def _moderera(self, text: str, användare_roll: str) -> Dict[str, Any]:
         try:
+            # Alla regler söks i ett pass och delas av kontrollerna nedan
+            träffar = self.regler.sök(text)
+            
             # Grundläggande säkerhetskontroll
-            säkerhets_resultat = self._kontrollera_säkerhet(text)
+            säkerhets_resultat = self._kontrollera_säkerhet(text, träffar)
             
             # Empatisk analys
-            empati_resultat = self._analysera_empati(text)
+            empati_resultat = self._analysera_empati(text, träffar)
             
             # Rollspecifik moderering
-            roll_resultat = self._moderera_för_roll(text, användare_roll)
+            roll_resultat = self._moderera_för_roll(text, användare_roll, träffar)
             
             # Kombinera resultat
             total_poäng = (
@@ -224,7 +467,7 @@ class EmpatiModerering:
                 'empati_resultat': empati_resultat,
                 'roll_resultat': roll_resultat,
                 'rekommendationer': self._generera_rekommendationer(text, total_poäng),
-                'modererad_text': self._förbättra_text(text) if not godkänd else text
+                'modererad_text': self._förbättra_text(text, träffar) if not godkänd else text
             }
             
         except Exception as e:
@@ -235,15 +478,13 @@ class EmpatiModerering:
                 'fel': str(e)
             }
     
-    def _kontrollera_säkerhet(self, text: str) -> Dict[str, Any]:
+    def _kontrollera_säkerhet(self, text: str, träffar: Optional[Träffar] = None) -> Dict[str, Any]:
         """Kontrollerar säkerhet och innehåll som kan vara skadligt"""
-        text_lower = text.lower()
-        
-        # Kontrollera negativa nyckelord
-        negativa_träffar = [ord for ord in self.negativa_nyckelord if ord in text_lower]
+        träffar = träffar if träffar is not None else self.regler.sök(text)
         
-        # Kontrollera personuppgifter (enkel regex)
-        personuppgifter = re.findall(r'\b\d{4}-\d{2}-\d{2}\b|\b\d{10,12}\b', text)
+        # Negativa nyckelord och personuppgifter (enkel regex)
+        negativa_träffar = träffar.termer('negativ')
+        personuppgifter = träffar.texter('personuppgift')
         
         säker = len(negativa_träffar) == 0 and len(personuppgifter) == 0
         
@@ -254,16 +495,16 @@ class EmpatiModerering:
             'personuppgifter': personuppgifter
         }
     
-    def _analysera_empati(self, text: str) -> Dict[str, Any]:
+    def _analysera_empati(self, text: str, träffar: Optional[Träffar] = None) -> Dict[str, Any]:
         """Analyserar empati och respekt i texten"""
-        text_lower = text.lower()
+        träffar = träffar if träffar is not None else self.regler.sök(text)
         
-        # Räkna empatiska nyckelord
-        empatiska_träffar = [ord for ord in self.empatiska_nyckelord if ord in text_lower]
+        # Empatiska nyckelord
+        empatiska_träffar = träffar.termer('empatisk')
         
         # Sentimentanalys
         try:
-            sentiment = sentiment_analyzer(text)
+            sentiment = hämta_sentiment_analyzer()(text)
             sentiment_poäng = sentiment[0]['score'] if sentiment[0]['label'] == 'POSITIVE' else 1 - sentiment[0]['score']
         except:
             sentiment_poäng = 0.5
@@ -277,23 +518,16 @@ class EmpatiModerering:
             'sentiment_poäng': sentiment_poäng
         }
     
-    def _moderera_för_roll(self, text: str, roll: str) -> Dict[str, Any]:
+    def _moderera_för_roll(self, text: str, roll: str, träffar: Optional[Träffar] = None) -> Dict[str, Any]:
         """Rollspecifik moderering"""
+        träffar = träffar if träffar is not None else self.regler.sök(text)
+        roll_träffar = träffar.termer(f'roll:{roll}')
+        
         if roll == 'familj':
-            # Familjer bör undvika specifika medicinska termer utan kontext
-            medicinska_termer = ['diagnos', 'behandling', 'terapi']
-            text_lower = text.lower()
-            medicinska_träffar = [term for term in medicinska_termer if term in text_lower]
-            
-            poäng = 1.0 if len(medicinska_träffar) == 0 else 0.7
+            poäng = 1.0 if len(roll_träffar) == 0 else 0.7
             
         elif roll == 'assistent':
-            # Assistenter bör använda professionellt språk
-            professionella_termer = ['brukare', 'omsorg', 'stöd', 'assistans']
-            text_lower = text.lower()
-            professionella_träffar = [term for term in professionella_termer if term in text_lower]
-            
-            poäng = min(1.0, len(professionella_träffar) / 3 + 0.5)
+            poäng = min(1.0, len(roll_träffar) / 3 + 0.5)
             
         else:
             poäng = 0.8  # Standard för andra roller
@@ -317,49 +551,100 @@ class EmpatiModerering:
         
         return rekommendationer
     
-    def _förbättra_text(self, text: str) -> str:
-        """Förbättrar text med empatiska förslag"""
-        # Enkel implementation - i verkligheten skulle detta vara mer sofistikerat
-        förbättringar = {
-            'inte bra': 'kan förbättras',
-            'dålig': 'utvecklingspotential',
-            'problem': 'utmaning',
-            'fel': 'förbättringsområde'
-        }
-        
-        förbättrad_text = text
-        for gammalt, nytt in förbättringar.items():
-            förbättrad_text = förbättrad_text.replace(gammalt, nytt)
-        
-        return förbättrad_text
+    def _förbättra_text(self, text: str, träffar: Optional[Träffar] = None) -> str:
+        """Förbättrar text med empatiska förslag och maskerar personuppgifter i ett pass"""
+        träffar = träffar if träffar is not None else self.regler.sök(text)
+        ändringar = (self.maskerare.ändringar(self.maskerare.spann_från_träffar(träffar))
+                     + self.regler.ändringar(text, 'förbättring', self.förbättringar, träffar))
+        return foga_in(text, sorted(ändringar))
+    
+    def cache_statistik(self) -> Dict[str, Any]:
+        """Träffar och missar i resultatcachen samt aktuell regelversion"""
+        return {**self.cache.statistik(), 'regelversion': self.regelversion}
+    
+    def moderera_batch(self, poster, användare_roll: str = 'användare', bitstorlek: int = 256,
+                       processer: Optional[int] = None):
+        """Modererar en ström av texter i en processpool, resultaten lämnas i postordning"""
+        return batchmoderering.moderera_batch(self, poster, användare_roll, bitstorlek, processer)
 
 class TrendAnalys:
     """AI-modul för trendanalys per kommun och kategori"""
     
-    def __init__(self):
-        self.vektoriserare = TfidfVectorizer(max_features=500, ngram_range=(1, 2))
+    def __init__(self, sentiment_batch_storlek: int = 32,
+                 sentiment_cache: Optional[SentimentCache] = None,
+                 inkrementella_teman: bool = False):
+        self._vektoriserare = None
+        self.sentiment_batch_storlek = sentiment_batch_storlek
+        self.sentiment_cache = sentiment_cache or SentimentCache.delad()
+        # Ett temaindex per (kommun, kategori) som bara tar in nya poster
+        self.inkrementella_teman = inkrementella_teman
+        self.temaindex: Dict[Tuple[Optional[str], Optional[str]], Any] = {}
+        # Löpande sentimenttrender som matas när nya poster poängsätts
+        self._trendackumulatorer = None
+    
+    @property
+    def trendackumulatorer(self):
+        """Löpande trender per kommun och kategori, skapas vid första användning"""
+        if self._trendackumulatorer is None:
+            self._trendackumulatorer = trendackumulator.TrendAckumulatorer()
+        return self._trendackumulatorer
+    
+    def registrera_sentiment(self, post: Dict[str, Any], poäng: Optional[float] = None) -> Optional[float]:
+        """
+        Registrerar en ny post i de löpande trenderna i konstant tid
+        Poängsätter postens text om ingen poäng skickas med
+        """
+        if poäng is None:
+            text = post.get('innehåll', '') or post.get('beskrivning', '')
+            poäng = poängsätt_texter([text], cache=self.sentiment_cache).poäng[0]
+            if poäng is None:
+                return None
+        self.trendackumulatorer.registrera(post.get('kommun'), post.get('kategori'), poäng)
+        return poäng
+    
+    def hämta_sentiment_trend(self, kommun: str = None, kategori: str = None,
+                              lager: Optional["trendlager.TrendStore"] = None) -> Dict[str, Any]:
+        """
+        Aktuell sentimenttrend ur de löpande trenderna, utan omräkning.
+        Med `lager` hämtas trenden för de poäng som sparats i det lagret
+        """
+        if lager is not None:
+            return lager.sentiment_trend(*lager.koder_för(kommun, kategori)).sammanfattning()
+        return self.trendackumulatorer.hämta(kommun, kategori)
+
+    @property
+    def vektoriserare(self):
+        """TF-IDF-vektoriserare som skapas vid första användning"""
+        if self._vektoriserare is None:
+            self._vektoriserare = sklearn_text.TfidfVectorizer(max_features=500, ngram_range=(1, 2))
+        return self._vektoriserare
     
-    def analysera_trender(self, data: List[Dict[str, Any]], 
+    def analysera_trender(self, data: Union[List[Dict[str, Any]], "trendlager.TrendStore"], 
                         kommun: str = None, 
-                        kategori: str = None) -> Dict[str, Any]:
+                        kategori: str = None,
+                        upplösning: str = 'månad') -> Dict[str, Any]:
         """
         Analyserar trender i data baserat på kommun och kategori
+        Tar emot en lista med poster eller ett TrendStore som kan återanvändas mellan anrop.
+        Tidsanalysen delas in per dag, vecka, månad eller kvartal enligt `upplösning`
         """
         try:
-            # Filtrera data baserat på parametrar
-            filtrerad_data = self._filtrera_data(data, kommun, kategori)
+            lager = data if isinstance(data, trendlager.TrendStore) else trendlager.TrendStore.från_poster(data)
+            
+            # Filtrera via radindex för kommun och kategori
+            rader = lager.rader(kommun, kategori)
             
-            if not filtrerad_data:
+            if len(rader) == 0:
                 return {'fel': 'Ingen data att analysera'}
             
             # Analysera trender över tid
-            tidsanalys = self._analysera_tids_trender(filtrerad_data)
+            tidsanalys = self._analysera_tids_trender(lager.tider[rader], upplösning)
             
             # Analysera sentiment-trender
-            sentiment_trender = self._analysera_sentiment_trender(filtrerad_data)
+            sentiment_trender = self._analysera_sentiment_trender(lager, rader, lager.koder_för(kommun, kategori))
             
             # Analysera teman och nyckelord
-            tema_analys = self._analysera_teman(filtrerad_data)
+            tema_analys = self._analysera_teman(lager.poster_för(rader), (kommun, kategori))
             
             # Generera insikter
             insikter = self._generera_insikter(tidsanalys, sentiment_trender, tema_analys)
@@ -378,101 +663,151 @@ class TrendAnalys:
             logger.error(f"Fel vid trendanalys: {e}")
             return {'fel': str(e)}
     
-    def _filtrera_data(self, data: List[Dict[str, Any]], 
-                      kommun: str, kategori: str) -> List[Dict[str, Any]]:
-        """Filtrerar data baserat på kommun och kategori"""
-        filtrerad = data
-        
-        if kommun:
-            filtrerad = [d for d in filtrerad if d.get('kommun') == kommun]
-        
-        if kategori:
-            filtrerad = [d for d in filtrerad if d.get('kategori') == kategori]
-        
-        return filtrerad
-    
-    def _analysera_tids_trender(self, data: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Analyserar trender över tid"""
-        # Gruppera data per månad
-        månads_data = {}
-        
-        for post in data:
-            datum = datetime.fromisoformat(post.get('skapad', datetime.now().isoformat()))
-            månad_nyckel = f"{datum.year}-{datum.month:02d}"
-            
-            if månad_nyckel not in månads_data:
-                månads_data[månad_nyckel] = []
-            månads_data[månad_nyckel].append(post)
-        
-        # Beräkna trender
-        trender = {}
-        förra_månaden = None
-        
-        for månad in sorted(månads_data.keys()):
-            antal_poster = len(månads_data[månad])
-            
-            if förra_månaden:
-                förändring = antal_poster - månads_data[förra_månaden]
-                trender[månad] = {
-                    'antal_poster': antal_poster,
-                    'förändring': förändring,
-                    'förändring_procent': (förändring / månads_data[förra_månaden]) * 100 if månads_data[förra_månaden] > 0 else 0
-                }
-            else:
-                trender[månad] = {
-                    'antal_poster': antal_poster,
-                    'förändring': 0,
-                    'förändring_procent': 0
+    def analysera_alla_kommuner(self, data: Union[List[Dict[str, Any]], "trendlager.TrendStore"],
+                                per_kategori: bool = False,
+                                upplösning: str = 'månad',
+                                processer: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Analyserar trender för alla kommuner i ett svep: en sentimentpoängsättning,
+        en gemensam TF-IDF-vektorisering och en gruppering av raderna.
+        Returnerar {kommun: resultat} eller {kommun: {kategori: resultat}} med `per_kategori`.
+        Med `processer` sker termräkningen i en processpool när datamängden är stor
+        """
+        try:
+            lager = data if isinstance(data, trendlager.TrendStore) else trendlager.TrendStore.från_poster(data)
+            if len(lager) == 0:
+                return {'fel': 'Ingen data att analysera'}
+
+            # Gruppkod per rad: kommun, eller kommun och kategori
+            antal_kategorier = len(lager.kategorier.värden)
+            koder = lager.kommun_koder.astype(np.int64)
+            if per_kategori:
+                koder = koder * antal_kategorier + lager.kategori_koder
+            grupper, ordning, gränser = gruppanalys.gruppera(koder)
+            grupp_per_rad = np.empty(len(lager), dtype=np.int64)
+            grupp_per_rad[ordning] = np.repeat(np.arange(len(grupper)), np.diff(gränser))
+
+            # En poängsättning för alla rader som saknar sentiment, bortfall per grupp
+            saknas = lager.saknar_sentiment(np.arange(len(lager)))
+            bortfall: Dict[int, Dict[str, int]] = {}
+            if len(saknas):
+                resultat = poängsätt_texter(lager.texter_för(saknas), batch_storlek=self.sentiment_batch_storlek,
+                                            cache=self.sentiment_cache)
+                lager.sätt_sentiment(saknas, resultat.poäng)
+                for rad, orsak in zip(saknas, resultat.orsaker):
+                    if orsak:
+                        grupp_bortfall = bortfall.setdefault(int(grupp_per_rad[rad]), {})
+                        grupp_bortfall[orsak] = grupp_bortfall.get(orsak, 0) + 1
+
+            tema_per_grupp = self._analysera_teman_per_grupp(lager, grupp_per_rad, len(grupper), processer)
+
+            analys_datum = datetime.now().isoformat()
+            resultat_per_kommun: Dict[str, Any] = {}
+            for i, kod in enumerate(grupper):
+                rader = ordning[gränser[i]:gränser[i + 1]]
+                if per_kategori:
+                    koder = (int(kod // antal_kategorier), int(kod % antal_kategorier))
+                    kommun, kategori = lager.kommuner.värden[koder[0]], lager.kategorier.värden[koder[1]]
+                else:
+                    koder = (int(kod), None)
+                    kommun, kategori = lager.kommuner.värden[kod], None
+
+                tidsanalys = self._analysera_tids_trender(lager.tider[rader], upplösning)
+                sentiment_trender = self._sammanfatta_sentiment(lager, koder, bortfall.get(i, {}))
+                tema_analys = tema_per_grupp[i]
+
+                analys = {
+                    'kommun': kommun,
+                    'kategori': kategori,
+                    'tidsanalys': tidsanalys,
+                    'sentiment_trender': sentiment_trender,
+                    'tema_analys': tema_analys,
+                    'insikter': self._generera_insikter(tidsanalys, sentiment_trender, tema_analys),
+                    'analys_datum': analys_datum
                 }
-            
-            förra_månaden = månad
-        
-        return trender
-    
-    def _analysera_sentiment_trender(self, data: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Analyserar sentiment-trender"""
-        sentiment_data = []
-        
-        for post in data:
-            text = post.get('innehåll', '') or post.get('beskrivning', '')
-            if text:
-                try:
-                    sentiment = sentiment_analyzer(text)
-                    sentiment_data.append({
-                        'datum': post.get('skapad'),
-                        'sentiment': sentiment[0]['score'] if sentiment[0]['label'] == 'POSITIVE' else 1 - sentiment[0]['score']
-                    })
-                except:
+                if per_kategori:
+                    resultat_per_kommun.setdefault(kommun, {})[kategori] = analys
+                else:
+                    resultat_per_kommun[kommun] = analys
+
+            return resultat_per_kommun
+
+        except Exception as e:
+            logger.error(f"Fel vid trendanalys för alla kommuner: {e}")
+            return {'fel': str(e)}
+
+    def _analysera_teman_per_grupp(self, lager: "trendlager.TrendStore", grupp_per_rad: "np.ndarray",
+                                   antal_grupper: int, processer: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Teman per grupp ur en gemensam TF-IDF-matris över alla texter"""
+        tomt = {'vanligaste_teman': [], 'nyckelord': []}
+        med_text = np.flatnonzero(lager.har_text)
+        if len(med_text) == 0:
+            return [dict(tomt) for _ in range(antal_grupper)]
+
+        try:
+            tfidf_matrix, termer = gruppanalys.tfidf(lager.texter_för(med_text), ngram_range=(1, 2),
+                                                     max_features=500, processer=processer)
+            medel = gruppanalys.gruppmedel(tfidf_matrix, grupp_per_rad[med_text], antal_grupper)
+            topp = gruppanalys.toppkolumner(medel, 10)
+            har_text = np.bincount(grupp_per_rad[med_text], minlength=antal_grupper) > 0
+
+            resultat = []
+            for i in range(antal_grupper):
+                if not har_text[i]:
+                    resultat.append(dict(tomt))
                     continue
-        
-        if not sentiment_data:
-            return {'genomsnittligt_sentiment': 0.5, 'trend': 'neutral'}
-        
-        genomsnittligt_sentiment = np.mean([d['sentiment'] for d in sentiment_data])
-        
-        # Beräkna trend (enkel linjär regression)
-        if len(sentiment_data) > 1:
-            x = np.arange(len(sentiment_data))
-            y = [d['sentiment'] for d in sentiment_data]
-            trend_koefficient = np.polyfit(x, y, 1)[0]
-            
-            if trend_koefficient > 0.01:
-                trend = 'förbättring'
-            elif trend_koefficient < -0.01:
-                trend = 'försämring'
-            else:
-                trend = 'stabil'
-        else:
-            trend = 'neutral'
+                # Den gemensamma vokabulären innehåller termer som gruppen saknar helt
+                vanligaste_teman = [str(termer[j]) for j in topp[i] if medel[i, j] > 0]
+                resultat.append({
+                    'vanligaste_teman': vanligaste_teman,
+                    'nyckelord': vanligaste_teman[:5]
+                })
+            return resultat
+
+        except Exception as e:
+            logger.error(f"Fel vid tema-analys per grupp: {e}")
+            return [dict(tomt) for _ in range(antal_grupper)]
+
+    def _analysera_tids_trender(self, tider: "np.ndarray", upplösning: str = 'månad') -> Dict[str, Any]:
+        """Analyserar trender över tid, tomma perioder räknas med som noll poster"""
+        return tidsindelning.dela_in(tider, upplösning).som_dict()
+    
+    def _analysera_sentiment_trender(self, lager: "trendlager.TrendStore", rader: "np.ndarray",
+                                     koder: Tuple[Optional[int], Optional[int]]) -> Dict[str, Any]:
+        """Analyserar sentiment-trender, poster som redan poängsatts i lagret återanvänds"""
+        saknas = lager.saknar_sentiment(rader)
+        bortfall = {}
+        if len(saknas):
+            resultat = poängsätt_texter(lager.texter_för(saknas), batch_storlek=self.sentiment_batch_storlek,
+                                        cache=self.sentiment_cache)
+            lager.sätt_sentiment(saknas, resultat.poäng)
+            bortfall = resultat.bortfall
+
+        return self._sammanfatta_sentiment(lager, koder, bortfall)
+
+    def _sammanfatta_sentiment(self, lager: "trendlager.TrendStore", koder: Tuple[Optional[int], Optional[int]],
+                               bortfall: Dict[str, int]) -> Dict[str, Any]:
+        """Medelvärde och trend ur lagrets löpande trend för gruppen, bortfall räknas inte med"""
+        # Löpande summor som bara matas med nya poäng, samma lutning som minsta-kvadrat-anpassning
+        trend = lager.sentiment_trend(*koder)
+
+        if trend.n == 0:
+            return {'genomsnittligt_sentiment': 0.5, 'trend': 'neutral', 'bortfall': bortfall}
         
         return {
-            'genomsnittligt_sentiment': genomsnittligt_sentiment,
-            'trend': trend,
-            'antal_analyserade': len(sentiment_data)
+            'genomsnittligt_sentiment': float(trend.medel_y),
+            'trend': trend.trend(),
+            'antal_analyserade': trend.n,
+            'antal_bortfall': sum(bortfall.values()),
+            'bortfall': bortfall
         }
     
-    def _analysera_teman(self, data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _analysera_teman(self, data: List[Dict[str, Any]],
+                         nyckel: Tuple[Optional[str], Optional[str]] = (None, None)) -> Dict[str, Any]:
         """Analyserar teman och nyckelord"""
+        if self.inkrementella_teman:
+            return self._analysera_teman_inkrementellt(data, nyckel)
+        
         texter = []
         
         for post in data:
@@ -488,8 +823,8 @@ class TrendAnalys:
             tfidf_matrix = self.vektoriserare.fit_transform(texter)
             feature_names = self.vektoriserare.get_feature_names_out()
             
-            # Hitta de vanligaste termerna
-            mean_scores = np.mean(tfidf_matrix.toarray(), axis=0)
+            # Hitta de vanligaste termerna, matrisen hålls gles
+            mean_scores = np.asarray(tfidf_matrix.mean(axis=0)).ravel()
             top_indices = np.argsort(mean_scores)[-10:][::-1]
             
             vanligaste_teman = [feature_names[i] for i in top_indices]
@@ -503,6 +838,25 @@ class TrendAnalys:
             logger.error(f"Fel vid tema-analys: {e}")
             return {'vanligaste_teman': [], 'nyckelord': []}
     
+    def _analysera_teman_inkrementellt(self, data: List[Dict[str, Any]],
+                                       nyckel: Tuple[Optional[str], Optional[str]]) -> Dict[str, Any]:
+        """Uppdaterar temaindexet med poster som inte setts tidigare"""
+        try:
+            index = self.temaindex.get(nyckel)
+            if index is None:
+                index = self.temaindex[nyckel] = teman.TemaIndex(ngram_range=(1, 2), max_features=500)
+            index.lägg_till_poster(data)
+            
+            vanligaste_teman = index.toppteman(10)
+            return {
+                'vanligaste_teman': vanligaste_teman,
+                'nyckelord': vanligaste_teman[:5]
+            }
+            
+        except Exception as e:
+            logger.error(f"Fel vid inkrementell tema-analys: {e}")
+            return {'vanligaste_teman': [], 'nyckelord': []}
+    
     def _generera_insikter(self, tidsanalys: Dict, sentiment_trender: Dict, 
                           tema_analys: Dict) -> List[str]:
         """Genererar AI-insikter baserat på analysen"""
@@ -510,9 +864,9 @@ class TrendAnalys:
         
         # Tidsbaserade insikter
         if tidsanalys:
-            senaste_månad = max(tidsanalys.keys()) if tidsanalys else None
-            if senaste_månad and tidsanalys[senaste_månad]['förändring'] > 0:
-                insikter.append(f"Aktivitet har ökat med {tidsanalys[senaste_månad]['förändring']} poster den senaste månaden")
+            senaste_perioden = max(tidsanalys.keys()) if tidsanalys else None
+            if senaste_perioden and tidsanalys[senaste_perioden]['förändring'] > 0:
+                insikter.append(f"Aktivitet har ökat med {tidsanalys[senaste_perioden]['förändring']} poster den senaste perioden")
         
         # Sentiment-insikter
         if sentiment_trender.get('trend') == 'förbättring':
@@ -672,10 +1026,32 @@ class NeuroljusAI:
     
     def _generera_verksamhets_rekommendationer(self, användare_id: str, 
                                               interaktion: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Genererar verksamhetsrekommendationer för användare"""
+        """
+        Genererar verksamhetsrekommendationer för användare. Med en profil i interaktionen
+        och en kompilerad katalog används den cachade rekommendationsmotorn
+        """
+        profil = interaktion.get('profil')
+        if isinstance(profil, dict):
+            profil = AnvändarProfil(**{'användare_id': användare_id, 'preferenser': {},
+                                       'tidigare_interaktioner': [], **profil})
+        alla_verksamheter = interaktion.get('verksamheter')
+        if profil is not None and (alla_verksamheter is not None or self.rekommendation.kandidater is not None):
+            topplista = self.rekommendation.rekommendera_verksamheter(
+                profil, alla_verksamheter,
+                antal=interaktion.get('antal', 5),
+                max_avstånd_km=interaktion.get('max_avstånd_km')
+            )
+            return [
+                {
+                    'verksamhet_id': verksamhet_id,
+                    'matchning': matchning,
+                    'anledning': 'Matchning baserad på diagnoser, tjänster, åldersgrupp, närhet och empati i recensioner'
+                }
+                for verksamhet_id, matchning in topplista
+            ]
+
         # Här skulle vi hämta användarprofil och verksamheter från databasen
-        # För nu returnerar vi mockade rekommendationer
-        
+        # Utan profil returnerar vi mockade rekommendationer
         return [
             {
                 'verksamhet_id': 'mock-1',
@@ -1,17 +1,27 @@
 # Empatisk moderering av innehåll
 # Språkgranskning, empati-ton, borttagning av persondata
 
-import re
+import heapq
 import logging
-from typing import Dict, Any, List
+import time
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple, Union
 from datetime import datetime
 
+from .batchmoderering import Post, moderera_batch
+from .maskering import PERSONUPPGIFTS_BÖRJAN, Maskerare, Spann
+from .modereringscache import ModereringsCache
+from .regelmotor import Regelmotor, Träffar, foga_in, regelversion
+from .strömmoderering import StrömModerering
+
 logger = logging.getLogger(__name__)
 
+# Höjs när poängsättningen eller resultatets form ändras, så att cachade resultat inte återanvänds
+RESULTATVERSION = 1
+
 class EmpatiModerering:
     """AI-modul för empatisk moderering av innehåll"""
     
-    def __init__(self):
+    def __init__(self, cache: Optional[ModereringsCache] = None, mätsink: Any = None):
         self.negativa_nyckelord = [
             'hat', 'diskriminering', 'kränkande', 'nedvärderande',
             'förnedrande', 'hot', 'mobbning', 'trakasseri', 'dum',
@@ -24,47 +34,138 @@ class EmpatiModerering:
             'fantastisk', 'professionell', 'kompetent', 'varm'
         ]
         
-        self.personuppgifts_mönster = [
-            r'\b\d{4}-\d{2}-\d{2}\b',  # Personnummer
-            r'\b\d{10,12}\b',          # Telefonnummer
-            r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',  # E-post
-            r'\b\d{3}-\d{2}-\d{2}\b'   # Personnummer med bindestreck
+        # Personnummer, telefonnummer och e-post, se maskering.PERSONUPPGIFTS_MÖNSTER
+        self.maskerare = Maskerare()
+        self.personuppgifts_mönster = self.maskerare.alla_mönster
+        
+        # Hotmönster som (utlösare, fortsättning), rapporteras som hela mönstret
+        self.hot_mönster = [
+            ('jag ska', '.*döda'),
+            ('jag kommer', '.*skada'),
+            ('jag vill', '.*döda'),
+            ('hotar', '.*att'),
+            ('kommer', '.*att.*skada')
         ]
+        
+        self.positiva_ord = ['bra', 'fantastisk', 'utmärkt', 'perfekt', 'rekommenderar', 'tack']
+        self.negativa_ord = ['dålig', 'fruktansvärd', 'undvik', 'problem', 'fel', 'hatar']
+        
+        self.roll_termer = {
+            # Familjer bör undvika specifika medicinska termer utan kontext
+            'familj': ['diagnos', 'behandling', 'terapi', 'medicin'],
+            # Assistenter bör använda professionellt språk
+            'assistent': ['brukare', 'omsorg', 'stöd', 'assistans', 'professionell'],
+            # Kommuner bör använda formellt språk
+            'kommun': ['verksamhet', 'tjänst', 'insats', 'samhällsansvar']
+        }
+        
+        # Enkel implementation - i verkligheten skulle detta vara mer sofistikerat
+        self.förbättringar = {
+            'inte bra': 'kan förbättras',
+            'dålig': 'utvecklingspotential',
+            'problem': 'utmaning',
+            'fel': 'förbättringsområde',
+            'hatar': 'tycker inte om',
+            'idiot': 'person',
+            'dum': 'ovan',
+            'korkad': 'ovan'
+        }
+        
+        # Resultat cachas per regelversion, standard är den processgemensamma cachen
+        self.cache = cache if cache is not None else ModereringsCache.delad()
+        # Tider per steg i nanosekunder till ett objekt med registrera(steg, nanosekunder), t.ex. StegStatistik
+        self.mätsink = mätsink
+        self.kompilera_regler()
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        # Mätsinken hör till processen som skapade instansen och följer inte med till arbetsprocesser
+        tillstånd = self.__dict__.copy()
+        tillstånd['mätsink'] = None
+        return tillstånd
+    
+    def kompilera_regler(self):
+        """
+        Kompilerar om regelmotorn från nyckelord, mönster och förbättringar. Anropas
+        efter ändrade regler; ny regelversion gör att gamla cachade resultat inte används
+        """
+        self.regler = Regelmotor(
+            ordlistor={
+                'negativ': self.negativa_nyckelord,
+                'empatisk': self.empatiska_nyckelord,
+                'positiv': self.positiva_ord,
+                'negativ_sentiment': self.negativa_ord,
+                **{f'roll:{roll}': termer for roll, termer in self.roll_termer.items()},
+                'förbättring': list(self.förbättringar),
+                'lösning': ['lösning'],
+                'recension_negativ': ['dålig', 'fruktansvärd', 'hatar', 'undvik'],
+                'recension_positiv': ['fantastisk', 'perfekt', 'rekommenderar', 'utmärkt']
+            },
+            mönster={'personuppgift': self.personuppgifts_mönster},
+            villkor={'hot': self.hot_mönster},
+            mönster_början=PERSONUPPGIFTS_BÖRJAN
+        )
+        self.regelversion = regelversion(type(self).__module__, type(self).__qualname__, RESULTATVERSION,
+                                         self.regler.version, self.förbättringar, self.maskerare.etiketter)
     
     def moderera_text(self, text: str, användare_roll: str) -> Dict[str, Any]:
         """
         Modererar text med fokus på empati och respekt
         Returnerar modereringsresultat med rekommendationer
         """
+        start = t = time.perf_counter_ns() if self.mätsink is not None else 0
+        nyckel = self.cache.nyckel(self.regelversion, 'text', text, användare_roll)
+        resultat = self.cache.hämta(nyckel)
+        if resultat is not None:
+            resultat = self._från_cache(text, resultat)
+        t = self._steg('cacheuppslag', t)
+        if resultat is None:
+            resultat = self._moderera(text, användare_roll)[0]
+            t = time.perf_counter_ns() if self.mätsink is not None else 0
+            self.cache.spara(nyckel, resultat)
+            self._steg('cachelagring', t)
+        self._steg('totalt', start)
+        return resultat
+    
+    @staticmethod
+    def _från_cache(text: str, resultat: Dict[str, Any]) -> Dict[str, Any]:
+        """Fyller i det cachen inte sparar: personuppgifterna ur texten via spannen och aktuell tidpunkt"""
+        säkerhet = resultat.get('säkerhets_resultat')
+        if säkerhet is not None:
+            resultat['säkerhets_resultat'] = {
+                **säkerhet,
+                'personuppgifter': [text[start:slut] for _, start, slut in säkerhet['personuppgifts_spann']]
+            }
+        resultat['modererings_datum'] = datetime.now().isoformat()
+        return resultat
+
+    def _steg(self, steg: str, start: int) -> int:
+        """Registrerar tiden sedan `start` för steget och returnerar ny starttid, gör inget utan mätsink"""
+        if self.mätsink is None:
+            return 0
+        nu = time.perf_counter_ns()
+        self.mätsink.registrera(steg, nu - start)
+        return nu
+    
+    def _moderera(self, text: str, användare_roll: str) -> Tuple[Dict[str, Any], Optional[Träffar]]:
+        """Modererar texten och returnerar även regelträffarna så att de kan återanvändas"""
         try:
-            # Grundläggande säkerhetskontroll
-            säkerhets_resultat = self._kontrollera_säkerhet(text)
-            
-            # Empatisk analys
-            empati_resultat = self._analysera_empati(text)
-            
-            # Rollspecifik moderering
-            roll_resultat = self._moderera_för_roll(text, användare_roll)
-            
-            # Kombinera resultat
-            total_poäng = (
-                säkerhets_resultat['poäng'] * 0.4 +
-                empati_resultat['poäng'] * 0.4 +
-                roll_resultat['poäng'] * 0.2
-            )
-            
-            godkänd = total_poäng >= 0.7 and säkerhets_resultat['säker']
-            
-            return {
-                'godkänd': godkänd,
-                'total_poäng': total_poäng,
-                'säkerhets_resultat': säkerhets_resultat,
-                'empati_resultat': empati_resultat,
-                'roll_resultat': roll_resultat,
-                'rekommendationer': self._generera_rekommendationer(text, total_poäng),
-                'modererad_text': self._förbättra_text(text) if not godkänd else text,
+            # Alla regler söks i ett pass och delas av kontrollerna nedan
+            t = time.perf_counter_ns() if self.mätsink is not None else 0
+            träffar = self.regler.sök(text)
+            t = self._steg('regelsökning', t)
+            resultat = self._bedöm(text, användare_roll, träffar)
+            t = time.perf_counter_ns() if self.mätsink is not None else 0
+            spann = resultat['säkerhets_resultat']['personuppgifts_spann']
+            maskerad_text = self.maskerare.maskera(text, spann)
+            t = self._steg('maskering', t)
+            modererad_text = self._förbättra_text(text, träffar, spann) if not resultat['godkänd'] else text
+            self._steg('förbättring', t)
+            resultat.update({
+                'maskerad_text': maskerad_text,
+                'modererad_text': modererad_text,
                 'modererings_datum': datetime.now().isoformat()
-            }
+            })
+            return resultat, träffar
             
         except Exception as e:
             logger.error(f"Fel vid moderering: {e}")
@@ -72,34 +173,52 @@ class EmpatiModerering:
                 'godkänd': False,
                 'total_poäng': 0.0,
                 'fel': str(e)
-            }
+            }, None
     
-    def _kontrollera_säkerhet(self, text: str) -> Dict[str, Any]:
+    def _bedöm(self, text: str, användare_roll: str, träffar: Träffar,
+               längd: Optional[int] = None) -> Dict[str, Any]:
+        """Poäng, delresultat och rekommendationer ur regelträffarna"""
+        # Grundläggande säkerhetskontroll
+        t = time.perf_counter_ns() if self.mätsink is not None else 0
+        säkerhets_resultat = self._kontrollera_säkerhet(text, träffar)
+        t = self._steg('säkerhet', t)
+        
+        # Empatisk analys
+        empati_resultat = self._analysera_empati(text, träffar)
+        t = self._steg('empati', t)
+        
+        # Rollspecifik moderering
+        roll_resultat = self._moderera_för_roll(text, användare_roll, träffar)
+        t = self._steg('roll', t)
+        
+        # Kombinera resultat
+        total_poäng = (
+            säkerhets_resultat['poäng'] * 0.4 +
+            empati_resultat['poäng'] * 0.4 +
+            roll_resultat['poäng'] * 0.2
+        )
+        
+        rekommendationer = self._generera_rekommendationer(text, total_poäng, träffar, längd)
+        self._steg('rekommendationer', t)
+        
+        return {
+            'godkänd': total_poäng >= 0.7 and säkerhets_resultat['säker'],
+            'total_poäng': total_poäng,
+            'säkerhets_resultat': säkerhets_resultat,
+            'empati_resultat': empati_resultat,
+            'roll_resultat': roll_resultat,
+            'rekommendationer': rekommendationer
+        }
+    
+    def _kontrollera_säkerhet(self, text: str, träffar: Optional[Träffar] = None) -> Dict[str, Any]:
         """Kontrollerar säkerhet och innehåll som kan vara skadligt"""
-        text_lower = text.lower()
-        
-        # Kontrollera negativa nyckelord
-        negativa_träffar = [ord for ord in self.negativa_nyckelord if ord in text_lower]
-        
-        # Kontrollera personuppgifter
-        personuppgifter = []
-        for mönster in self.personuppgifts_mönster:
-            träffar = re.findall(mönster, text)
-            personuppgifter.extend(träffar)
-        
-        # Kontrollera potentiella hot eller kränkningar
-        hot_mönster = [
-            r'jag ska.*döda',
-            r'jag kommer.*skada',
-            r'jag vill.*döda',
-            r'hotar.*att',
-            r'kommer.*att.*skada'
-        ]
+        träffar = träffar if träffar is not None else self.regler.sök(text)
         
-        hot_träffar = []
-        for mönster in hot_mönster:
-            if re.search(mönster, text_lower):
-                hot_träffar.append(mönster)
+        # Negativa nyckelord, personuppgifter och potentiella hot eller kränkningar
+        negativa_träffar = träffar.termer('negativ')
+        personuppgifter = träffar.texter('personuppgift')
+        personuppgifts_spann = self.maskerare.spann_från_träffar(träffar)
+        hot_träffar = träffar.termer('hot')
         
         säker = (len(negativa_träffar) == 0 and 
                 len(personuppgifter) == 0 and 
@@ -110,22 +229,20 @@ class EmpatiModerering:
             'poäng': 1.0 if säker else 0.0,
             'negativa_träffar': negativa_träffar,
             'personuppgifter': personuppgifter,
+            'personuppgifts_spann': personuppgifts_spann,
             'hot_träffar': hot_träffar
         }
     
-    def _analysera_empati(self, text: str) -> Dict[str, Any]:
+    def _analysera_empati(self, text: str, träffar: Optional[Träffar] = None) -> Dict[str, Any]:
         """Analyserar empati och respekt i texten"""
-        text_lower = text.lower()
+        träffar = träffar if träffar is not None else self.regler.sök(text)
         
-        # Räkna empatiska nyckelord
-        empatiska_träffar = [ord for ord in self.empatiska_nyckelord if ord in text_lower]
+        # Empatiska nyckelord
+        empatiska_träffar = träffar.termer('empatisk')
         
         # Enkel sentimentanalys baserat på nyckelord
-        positiva_ord = ['bra', 'fantastisk', 'utmärkt', 'perfekt', 'rekommenderar', 'tack']
-        negativa_ord = ['dålig', 'fruktansvärd', 'undvik', 'problem', 'fel', 'hatar']
-        
-        positiva_träffar = sum(1 for ord in positiva_ord if ord in text_lower)
-        negativa_träffar = sum(1 for ord in negativa_ord if ord in text_lower)
+        positiva_träffar = len(träffar.termer('positiv'))
+        negativa_träffar = len(träffar.termer('negativ_sentiment'))
         
         sentiment_poäng = 0.5
         if positiva_träffar > negativa_träffar:
@@ -144,30 +261,19 @@ class EmpatiModerering:
             'negativa_träffar': negativa_träffar
         }
     
-    def _moderera_för_roll(self, text: str, roll: str) -> Dict[str, Any]:
+    def _moderera_för_roll(self, text: str, roll: str, träffar: Optional[Träffar] = None) -> Dict[str, Any]:
         """Rollspecifik moderering"""
-        text_lower = text.lower()
+        träffar = träffar if träffar is not None else self.regler.sök(text)
+        roll_träffar = träffar.termer(f'roll:{roll}')
         
         if roll == 'familj':
-            # Familjer bör undvika specifika medicinska termer utan kontext
-            medicinska_termer = ['diagnos', 'behandling', 'terapi', 'medicin']
-            medicinska_träffar = [term for term in medicinska_termer if term in text_lower]
-            
-            poäng = 1.0 if len(medicinska_träffar) == 0 else 0.7
+            poäng = 1.0 if len(roll_träffar) == 0 else 0.7
             
         elif roll == 'assistent':
-            # Assistenter bör använda professionellt språk
-            professionella_termer = ['brukare', 'omsorg', 'stöd', 'assistans', 'professionell']
-            professionella_träffar = [term for term in professionella_termer if term in text_lower]
-            
-            poäng = min(1.0, len(professionella_träffar) / 3 + 0.5)
+            poäng = min(1.0, len(roll_träffar) / 3 + 0.5)
             
         elif roll == 'kommun':
-            # Kommuner bör använda formellt språk
-            formella_termer = ['verksamhet', 'tjänst', 'insats', 'samhällsansvar']
-            formella_träffar = [term for term in formella_termer if term in text_lower]
-            
-            poäng = min(1.0, len(formella_träffar) / 3 + 0.6)
+            poäng = min(1.0, len(roll_träffar) / 3 + 0.6)
             
         else:
             poäng = 0.8  # Standard för andra roller
@@ -177,7 +283,8 @@ class EmpatiModerering:
             'roll': roll
         }
     
-    def _generera_rekommendationer(self, text: str, poäng: float) -> List[str]:
+    def _generera_rekommendationer(self, text: str, poäng: float, träffar: Optional[Träffar] = None,
+                                   längd: Optional[int] = None) -> List[str]:
         """Genererar förbättringsrekommendationer"""
         rekommendationer = []
         
@@ -192,52 +299,70 @@ class EmpatiModerering:
             rekommendationer.append("Tänk på hur ditt meddelande kan påverka andra")
         
         # Specifika rekommendationer baserat på innehåll
-        text_lower = text.lower()
-        if 'problem' in text_lower and 'lösning' not in text_lower:
+        träffar = träffar if träffar is not None else self.regler.sök(text)
+        if 'problem' in träffar.termer('negativ_sentiment') and not träffar.har('lösning'):
             rekommendationer.append("Överväg att föreslå konkreta lösningar på problem du identifierar")
         
-        if len(text) < 10:
+        if (len(text) if längd is None else längd) < 10:
             rekommendationer.append("Utveckla ditt meddelande för att ge mer värde till andra")
         
         return rekommendationer
     
-    def _förbättra_text(self, text: str) -> str:
-        """Förbättrar text med empatiska förslag"""
-        # Enkel implementation - i verkligheten skulle detta vara mer sofistikerat
-        förbättringar = {
-            'inte bra': 'kan förbättras',
-            'dålig': 'utvecklingspotential',
-            'problem': 'utmaning',
-            'fel': 'förbättringsområde',
-            'hatar': 'tycker inte om',
-            'idiot': 'person',
-            'dum': 'ovan',
-            'korkad': 'ovan'
-        }
-        
-        förbättrad_text = text
-        for gammalt, nytt in förbättringar.items():
-            förbättrad_text = förbättrad_text.replace(gammalt, nytt)
-        
-        return förbättrad_text
+    def _förbättra_text(self, text: str, träffar: Optional[Träffar] = None,
+                        spann: Optional[List[Spann]] = None) -> str:
+        """Förbättrar text med empatiska förslag och maskerar personuppgifter, allt i en join"""
+        träffar = träffar if träffar is not None else self.regler.sök(text)
+        spann = spann if spann is not None else self.maskerare.spann_från_träffar(träffar)
+        förbättringar = self.regler.ändringar(text, 'förbättring', self.förbättringar, träffar)
+        return foga_in(text, heapq.merge(self.maskerare.ändringar(spann), förbättringar))
     
     def moderera_recension(self, recension: Dict[str, Any]) -> Dict[str, Any]:
         """Specialiserad moderering för recensioner"""
         text = recension.get('innehåll', '')
         användare_roll = recension.get('användare_roll', 'användare')
         
+        # Oförändrade recensioner (t.ex. vid redigering eller i adminflöden) hämtas ur cachen
+        nyckel = self.cache.nyckel(self.regelversion, 'recension', text, användare_roll,
+                                   recension.get('rubrik', ''), 'betyg' in recension, recension.get('betyg'))
+        sparat = self.cache.hämta(nyckel)
+        if sparat is not None:
+            return self._från_cache(text, sparat)
+        
         # Grundmoderering
-        modererings_resultat = self.moderera_text(text, användare_roll)
+        modererings_resultat, träffar = self._moderera(text, användare_roll)
         
         # Specifika kontroller för recensioner
-        recension_specifika_kontroller = self._kontrollera_recension_specifikt(recension)
+        recension_specifika_kontroller = self._kontrollera_recension_specifikt(recension, träffar)
         
         # Kombinera resultat
         modererings_resultat.update(recension_specifika_kontroller)
+        self.cache.spara(nyckel, modererings_resultat)
         
         return modererings_resultat
     
-    def _kontrollera_recension_specifikt(self, recension: Dict[str, Any]) -> Dict[str, Any]:
+    def cache_statistik(self) -> Dict[str, Any]:
+        """Träffar och missar i resultatcachen samt aktuell regelversion"""
+        return {**self.cache.statistik(), 'regelversion': self.regelversion}
+    
+    def moderera_ström(self, text: Union[str, Iterable[str]], användare_roll: str = 'användare',
+                       bitstorlek: int = 8192, överlapp: int = 256,
+                       avbryt_vid_blockering: bool = True) -> StrömModerering:
+        """
+        Strömmande moderering av långa texter i överlappande bitar. Iterera för
+        delresultat per bit och hämta den samlade bedömningen med resultat()
+        """
+        return StrömModerering(self, text, användare_roll, bitstorlek, överlapp, avbryt_vid_blockering)
+    
+    def moderera_batch(self, poster: Iterable[Post], användare_roll: str = 'användare',
+                       bitstorlek: int = 256, processer: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Modererar en ström av texter eller recensioner i en processpool och lämnar
+        resultaten i samma ordning som posterna. Se batchmoderering.moderera_batch
+        """
+        return moderera_batch(self, poster, användare_roll, bitstorlek, processer)
+    
+    def _kontrollera_recension_specifikt(self, recension: Dict[str, Any],
+                                         träffar: Optional[Träffar] = None) -> Dict[str, Any]:
         """Specifika kontroller för recensioner"""
         kontroller = {
             'har_betyg': 'betyg' in recension and recension['betyg'] is not None,
@@ -252,12 +377,12 @@ class EmpatiModerering:
             kontroller['betyg_rimligt'] = 1 <= betyg <= 5
         
         # Kontrollera om innehållet matchar betyget
-        text = recension.get('innehåll', '').lower()
+        träffar = träffar if träffar is not None else self.regler.sök(recension.get('innehåll', ''))
         betyg = recension.get('betyg', 0)
         
-        if betyg >= 4 and any(ord in text for ord in ['dålig', 'fruktansvärd', 'hatar', 'undvik']):
+        if betyg >= 4 and träffar.har('recension_negativ'):
             kontroller['betyg_matchar_innehåll'] = False
-        elif betyg <= 2 and any(ord in text for ord in ['fantastisk', 'perfekt', 'rekommenderar', 'utmärkt']):
+        elif betyg <= 2 and träffar.har('recension_positiv'):
             kontroller['betyg_matchar_innehåll'] = False
         else:
             kontroller['betyg_matchar_innehåll'] = True
@@ -0,0 +1,79 @@
+# Bulkmoderering i en processpool
+# Strömmar poster i bitar genom arbetsprocesser och lämnar resultaten i ursprunglig ordning
+
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# En text modereras med standardrollen, en dict som recension eller med sin användare_roll
+Post = Union[str, Dict[str, Any]]
+
+# Modereringsinstans och standardroll i varje arbetsprocess, sätts av _starta_arbetare
+_moderering = None
+_roll = 'användare'
+
+
+def moderera_post(moderering: Any, post: Post, roll: str = 'användare') -> Dict[str, Any]:
+    """Modererar en post: recensioner (med betyg eller rubrik) som recension om instansen stöder det, annars som text"""
+    if isinstance(post, str):
+        return moderering.moderera_text(post, roll)
+    if ('betyg' in post or 'rubrik' in post) and hasattr(moderering, 'moderera_recension'):
+        return moderering.moderera_recension(post)
+    return moderering.moderera_text(post.get('innehåll', ''), post.get('användare_roll', roll))
+
+
+def _starta_arbetare(moderering: Any, roll: str):
+    global _moderering, _roll
+    _moderering, _roll = moderering, roll
+
+
+def _moderera_bit(bit: List[Post]) -> List[Dict[str, Any]]:
+    """Körs i arbetsprocess med instansen som skickades vid start"""
+    return [moderera_post(_moderering, post, _roll) for post in bit]
+
+
+def _bitar(poster: Iterable[Post], bitstorlek: int) -> Iterator[List[Post]]:
+    poster = iter(poster)
+    while True:
+        bit = list(islice(poster, bitstorlek))
+        if not bit:
+            return
+        yield bit
+
+
+def moderera_batch(moderering: Any, poster: Iterable[Post], roll: str = 'användare',
+                   bitstorlek: int = 256, processer: Optional[int] = None,
+                   max_bitar_i_luften: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Modererar poster i bitar om `bitstorlek` och lämnar ett resultat per post i
+    samma ordning. Med fler än en process skickas instansen en gång till varje
+    arbetsprocess och högst `max_bitar_i_luften` (standard 2 per process) bitar
+    är under arbete samtidigt, så minnet är konstant även för oändliga strömmar
+    """
+    processer = processer or os.cpu_count() or 1
+    if processer < 2:
+        for bit in _bitar(poster, bitstorlek):
+            for post in bit:
+                yield moderera_post(moderering, post, roll)
+        return
+
+    max_i_luften = max_bitar_i_luften or 2 * processer
+    with ProcessPoolExecutor(max_workers=processer, initializer=_starta_arbetare,
+                             initargs=(moderering, roll)) as pool:
+        väntande = deque()
+        try:
+            for bit in _bitar(poster, bitstorlek):
+                väntande.append(pool.submit(_moderera_bit, bit))
+                if len(väntande) >= max_i_luften:
+                    yield from väntande.popleft().result()
+            while väntande:
+                yield from väntande.popleft().result()
+        finally:
+            # Avbruten läsning: släpp bitar som inte hunnit starta
+            for framtid in väntande:
+                framtid.cancel()
@@ -0,0 +1,99 @@
+# Cachebyggstenar för AI-moduler
+# LRU-cache i minnet och beständigt nyckel-värde-lager i SQLite
+
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+class LRUCache:
+    """Trådsäker LRU-cache med begränsat antal poster och träffräknare"""
+
+    def __init__(self, max_storlek: int = 10_000):
+        self.max_storlek = max_storlek
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lås = threading.Lock()
+        self.träffar = 0
+        self.missar = 0
+
+    def hämta(self, nyckel: str) -> Optional[Any]:
+        with self._lås:
+            if nyckel in self._data:
+                self._data.move_to_end(nyckel)
+                self.träffar += 1
+                return self._data[nyckel]
+            self.missar += 1
+            return None
+
+    def spara(self, nyckel: str, värde: Any):
+        with self._lås:
+            self._data[nyckel] = värde
+            self._data.move_to_end(nyckel)
+            while len(self._data) > self.max_storlek:
+                self._data.popitem(last=False)
+
+    def ta_bort(self, nyckel: str):
+        with self._lås:
+            self._data.pop(nyckel, None)
+
+    def töm(self):
+        with self._lås:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SqliteLager:
+    """Beständigt nyckel-värde-lager i en lokal SQLite-fil, värden lagras som JSON"""
+
+    def __init__(self, sökväg: str, tabell: str = "cache"):
+        self.sökväg = sökväg
+        self.tabell = tabell
+        self._lås = threading.Lock()
+        self._anslutning = sqlite3.connect(sökväg, check_same_thread=False)
+        with self._lås:
+            self._anslutning.execute("PRAGMA journal_mode=WAL")
+            self._anslutning.execute(
+                f"CREATE TABLE IF NOT EXISTS {tabell} (nyckel TEXT PRIMARY KEY, värde TEXT NOT NULL)"
+            )
+            self._anslutning.commit()
+
+    def hämta_många(self, nycklar: Iterable[str]) -> Dict[str, Any]:
+        """Hämtar alla nycklar som finns lagrade"""
+        nycklar = list(nycklar)
+        funna: Dict[str, Any] = {}
+        with self._lås:
+            # SQLite begränsar antalet parametrar per fråga
+            for start in range(0, len(nycklar), 500):
+                del_nycklar = nycklar[start:start + 500]
+                platshållare = ",".join("?" * len(del_nycklar))
+                rader = self._anslutning.execute(
+                    f"SELECT nyckel, värde FROM {self.tabell} WHERE nyckel IN ({platshållare})",
+                    del_nycklar
+                )
+                for nyckel, värde in rader:
+                    funna[nyckel] = json.loads(värde)
+        return funna
+
+    def spara_många(self, poster: Iterable[Tuple[str, Any]]):
+        """Sparar eller ersätter poster i en transaktion"""
+        rader = [(nyckel, json.dumps(värde, ensure_ascii=False)) for nyckel, värde in poster]
+        if not rader:
+            return
+        with self._lås:
+            self._anslutning.executemany(
+                f"INSERT OR REPLACE INTO {self.tabell} (nyckel, värde) VALUES (?, ?)", rader
+            )
+            self._anslutning.commit()
+
+    def töm(self):
+        with self._lås:
+            self._anslutning.execute(f"DELETE FROM {self.tabell}")
+            self._anslutning.commit()
+
+    def stäng(self):
+        with self._lås:
+            self._anslutning.close()
@@ -0,0 +1,49 @@
+# Strömmande läsning och batchvis skrivning mot databasen
+# Serverside-markörer och fetchmany håller minnet konstant oavsett antal rader
+
+import itertools
+from itertools import islice
+from typing import Any, Iterable, Iterator, Optional, Sequence
+
+_markörnummer = itertools.count()
+
+
+def läs_strömmande(anslutning, fråga: str, parametrar: Optional[Sequence[Any]] = None,
+                   batch_storlek: int = 1000) -> Iterator[tuple]:
+    """
+    Rader från `fråga` en i taget, hämtade `batch_storlek` åt gången. Med psycopg2
+    används en namngiven serverside-markör (WITH HOLD, så att skrivningar på samma
+    anslutning kan committas under läsningen); övriga DB-API-drivrutiner, t.ex.
+    sqlite3, läser med fetchmany på en vanlig markör
+    """
+    try:
+        markör = anslutning.cursor(name=f"neurohus_strom_{next(_markörnummer)}", withhold=True)
+        markör.itersize = batch_storlek
+    except TypeError:
+        markör = anslutning.cursor()
+    try:
+        markör.execute(fråga, tuple(parametrar or ()))
+        while True:
+            rader = markör.fetchmany(batch_storlek)
+            if not rader:
+                break
+            yield from rader
+    finally:
+        markör.close()
+
+
+def skriv_batchvis(anslutning, sats: str, rader: Iterable[Sequence[Any]], batch_storlek: int = 1000) -> int:
+    """Kör `sats` med executemany för `batch_storlek` rader i taget och committar varje batch"""
+    antal = 0
+    rader = iter(rader)
+    while True:
+        batch = list(islice(rader, batch_storlek))
+        if not batch:
+            return antal
+        markör = anslutning.cursor()
+        try:
+            markör.executemany(sats, batch)
+        finally:
+            markör.close()
+        anslutning.commit()
+        antal += len(batch)
@@ -0,0 +1,173 @@
+# Förberäknade empatipoäng per verksamhet
+# Varje recension poängsätts en gång när den skrivs och summeras löpande per verksamhet
+
+import argparse
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .sentiment import SentimentCache, poängsätt_texter
+
+logger = logging.getLogger(__name__)
+
+EMPATI_NYCKELORD = [
+    'empati', 'förståelse', 'trygg', 'respekt', 'varm', 'omsorg',
+    'professionell', 'kompetent', 'stödjande', 'inkluderande',
+    'individuell', 'personcentrerad', 'värdig', 'värdighet'
+]
+
+# Poäng för verksamheter utan recensioner och för texter som inte kunde poängsättas
+NEUTRAL_POÄNG = 0.5
+
+
+def empati_för_text(text: str, sentiment: Optional[float]) -> float:
+    """Andel empatiord (60 %) och sentiment (40 %) för en recension, texten i gemener"""
+    träffar = sum(1 for ord in EMPATI_NYCKELORD if ord in text)
+    sentiment = NEUTRAL_POÄNG if sentiment is None else sentiment
+    return träffar / len(EMPATI_NYCKELORD) * 0.6 + sentiment * 0.4
+
+
+def poängsätt_recensioner(recensioner: List[Dict[str, Any]],
+                          cache: Optional[SentimentCache] = None,
+                          batch_storlek: int = 32) -> List[float]:
+    """Empatipoäng per recension med sentiment för alla texter i en batch"""
+    texter = [(recension.get('innehåll') or '').lower() for recension in recensioner]
+    if not texter:
+        return []
+    resultat = poängsätt_texter(texter, batch_storlek=batch_storlek,
+                                cache=cache or SentimentCache.delad())
+    return [empati_för_text(text, sentiment) for text, sentiment in zip(texter, resultat.poäng)]
+
+
+class EmpatiLager:
+    """
+    Löpande summa och antal empatipoäng per verksamhet.
+    Motsvarar tabellen verksamhet_empati, som hålls aktuell av en trigger på recensioner
+    """
+
+    def __init__(self, cache: Optional[SentimentCache] = None, batch_storlek: int = 32):
+        self.cache = cache
+        self.batch_storlek = batch_storlek
+        self._summor: Dict[str, Tuple[int, float]] = {}
+        self._lås = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._summor)
+
+    def __contains__(self, verksamhet_id: str) -> bool:
+        return verksamhet_id in self._summor
+
+    def hämta(self, verksamhet_id: str) -> Optional[float]:
+        """Genomsnittlig empatipoäng i O(1), None om verksamheten inte lästs in"""
+        summa = self._summor.get(verksamhet_id)
+        if summa is None:
+            return None
+        antal, total = summa
+        return total / antal if antal else NEUTRAL_POÄNG
+
+    def _lägg_till(self, verksamhet_id: str, antal: int, total: float):
+        with self._lås:
+            gammalt_antal, gammal_total = self._summor.get(verksamhet_id, (0, 0.0))
+            self._summor[verksamhet_id] = (gammalt_antal + antal, gammal_total + total)
+
+    def registrera_recension(self, verksamhet_id: str, recension: Dict[str, Any]) -> float:
+        """
+        Poängsätter en ny recension vid skrivning och uppdaterar verksamhetens summa.
+        Poängen sparas i recensionen som 'empati_poäng' så att den kan lagras med raden
+        """
+        poäng = recension.get('empati_poäng')
+        if poäng is None:
+            poäng = poängsätt_recensioner([recension], cache=self.cache, batch_storlek=1)[0]
+            recension['empati_poäng'] = poäng
+        self._lägg_till(verksamhet_id, 1, poäng)
+        return poäng
+
+    def ta_bort_recension(self, verksamhet_id: str, recension: Dict[str, Any]):
+        """Drar bort en borttagen recensions poäng från verksamhetens summa"""
+        poäng = recension.get('empati_poäng')
+        if poäng is None:
+            return
+        self._lägg_till(verksamhet_id, -1, -poäng)
+
+    def uppdatera_recension(self, verksamhet_id: str, gammal: Dict[str, Any], ny: Dict[str, Any]) -> float:
+        """Ersätter en redigerad recensions poäng"""
+        self.ta_bort_recension(verksamhet_id, gammal)
+        ny.pop('empati_poäng', None)
+        return self.registrera_recension(verksamhet_id, ny)
+
+    def backfill(self, verksamheter: Iterable[Any], skriv_över: bool = False) -> int:
+        """
+        Läser in befintliga recensioner för verksamheter som saknas i lagret.
+        Alla recensioner utan sparad poäng poängsätts i gemensamma batchar.
+        Returnerar antal recensioner som poängsattes
+        """
+        att_läsa = [v for v in verksamheter if skriv_över or v.verksamhet_id not in self._summor]
+        saknar = [r for v in att_läsa for r in (v.recensioner or []) if r.get('empati_poäng') is None]
+        for recension, poäng in zip(saknar, poängsätt_recensioner(saknar, cache=self.cache,
+                                                                  batch_storlek=self.batch_storlek)):
+            recension['empati_poäng'] = poäng
+
+        with self._lås:
+            for verksamhet in att_läsa:
+                recensioner = verksamhet.recensioner or []
+                self._summor[verksamhet.verksamhet_id] = (
+                    len(recensioner), sum(r['empati_poäng'] for r in recensioner))
+        return len(saknar)
+
+    def ladda_summor(self, rader: Iterable[Tuple[str, int, float]]):
+        """Läser in (verksamhet_id, antal_recensioner, empati_summa) från verksamhet_empati"""
+        with self._lås:
+            for verksamhet_id, antal, summa in rader:
+                self._summor[str(verksamhet_id)] = (int(antal), float(summa))
+
+
+def backfill_databas(anslutning, batch_storlek: int = 1000, platshållare: str = "%s",
+                     cache: Optional[SentimentCache] = None) -> int:
+    """
+    Poängsätter recensioner i databasen som saknar empati_poäng, batch för batch
+    i id-ordning så att jobbet kan avbrytas och startas om. Summorna i
+    verksamhet_empati uppdateras av triggern. Returnerar antal uppdaterade rader
+    """
+    uppdaterade = 0
+    senaste_id = None
+    while True:
+        markör = anslutning.cursor()
+        if senaste_id is None:
+            markör.execute(
+                "SELECT id, innehåll FROM recensioner WHERE empati_poäng IS NULL "
+                f"ORDER BY id LIMIT {int(batch_storlek)}")
+        else:
+            markör.execute(
+                "SELECT id, innehåll FROM recensioner WHERE empati_poäng IS NULL "
+                f"AND id > {platshållare} ORDER BY id LIMIT {int(batch_storlek)}", (senaste_id,))
+        rader = markör.fetchall()
+        if not rader:
+            markör.close()
+            break
+
+        poäng = poängsätt_recensioner([{'innehåll': innehåll} for _, innehåll in rader], cache=cache)
+        markör.executemany(
+            f"UPDATE recensioner SET empati_poäng = {platshållare} WHERE id = {platshållare}",
+            [(p, rad_id) for (rad_id, _), p in zip(rader, poäng)])
+        anslutning.commit()
+        markör.close()
+
+        uppdaterade += len(rader)
+        senaste_id = rader[-1][0]
+        logger.info(f"Empati-backfill: {uppdaterade} recensioner poängsatta")
+    return uppdaterade
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poängsätter befintliga recensioner som saknar empati_poäng")
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="PostgreSQL-DSN, standard $DATABASE_URL")
+    parser.add_argument("--batch-storlek", type=int, default=1000)
+    args = parser.parse_args()
+
+    import psycopg2
+
+    logging.basicConfig(level=logging.INFO)
+    with psycopg2.connect(args.dsn) as anslutning:
+        antal = backfill_databas(anslutning, batch_storlek=args.batch_storlek)
+    logger.info(f"Klart: {antal} recensioner poängsatta")
@@ -0,0 +1,130 @@
+# Inverterat index för förfiltrering av rekommendationskandidater
+# Diagnos, åldersgrupp och typ pekar på sorterade radnummer som snittas innan poängsättning
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from scipy import sparse
+
+
+@dataclass
+class Urval:
+    """Hårda krav som en verksamhet måste uppfylla för att poängsättas alls"""
+    typer: Optional[Sequence[str]] = None   # tillåtna verksamhetstyper
+    kräv_diagnos: bool = False              # minst en gemensam diagnos med användaren
+    kräv_åldersgrupp: bool = False          # samma åldersgrupp som användaren
+    max_avstånd_km: Optional[float] = None  # reseavstånd, kräver koordinater
+
+    @property
+    def tomt(self) -> bool:
+        return not (self.typer or self.kräv_diagnos or self.kräv_åldersgrupp or self.max_avstånd_km is not None)
+
+
+def _rader_per_kod(koder: np.ndarray, antal_koder: int) -> List[np.ndarray]:
+    """Sorterade radnummer per kod via en stabil sortering"""
+    ordning = np.argsort(koder, kind="stable")
+    gränser = np.searchsorted(koder[ordning], np.arange(antal_koder + 1))
+    return [ordning[gränser[kod]:gränser[kod + 1]] for kod in range(antal_koder)]
+
+
+def _rader_per_kolumn(matris: sparse.csr_matrix) -> List[np.ndarray]:
+    """Sorterade radnummer per kolumn i en multi-hot-matris"""
+    kolumnvis = matris.tocsc()
+    kolumnvis.sort_indices()
+    return [kolumnvis.indices[kolumnvis.indptr[k]:kolumnvis.indptr[k + 1]].astype(np.int64)
+            for k in range(matris.shape[1])]
+
+
+def _union(listor: List[np.ndarray], antal_rader: int) -> np.ndarray:
+    """Union av sorterade listor via en boolesk mask, utan sortering"""
+    if not listor:
+        return np.empty(0, dtype=np.int64)
+    if len(listor) == 1:
+        return listor[0]
+    mask = np.zeros(antal_rader, dtype=bool)
+    for lista in listor:
+        mask[lista] = True
+    return np.flatnonzero(mask)
+
+
+def _snitt(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Element i den sorterade listan `a` som också finns i den sorterade listan `b`"""
+    if len(a) == 0 or len(b) == 0:
+        return a[:0]
+    position = np.searchsorted(b, a)
+    return a[b[np.minimum(position, len(b) - 1)] == a]
+
+
+class FörfilterIndex:
+    """
+    Postlistor per diagnos, åldersgrupp och typ över en KandidatMatris.
+    Kraven snittas med minsta listan först och beskärningsgraden räknas löpande
+    """
+
+    def __init__(self, kandidater: Any):
+        self.kandidater = kandidater
+        self.diagnos_rader = _rader_per_kolumn(kandidater.diagnos_matris)
+        self.ålder_rader = _rader_per_kod(kandidater.ålder_koder, len(kandidater.åldersgrupper.värden))
+        self.typ_rader = _rader_per_kod(kandidater.typ_koder, len(kandidater.typer.värden))
+        self._lås = threading.Lock()
+        self.antal_sökningar = 0
+        self.antal_före = 0
+        self.antal_efter = 0
+
+    def _lista(self, listor: List[np.ndarray], kodning: Any, värden: Sequence[Any]) -> np.ndarray:
+        return _union([listor[kodning.koder[v]] for v in set(värden) if v in kodning.koder],
+                      len(self.kandidater))
+
+    def rader(self, användar_profil: Any, urval: Urval,
+              rader: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """Rader som uppfyller alla krav i stigande ordning, None om inga krav ställs"""
+        listor = []
+        if urval.typer:
+            listor.append(self._lista(self.typ_rader, self.kandidater.typer, urval.typer))
+        if urval.kräv_diagnos:
+            listor.append(self._lista(self.diagnos_rader, self.kandidater.diagnoser,
+                                      användar_profil.diagnoser or ()))
+        if urval.kräv_åldersgrupp:
+            listor.append(self._lista(self.ålder_rader, self.kandidater.åldersgrupper,
+                                      [användar_profil.åldersgrupp]))
+        if urval.max_avstånd_km is not None:
+            inom = self.kandidater.inom_avstånd(användar_profil, urval.max_avstånd_km)
+            if inom is not None:
+                listor.append(inom)
+        if rader is not None:
+            listor.append(rader)
+        if not listor:
+            return None
+
+        listor.sort(key=len)
+        resultat = listor[0]
+        for lista in listor[1:]:
+            if len(resultat) == 0:
+                break
+            resultat = _snitt(resultat, lista)
+
+        with self._lås:
+            self.antal_sökningar += 1
+            self.antal_före += len(self.kandidater) if rader is None else len(rader)
+            self.antal_efter += len(resultat)
+        return resultat
+
+    def nollställ_statistik(self):
+        """Nollställer räknarna för sökningar och kandidater"""
+        with self._lås:
+            self.antal_sökningar = 0
+            self.antal_före = 0
+            self.antal_efter = 0
+
+    def statistik(self) -> Dict[str, Any]:
+        """Antal sökningar, poängsatta kandidater i snitt och andel bortfiltrerade"""
+        with self._lås:
+            return {
+                'antal_sökningar': self.antal_sökningar,
+                'kandidater_före': self.antal_före,
+                'kandidater_efter': self.antal_efter,
+                'snitt_poängsatta': self.antal_efter / self.antal_sökningar if self.antal_sökningar else 0.0,
+                'beskärningsgrad': 1 - self.antal_efter / self.antal_före if self.antal_före else 0.0
+            }
@@ -0,0 +1,95 @@
+# Gruppvis trendanalys i ett svep
+# Delar upp poster per kommun (och kategori) och beräknar TF-IDF en gång för hela datamängden
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+
+# Under detta antal texter är en processpool dyrare än den sparar
+PARALLELL_GRÄNS = 20_000
+
+
+def gruppera(koder: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Grupperar rader på kod med en stabil sortering.
+    Returnerar (unika koder, radordning, gränser) där rader för grupp i är
+    ordning[gränser[i]:gränser[i + 1]] i stigande radordning
+    """
+    ordning = np.argsort(koder, kind="stable")
+    sorterade = koder[ordning]
+    unika, starter = np.unique(sorterade, return_index=True)
+    gränser = np.append(starter, len(koder))
+    return unika, ordning, gränser
+
+
+def gruppmedel(matris, grupp: np.ndarray, antal_grupper: int) -> np.ndarray:
+    """Kolumnmedelvärde per grupp via en gles indikatormatris, grupper x kolumner"""
+    antal_per_grupp = np.bincount(grupp, minlength=antal_grupper).astype(np.float64)
+    vikter = 1.0 / np.maximum(antal_per_grupp, 1)[grupp]
+    indikator = sparse.csr_matrix((vikter, (grupp, np.arange(len(grupp)))),
+                                  shape=(antal_grupper, len(grupp)))
+    return np.asarray((indikator @ matris).todense())
+
+
+def toppkolumner(poäng: np.ndarray, antal: int = 10) -> np.ndarray:
+    """Index för de `antal` högsta kolumnerna per rad, högst först"""
+    antal = min(antal, poäng.shape[1])
+    if antal == 0:
+        return np.empty((poäng.shape[0], 0), dtype=np.int64)
+    topp = np.argpartition(-poäng, antal - 1, axis=1)[:, :antal]
+    ordning = np.argsort(-np.take_along_axis(poäng, topp, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(topp, ordning, axis=1)
+
+
+def _räkna_termer(argument) -> Tuple[List[str], sparse.csr_matrix]:
+    """Körs i arbetsprocess: termräkning för en bit av texterna med egen vokabulär"""
+    texter, ngram_range = argument
+    räknare = CountVectorizer(ngram_range=ngram_range)
+    try:
+        matris = räknare.fit_transform(texter)
+    except ValueError:
+        # Bara stoppord eller tomma texter i biten
+        return [], sparse.csr_matrix((len(texter), 0), dtype=np.int64)
+    return list(räknare.get_feature_names_out()), matris.tocsr()
+
+
+def tfidf(texter: List[str], ngram_range: Tuple[int, int] = (1, 2),
+          max_features: Optional[int] = 500,
+          processer: Optional[int] = None) -> Tuple[sparse.csr_matrix, np.ndarray]:
+    """
+    TF-IDF-matris och termnamn, samma resultat som TfidfVectorizer.fit_transform.
+    Med `processer` och tillräckligt många texter sker termräkningen i bitar i en
+    processpool och bitarnas vokabulärer slås ihop innan max_features och idf tillämpas
+    """
+    if not processer or processer < 2 or len(texter) < PARALLELL_GRÄNS:
+        delar = [_räkna_termer((texter, ngram_range))]
+    else:
+        bitstorlek = -(-len(texter) // processer)
+        bitar = [(texter[i:i + bitstorlek], ngram_range) for i in range(0, len(texter), bitstorlek)]
+        with ProcessPoolExecutor(max_workers=processer) as pool:
+            delar = list(pool.map(_räkna_termer, bitar))
+
+    # Gemensam alfabetisk vokabulär, varje bits kolumner mappas om till den
+    alla_termer = np.unique(np.concatenate([np.asarray(termer, dtype=object) for termer, _ in delar]
+                                           + [np.empty(0, dtype=object)]))
+    if len(alla_termer) == 0:
+        raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+    omappade = []
+    for termer, matris in delar:
+        kolumner = np.searchsorted(alla_termer, np.asarray(termer, dtype=object)) if termer else np.empty(0, dtype=np.int64)
+        matris = matris.tocoo()
+        omappade.append(sparse.csr_matrix((matris.data, (matris.row, kolumner[matris.col])),
+                                          shape=(matris.shape[0], len(alla_termer))))
+    räkningar = sparse.vstack(omappade).tocsr()
+
+    # Som CountVectorizer(max_features): behåll de termer som förekommer flest gånger
+    if max_features and len(alla_termer) > max_features:
+        termfrekvens = np.asarray(räkningar.sum(axis=0)).ravel()
+        behåll = np.sort((-termfrekvens).argsort()[:max_features])
+        räkningar = räkningar[:, behåll]
+        alla_termer = alla_termer[behåll]
+
+    return TfidfTransformer().fit_transform(räkningar), alla_termer
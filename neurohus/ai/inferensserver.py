@@ -0,0 +1,290 @@
+# Lokal inferensserver för sentimentmodellen
+# Samlar förfrågningar från alla arbetsprocesser till gemensamma batchar
+
+import argparse
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, List, Optional, Tuple
+
+from .mätning import Latensmätare
+
+logger = logging.getLogger(__name__)
+
+STANDARD_ADRESS = ("127.0.0.1", 6010)
+NYCKEL_VARIABEL = "NEUROHUS_INFERENS_NYCKEL"
+
+
+def ny_nyckel() -> bytes:
+    """Slumpad autentiseringsnyckel för en driftsättning"""
+    return secrets.token_hex(32).encode("ascii")
+
+
+def _kräv_nyckel(nyckel: Optional[bytes]) -> bytes:
+    # Anslutningarna skickar pickle, så en känd nyckel vore godtycklig kodkörning för alla som når porten
+    if not nyckel:
+        raise RuntimeError(f"{NYCKEL_VARIABEL} måste vara satt för inferensservern")
+    return nyckel
+
+
+@dataclass
+class ServerKonfiguration:
+    """Inställningar för inferensservern"""
+    adress: Tuple[str, int] = STANDARD_ADRESS
+    nyckel: Optional[bytes] = None
+    max_väntan_ms: float = 10.0
+    max_batch: int = 64
+    batch_storlek: int = 32
+    torch_trådar: Optional[int] = None
+
+    @classmethod
+    def från_miljö(cls) -> "ServerKonfiguration":
+        """Läser NEUROHUS_INFERENS_* från miljön"""
+        return cls(
+            adress=tolka_adress(os.getenv("NEUROHUS_INFERENS_ADRESS")) or STANDARD_ADRESS,
+            nyckel=os.getenv(NYCKEL_VARIABEL, "").encode("utf-8") or None,
+            max_väntan_ms=float(os.getenv("NEUROHUS_INFERENS_MAX_VANTAN_MS", "10")),
+            max_batch=int(os.getenv("NEUROHUS_INFERENS_MAX_BATCH", "64")),
+            batch_storlek=int(os.getenv("NEUROHUS_INFERENS_BATCH_STORLEK", "32")),
+            torch_trådar=int(os.environ["NEUROHUS_TORCH_TRADAR"]) if os.getenv("NEUROHUS_TORCH_TRADAR") else None
+        )
+
+
+def tolka_adress(värde: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Tolkar 'värd:port' till en adress-tupel"""
+    if not värde:
+        return None
+    värd, _, port = värde.rpartition(":")
+    return (värd or "127.0.0.1", int(port))
+
+
+@dataclass
+class _Förfrågan:
+    anslutning: Any
+    skrivlås: threading.Lock
+    förfrågan_id: int
+    texter: List[str]
+    ankomst: float
+
+
+class InferensServer:
+    """
+    Tar emot texter från många klienter, väntar högst `max_väntan_ms` eller
+    tills `max_batch` texter samlats och kör sedan ett gemensamt batchanrop
+    """
+
+    def __init__(self, konfiguration: Optional[ServerKonfiguration] = None, analyzer=None):
+        self.konfiguration = konfiguration or ServerKonfiguration.från_miljö()
+        self._analyzer = analyzer
+        self._kö: "queue.Queue[_Förfrågan]" = queue.Queue()
+        self._stoppa = threading.Event()
+        self.förfrågningslatens = Latensmätare()
+        self.batchtid = Latensmätare()
+        self.antal_batchar = 0
+
+    def _ladda_modell(self):
+        if self.konfiguration.torch_trådar:
+            import torch
+
+            torch.set_num_threads(self.konfiguration.torch_trådar)
+            torch.set_num_interop_threads(max(1, self.konfiguration.torch_trådar // 2))
+        if self._analyzer is None:
+            from .modeller import ladda_lokal_sentiment_analyzer
+
+            self._analyzer = ladda_lokal_sentiment_analyzer()
+
+    def kör(self):
+        """Startar servern i aktuell process och blockerar tills den stoppas"""
+        nyckel = _kräv_nyckel(self.konfiguration.nyckel)
+        self._ladda_modell()
+        lyssnare = Listener(self.konfiguration.adress, backlog=128, authkey=nyckel)
+        threading.Thread(target=self._ta_emot, args=(lyssnare,), daemon=True).start()
+        logger.info(f"Inferensserver lyssnar på {self.konfiguration.adress}")
+        try:
+            while not self._stoppa.is_set():
+                batch = self._samla_batch()
+                if batch:
+                    self._kör_batch(batch)
+        finally:
+            lyssnare.close()
+
+    def stoppa(self):
+        self._stoppa.set()
+
+    def _ta_emot(self, lyssnare: Listener):
+        while not self._stoppa.is_set():
+            try:
+                anslutning = lyssnare.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                continue
+            threading.Thread(target=self._läs_anslutning, args=(anslutning,), daemon=True).start()
+
+    def _läs_anslutning(self, anslutning):
+        skrivlås = threading.Lock()
+        try:
+            while True:
+                meddelande = anslutning.recv()
+                if meddelande[0] == "metrik":
+                    with skrivlås:
+                        anslutning.send(("metrik", self.metrik()))
+                    continue
+                _, förfrågan_id, texter = meddelande
+                self._kö.put(_Förfrågan(anslutning, skrivlås, förfrågan_id, texter, time.perf_counter()))
+        except (EOFError, OSError):
+            anslutning.close()
+
+    def _samla_batch(self) -> List[_Förfrågan]:
+        """Väntar på första förfrågan och fyller sedan på tills tid eller storlek tar slut"""
+        try:
+            första = self._kö.get(timeout=0.5)
+        except queue.Empty:
+            return []
+
+        batch = [första]
+        antal_texter = len(första.texter)
+        deadline = första.ankomst + self.konfiguration.max_väntan_ms / 1000
+        while antal_texter < self.konfiguration.max_batch:
+            kvar = deadline - time.perf_counter()
+            if kvar <= 0:
+                break
+            try:
+                förfrågan = self._kö.get(timeout=kvar)
+            except queue.Empty:
+                break
+            batch.append(förfrågan)
+            antal_texter += len(förfrågan.texter)
+        return batch
+
+    def _kör_batch(self, batch: List[_Förfrågan]):
+        from .sentiment import poängsätt_texter
+
+        alla_texter = [text for förfrågan in batch for text in förfrågan.texter]
+        start = time.perf_counter()
+        resultat = poängsätt_texter(alla_texter, analyzer=self._analyzer,
+                                    batch_storlek=self.konfiguration.batch_storlek)
+        slut = time.perf_counter()
+        self.batchtid.registrera(slut - start, len(alla_texter))
+        self.antal_batchar += 1
+
+        position = 0
+        for förfrågan in batch:
+            antal = len(förfrågan.texter)
+            svar = ("svar", förfrågan.förfrågan_id,
+                    resultat.poäng[position:position + antal],
+                    resultat.orsaker[position:position + antal])
+            position += antal
+            try:
+                with förfrågan.skrivlås:
+                    förfrågan.anslutning.send(svar)
+            except (OSError, EOFError):
+                logger.warning("Klienten kopplade ner innan svaret skickades")
+            self.förfrågningslatens.registrera(slut - förfrågan.ankomst, antal)
+
+    def metrik(self) -> Dict[str, Any]:
+        """Latens per förfrågan, tid per batch (antal = texter), batchstorlek och ködjup"""
+        batchar = self.batchtid.sammanfattning()
+        return {
+            'förfrågningar': self.förfrågningslatens.sammanfattning(),
+            'batchar': batchar,
+            'antal_batchar': self.antal_batchar,
+            'genomsnittlig_batchstorlek': batchar['antal'] / self.antal_batchar if self.antal_batchar else 0.0,
+            'ködjup': self._kö.qsize()
+        }
+
+
+class InferensKlient:
+    """
+    Klient med samma anropsform som transformers-pipelinen, så att
+    TrendAnalys och moderering kan använda servern utan ändringar
+    """
+
+    def __init__(self, adress: Tuple[str, int], nyckel: Optional[bytes]):
+        self.adress = adress
+        self.nyckel = _kräv_nyckel(nyckel)
+        self._lokal = threading.local()
+        self._id = itertools.count()
+
+    def _anslutning(self):
+        anslutning = getattr(self._lokal, "anslutning", None)
+        if anslutning is None:
+            anslutning = Client(self.adress, authkey=self.nyckel)
+            self._lokal.anslutning = anslutning
+        return anslutning
+
+    def __call__(self, texter, **kwargs) -> List[Dict[str, Any]]:
+        enskild = isinstance(texter, str)
+        lista = [texter] if enskild else list(texter)
+        förfrågan_id = next(self._id)
+
+        anslutning = self._anslutning()
+        try:
+            anslutning.send(("poängsätt", förfrågan_id, lista))
+            _, svar_id, poäng, orsaker = anslutning.recv()
+        except (OSError, EOFError):
+            self._lokal.anslutning = None
+            raise
+
+        if svar_id != förfrågan_id:
+            raise RuntimeError("Svar från inferensservern kom i fel ordning")
+        fel = [orsak for orsak in orsaker if orsak]
+        if fel:
+            raise RuntimeError(f"Inferensservern kunde inte poängsätta: {fel[0]}")
+
+        return [{'label': 'POSITIVE', 'score': p} for p in poäng]
+
+    def metrik(self) -> Dict[str, Any]:
+        anslutning = self._anslutning()
+        anslutning.send(("metrik",))
+        return anslutning.recv()[1]
+
+
+def _kör_server(konfiguration: ServerKonfiguration):
+    logging.basicConfig(level=logging.INFO)
+    InferensServer(konfiguration).kör()
+
+
+def starta_i_bakgrunden(konfiguration: Optional[ServerKonfiguration] = None) -> multiprocessing.Process:
+    """
+    Startar inferensservern i en separat process. Saknas nyckel slumpas en ny och
+    sätts i NEUROHUS_INFERENS_NYCKEL så att processer som startas härifrån hittar den
+    """
+    konfiguration = konfiguration or ServerKonfiguration.från_miljö()
+    if not konfiguration.nyckel:
+        konfiguration.nyckel = ny_nyckel()
+        os.environ[NYCKEL_VARIABEL] = konfiguration.nyckel.decode("ascii")
+    process = multiprocessing.get_context("spawn").Process(
+        target=_kör_server,
+        args=(konfiguration,),
+        name="neurohus-inferens",
+        daemon=True
+    )
+    process.start()
+    return process
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lokal inferensserver för sentimentmodellen")
+    parser.add_argument("--adress", default=None, help="värd:port, standard 127.0.0.1:6010")
+    parser.add_argument("--max-vantan-ms", type=float, default=None)
+    parser.add_argument("--max-batch", type=int, default=None)
+    parser.add_argument("--torch-tradar", type=int, default=None)
+    args = parser.parse_args()
+
+    konfiguration = ServerKonfiguration.från_miljö()
+    if args.adress:
+        konfiguration.adress = tolka_adress(args.adress)
+    if args.max_vantan_ms is not None:
+        konfiguration.max_väntan_ms = args.max_vantan_ms
+    if args.max_batch is not None:
+        konfiguration.max_batch = args.max_batch
+    if args.torch_tradar is not None:
+        konfiguration.torch_trådar = args.torch_tradar
+
+    _kör_server(konfiguration)
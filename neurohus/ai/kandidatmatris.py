@@ -0,0 +1,288 @@
+# Förkompilerad kandidatmatris för verksamhetsrekommendationer
+# En användare poängsätts mot alla verksamheter med ett fåtal NumPy-operationer
+
+from dataclasses import replace
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from .förfilter import FörfilterIndex, Urval
+from .spatialt import SpatialtIndex, närhetspoäng
+from .trendlager import _Kodning
+
+# Vikter och kommunpoäng som i EmpatiRekommendation.beräkna_matchning
+VIKT_GRUND = 0.4
+VIKT_EMPATI = 0.4
+VIKT_KOMMUN = 0.2
+KOMMUN_SAMMA = 1.0
+KOMMUN_ANNAN = 0.3
+
+
+def _multi_hot(listor: Iterable[Sequence[str]], kodning: _Kodning) -> sparse.csr_matrix:
+    """Gles 0/1-matris med en rad per lista och en kolumn per internerat värde"""
+    indptr = [0]
+    kolumner: List[int] = []
+    for värden in listor:
+        unika = set(värden or ())
+        if unika:
+            kolumner.extend(kodning.koda(unika).tolist())
+        indptr.append(len(kolumner))
+    data = np.ones(len(kolumner), dtype=np.float64)
+    return sparse.csr_matrix((data, np.asarray(kolumner, dtype=np.int32), np.asarray(indptr)),
+                             shape=(len(indptr) - 1, len(kodning.värden)))
+
+
+class KandidatMatris:
+    """
+    Verksamheter kompilerade till kolumner: multi-hot för diagnoser och tjänster
+    över en internerad vokabulär, koder för kommun och åldersgrupp, koordinater
+    samt förberäknad empatipoäng. Poängen är desamma som beräkna_matchning ger per par
+    """
+
+    def __init__(self, verksamheter: Sequence[Any], empati: np.ndarray):
+        self.ids: List[str] = [v.verksamhet_id for v in verksamheter]
+        self.diagnoser = _Kodning()
+        self.tjänster = _Kodning()
+        self.kommuner = _Kodning()
+        self.åldersgrupper = _Kodning()
+        self.typer = _Kodning()
+
+        self.diagnos_matris = _multi_hot((v.diagnoser for v in verksamheter), self.diagnoser)
+        self.tjänst_matris = _multi_hot((v.tjänster for v in verksamheter), self.tjänster)
+        self.har_diagnoser = np.diff(self.diagnos_matris.indptr) > 0
+        self.har_tjänster = np.diff(self.tjänst_matris.indptr) > 0
+        # Diagnoser och tjänster sida vid sida så att båda räknas i en matrismultiplikation
+        self.kriterie_matris = sparse.hstack([self.diagnos_matris, self.tjänst_matris], format="csr")
+
+        self.kommun_koder = self.kommuner.koda(v.kommun for v in verksamheter)
+        # Rader per kommun: ordning[gränser[k]:gränser[k + 1]] har kommunkod k
+        self._kommun_ordning = np.argsort(self.kommun_koder, kind="stable")
+        self._kommun_gränser = np.searchsorted(self.kommun_koder[self._kommun_ordning],
+                                               np.arange(len(self.kommuner.värden) + 1))
+        self.ålder_koder = self.åldersgrupper.koda(v.åldersgrupp for v in verksamheter)
+        self.typ_koder = self.typer.koda(v.typ for v in verksamheter)
+        self.empati = np.asarray(empati, dtype=np.float64)
+        koordinater = [getattr(v, 'koordinater', None) or (np.nan, np.nan) for v in verksamheter]
+        self.koordinater = np.array(koordinater, dtype=np.float64).reshape(len(self.ids), 2)
+        self._spatialt_index: Optional[SpatialtIndex] = None
+        self._förfilter: Optional[FörfilterIndex] = None
+        self.rad_för_id: Dict[str, int] = {verksamhet_id: i for i, verksamhet_id in enumerate(self.ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def uppdatera_empati(self, verksamhet_id: str, poäng: float):
+        """Byter en verksamhets empatipoäng utan omkompilering"""
+        rad = self.rad_för_id.get(verksamhet_id)
+        if rad is not None:
+            self.empati[rad] = poäng
+
+    @property
+    def spatialt_index(self) -> SpatialtIndex:
+        """KD-träd över verksamheternas koordinater, byggs vid första användning"""
+        if self._spatialt_index is None:
+            self._spatialt_index = SpatialtIndex(self.koordinater[:, 0], self.koordinater[:, 1])
+        return self._spatialt_index
+
+    @property
+    def förfilter(self) -> FörfilterIndex:
+        """Inverterat index per diagnos, åldersgrupp och typ, byggs vid första användning"""
+        if self._förfilter is None:
+            self._förfilter = FörfilterIndex(self)
+        return self._förfilter
+
+    def kandidatrader(self, användar_profil: Any, urval: Optional[Urval] = None,
+                      rader: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """Rader som klarar urvalets hårda krav, None när alla ska poängsättas"""
+        if urval is None or urval.tomt:
+            return rader
+        return self.förfilter.rader(användar_profil, urval, rader)
+
+    def inom_avstånd(self, användar_profil: Any, max_avstånd_km: Optional[float],
+                     rader: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        Förfiltrerar rader på reseavstånd från användarens koordinater. Verksamheter
+        utan koordinater faller bort; utan användarkoordinater filtreras inget
+        """
+        koordinater = getattr(användar_profil, 'koordinater', None)
+        if max_avstånd_km is None or not koordinater:
+            return rader
+        inom, _ = self.spatialt_index.inom_radie(koordinater[0], koordinater[1], max_avstånd_km)
+        return inom if rader is None else np.intersect1d(rader, inom, assume_unique=True)
+
+    def _användarmatris(self, listor: Iterable[Sequence[str]], kodning: _Kodning) -> Tuple[np.ndarray, np.ndarray]:
+        """0/1-matris vokabulär x användare och antal unika värden per användare"""
+        listor = [set(värden or ()) for värden in listor]
+        matris = np.zeros((len(kodning.värden), len(listor)), dtype=np.float64)
+        for i, unika in enumerate(listor):
+            matris[[kodning.koder[v] for v in unika if v in kodning.koder], i] = 1.0
+        return matris, np.array([len(unika) for unika in listor], dtype=np.float64)
+
+    def grundpoäng(self, profiler: Sequence[Any], rader: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Kriteriematchning, verksamheter x användare. Diagnoser och tjänster räknas
+        som kriterier när båda sidor har värden, åldersgrupp bara när den stämmer
+        """
+        kriterie_matris, ålder_koder = self.kriterie_matris, self.ålder_koder
+        har_diagnoser, har_tjänster = self.har_diagnoser, self.har_tjänster
+        if rader is not None:
+            kriterie_matris, ålder_koder = kriterie_matris[rader], ålder_koder[rader]
+            har_diagnoser, har_tjänster = har_diagnoser[rader], har_tjänster[rader]
+
+        antal_användare = len(profiler)
+        användar_diagnoser, antal_diagnoser = self._användarmatris([p.diagnoser for p in profiler], self.diagnoser)
+        användar_behov, antal_behov = self._användarmatris([p.behov for p in profiler], self.tjänster)
+
+        # Antal gemensamma diagnoser och tjänster per par i en multiplikation, exakta heltal
+        vikter = np.zeros((kriterie_matris.shape[1], 2 * antal_användare))
+        vikter[:len(self.diagnoser.värden), :antal_användare] = användar_diagnoser
+        vikter[len(self.diagnoser.värden):, antal_användare:] = användar_behov
+        gemensamma = kriterie_matris @ vikter
+
+        ålder = np.array([self.åldersgrupper.koder.get(p.åldersgrupp, -1) for p in profiler])
+        samma_ålder = ålder_koder[:, None] == ålder[None, :]
+
+        # Andelar som i beräkna_matchning: diagnoser, åldersgrupp, tjänster
+        poäng = gemensamma[:, :antal_användare] / np.maximum(antal_diagnoser, 1)
+        poäng += samma_ålder
+        poäng += gemensamma[:, antal_användare:] / np.maximum(antal_behov, 1)
+        kriterier = samma_ålder.astype(np.float64)
+        kriterier += har_diagnoser[:, None] & (antal_diagnoser > 0)[None, :]
+        kriterier += har_tjänster[:, None] & (antal_behov > 0)[None, :]
+
+        # Utan kriterier är poängen noll
+        return np.divide(poäng, kriterier, out=np.zeros_like(poäng), where=kriterier > 0)
+
+    def _samma_kommun(self, profiler: Sequence[Any],
+                      rader: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """(rad, användare) för par i samma kommun, via radindexet per kommun"""
+        radlistor, kolumnlistor = [], []
+        for i, profil in enumerate(profiler):
+            kod = self.kommuner.koder.get(profil.kommun)
+            if kod is None:
+                continue
+            if rader is None:
+                träffar = self._kommun_ordning[self._kommun_gränser[kod]:self._kommun_gränser[kod + 1]]
+            else:
+                träffar = np.flatnonzero(self.kommun_koder[rader] == kod)
+            radlistor.append(träffar)
+            kolumnlistor.append(np.full(len(träffar), i))
+        if not radlistor:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(radlistor), np.concatenate(kolumnlistor)
+
+    def poängmatris(self, profiler: Sequence[Any], rader: Optional[np.ndarray] = None) -> np.ndarray:
+        """Total matchning 0-1, verksamheter (eller rader i `rader`) x användare"""
+        empati = self.empati if rader is None else self.empati[rader]
+
+        total = self.grundpoäng(profiler, rader)
+        total *= VIKT_GRUND
+        total += (empati * VIKT_EMPATI)[:, None]
+
+        med_koordinater = [i for i, p in enumerate(profiler) if getattr(p, 'koordinater', None)]
+        if not med_koordinater or len(self.spatialt_index) == 0:
+            # Samma kommun är glest, de paren får sin poäng efter att övriga fått KOMMUN_ANNAN
+            samma_rad, samma_användare = self._samma_kommun(profiler, rader)
+            före = total[samma_rad, samma_användare]
+            total += KOMMUN_ANNAN * VIKT_KOMMUN
+            total[samma_rad, samma_användare] = före + KOMMUN_SAMMA * VIKT_KOMMUN
+        else:
+            total += self._kommunpoäng(profiler, rader, med_koordinater) * VIKT_KOMMUN
+        return np.clip(total, 0.0, 1.0, out=total)
+
+    def _kommunpoäng(self, profiler: Sequence[Any], rader: Optional[np.ndarray],
+                     med_koordinater: List[int]) -> np.ndarray:
+        """Närhetspoäng där båda sidor har koordinater, annars samma eller annan kommun"""
+        antal_rader = len(self) if rader is None else len(rader)
+        kommun = np.full((antal_rader, len(profiler)), KOMMUN_ANNAN)
+        samma_rad, samma_användare = self._samma_kommun(profiler, rader)
+        kommun[samma_rad, samma_användare] = KOMMUN_SAMMA
+        for i in med_koordinater:
+            lat, lon = profiler[i].koordinater
+            avstånd = self.spatialt_index.avstånd(lat, lon, rader)
+            kända = np.isfinite(avstånd)
+            kommun[kända, i] = närhetspoäng(avstånd[kända])
+        return kommun
+
+    def poäng(self, användar_profil: Any, rader: Optional[np.ndarray] = None) -> np.ndarray:
+        """Total matchning 0-1 per verksamhet (eller per rad i `rader`)"""
+        return self.poängmatris([användar_profil], rader)[:, 0]
+
+    def _resultat(self, poäng: np.ndarray, antal: int,
+                  rader: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        index = topp_index(poäng, antal)
+        if rader is not None:
+            return [(self.ids[rader[i]], float(poäng[i])) for i in index]
+        return [(self.ids[i], float(poäng[i])) for i in index]
+
+    def topp(self, användar_profil: Any, antal: int = 5, rader: Optional[np.ndarray] = None,
+             max_avstånd_km: Optional[float] = None,
+             urval: Optional[Urval] = None) -> List[Tuple[str, float]]:
+        """
+        De `antal` bästa verksamheterna, vid lika poäng i ursprunglig ordning.
+        Bara verksamheter som klarar `urval` (och `max_avstånd_km`) poängsätts
+        """
+        rader = self.kandidatrader(användar_profil, _med_avstånd(urval, max_avstånd_km), rader)
+        return self._resultat(self.poäng(användar_profil, rader), antal, rader)
+
+    def topp_för_många(self, profiler: Sequence[Any], antal: int = 5,
+                       max_minne_mb: float = 32,
+                       max_avstånd_km: Optional[float] = None,
+                       urval: Optional[Urval] = None) -> List[List[Tuple[str, float]]]:
+        """
+        Topplista per användare. Poängmatrisen beräknas i block av användare
+        så att minnet för mellanresultaten håller sig under `max_minne_mb`.
+        Med `urval` förfiltreras varje användare först och användare med samma
+        kandidatrader poängsätts tillsammans mot bara de raderna
+        """
+        urval = _med_avstånd(urval, max_avstånd_km)
+        # Ungefär sex flyttalsmatriser användare x verksamheter lever samtidigt per block
+        per_användare = max(1, len(self)) * 8 * 6
+        blockstorlek = max(1, int(max_minne_mb * 2 ** 20 // per_användare))
+        resultat: List[List[Tuple[str, float]]] = [[] for _ in profiler]
+        for start in range(0, len(profiler), blockstorlek):
+            block = profiler[start:start + blockstorlek]
+            # Användare per unik kandidatmängd; None betyder hela katalogen
+            grupper: Dict[Optional[bytes], Tuple[Optional[np.ndarray], List[int]]] = {}
+            for i, profil in enumerate(block, start):
+                rader = self.kandidatrader(profil, urval)
+                nyckel = None if rader is None else rader.tobytes()
+                grupper.setdefault(nyckel, (rader, []))[1].append(i)
+            for rader, index in grupper.values():
+                if rader is not None and len(rader) == 0:
+                    continue
+                poäng = self.poängmatris([profiler[i] for i in index], rader)
+                for i, kolumn in zip(index, poäng.T):
+                    resultat[i] = self._resultat(kolumn, antal, rader)
+        return resultat
+
+    def nollställ_förfilter_statistik(self):
+        """Börjar om räkningen av beskärningsgrad, t.ex. inför en ny mätning"""
+        if self._förfilter is not None:
+            self._förfilter.nollställ_statistik()
+
+
+def _med_avstånd(urval: Optional[Urval], max_avstånd_km: Optional[float]) -> Optional[Urval]:
+    """Slår ihop ett separat angivet max_avstånd_km med urvalet"""
+    if max_avstånd_km is None:
+        return urval
+    return replace(urval or Urval(), max_avstånd_km=max_avstånd_km)
+
+
+def topp_index(poäng: np.ndarray, antal: int) -> np.ndarray:
+    """
+    Index för de `antal` högsta poängen i fallande ordning i linjär tid.
+    Lika poäng vid gränsen avgörs av lägst index, som en stabil sortering
+    """
+    n = len(poäng)
+    if antal <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if antal < n:
+        gräns = poäng[np.argpartition(-poäng, antal - 1)[antal - 1]]
+        över = np.flatnonzero(poäng > gräns)
+        lika = np.flatnonzero(poäng == gräns)[:antal - len(över)]
+        kandidater = np.concatenate([över, lika])
+    else:
+        kandidater = np.arange(n)
+    return kandidater[np.lexsort((kandidater, -poäng[kandidater]))]
@@ -0,0 +1,105 @@
+# Maskering av personuppgifter
+# Personnummer, telefonnummer och e-post hittas i ett kombinerat pass som teckenspann och maskeras i en join
+
+import re
+from typing import Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from .regelmotor import Träffar, foga_in
+
+# Mönstren per typ prövas i denna ordning på varje position
+PERSONUPPGIFTS_MÖNSTER: Dict[str, List[str]] = {
+    'personnummer': [
+        r'\b(?:\d{2})?\d{6}[-+]\d{4}\b',  # ÅÅMMDD-NNNN och ÅÅÅÅMMDD-NNNN
+        r'\b\d{4}-\d{2}-\d{2}\b',         # Födelsedatum
+    ],
+    'telefon': [
+        r'(?:\+46\s?|\b0)\d{1,3}(?:[- ]?\d{2,3}){2,3}\b',  # 070-123 45 67, +46 8 123 456
+        r'\b\d{10,12}\b',
+        r'\b\d{3}-\d{2}-\d{2}\b',
+    ],
+    'e-post': [
+        r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b',
+    ],
+}
+
+# Varje träff av standardmönstren börjar med en siffra eller +, eller är en e-postadress.
+# Som lookahead före alternativen slipper motorn pröva alla grenar på varje position
+PERSONUPPGIFTS_BÖRJAN = r'[\d+]|\b[A-Za-z0-9._%+-]+@'
+
+
+class Spann(NamedTuple):
+    """En personuppgift som typ och teckenposition i texten"""
+    typ: str
+    start: int
+    slut: int
+
+
+class Maskerare:
+    """
+    Alla mönster blir namngivna grupper i ett uttryck som körs en gång över
+    texten. Spannen kommer i textordning utan överlapp och maskeras med en
+    etikett per typ, standard [PERSONNUMMER], [TELEFON] och [E-POST]. Texter
+    där `vakt` inte hittas skannas inte alls, och `början` är ett uttryck som
+    måste gälla där varje träff börjar (standard bara för standardmönstren)
+    """
+
+    def __init__(self, mönster: Optional[Mapping[str, Sequence[str]]] = None,
+                 etiketter: Optional[Mapping[str, str]] = None, vakt: Optional[str] = r"[\d@]",
+                 början: Optional[str] = None):
+        if mönster is None and början is None:
+            början = PERSONUPPGIFTS_BÖRJAN
+        self.mönster = {typ: list(uttryck) for typ, uttryck in (mönster or PERSONUPPGIFTS_MÖNSTER).items()}
+        self.etiketter = {typ: f"[{typ.upper()}]" for typ in self.mönster}
+        self.etiketter.update(etiketter or {})
+        self._vakt = re.compile(vakt) if vakt else None
+
+        self.typ_för_mönster: Dict[str, str] = {}
+        self._typ_för_grupp: Dict[str, str] = {}
+        delar = []
+        for typ, uttryck in self.mönster.items():
+            for mönstret in uttryck:
+                namn = f"p{len(self._typ_för_grupp)}"
+                self._typ_för_grupp[namn] = typ
+                self.typ_för_mönster.setdefault(mönstret, typ)
+                delar.append(f"(?P<{namn}>{mönstret})")
+        alternativ = "|".join(delar)
+        self.uttryck = re.compile(f"(?=(?:{början}))(?:{alternativ})" if början else alternativ)
+
+    @property
+    def alla_mönster(self) -> List[str]:
+        """Mönstren i prövningsordning, t.ex. som en mönsterkategori i en Regelmotor"""
+        return [mönstret for uttryck in self.mönster.values() for mönstret in uttryck]
+
+    def spann(self, text: str) -> List[Spann]:
+        """Personuppgifter i texten som spann i textordning"""
+        if self._vakt is not None and not self._vakt.search(text):
+            return []
+        typ_för_grupp = self._typ_för_grupp
+        return [Spann(typ_för_grupp[m.lastgroup], m.start(), m.end()) for m in self.uttryck.finditer(text)]
+
+    def spann_från_träffar(self, träffar: Träffar, kategori: str = 'personuppgift') -> List[Spann]:
+        """
+        Spann ur en Regelmotor-sökning där `kategori` har alla_mönster som mönster,
+        så att texten inte behöver skannas igen. Överlappande träffar hoppas över
+        """
+        resultat, position = [], 0
+        for träff in träffar.i_kategori(kategori):
+            if träff.start >= position:
+                resultat.append(Spann(self.typ_för_mönster.get(träff.term, kategori), träff.start, träff.slut))
+                position = träff.slut
+        return resultat
+
+    def ändringar(self, spann: Iterable[Spann]) -> List[Tuple[int, int, str]]:
+        """Spannen som (start, slut, etikett), att fogas in med regelmotor.foga_in"""
+        return [(start, slut, self.etiketter.get(typ, f"[{typ.upper()}]")) for typ, start, slut in spann]
+
+    def maskera(self, text: str, spann: Optional[Iterable[Spann]] = None) -> str:
+        """Texten med varje personuppgift utbytt mot sin etikett, byggd i en join"""
+        spann = self.spann(text) if spann is None else spann
+        return foga_in(text, self.ändringar(spann))
+
+    def maskera_många(self, texter: Iterable[str]) -> Iterator[Tuple[str, List[Spann]]]:
+        """(maskerad text, spann) per text, strömmande så att t.ex. lagrade recensioner kan maskeras i bulk"""
+        for text in texter:
+            spann = self.spann(text)
+            yield (self.maskera(text, spann) if spann else text), spann
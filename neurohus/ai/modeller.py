@@ -0,0 +1,193 @@
+# Modellregister för AI-moduler
+# Laddar spaCy, sentimentmodell och tunga bibliotek först vid användning
+
+import importlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_MODELL = "KBLab/sentence-bert-swedish-cased"
+
+# standard = full precision, int8 = dynamiskt kvantiserad torch, onnx = ONNX Runtime via optimum
+SENTIMENT_BACKENDS = ("standard", "int8", "onnx")
+
+
+class _LatModul:
+    """Proxy som importerar en modul först när ett attribut efterfrågas"""
+
+    def __init__(self, namn: str):
+        self._namn = namn
+        self._modul = None
+        self._lås = threading.Lock()
+
+    def _ladda(self):
+        if self._modul is None:
+            with self._lås:
+                if self._modul is None:
+                    self._modul = importlib.import_module(self._namn)
+        return self._modul
+
+    def __getattr__(self, attribut: str) -> Any:
+        return getattr(self._ladda(), attribut)
+
+    def __repr__(self) -> str:
+        status = "laddad" if self._modul is not None else "ej laddad"
+        return f"<lat modul {self._namn} ({status})>"
+
+
+def lat_modul(namn: str) -> Any:
+    """Returnerar en lat proxy för modulen `namn`"""
+    return _LatModul(namn)
+
+
+class ModellRegister:
+    """Trådsäkert register som laddar varje modell en gång per process"""
+
+    def __init__(self):
+        self._fabriker: Dict[str, Callable[[], Any]] = {}
+        self._modeller: Dict[str, Any] = {}
+        self._lås: Dict[str, threading.Lock] = {}
+        self._laddtider: Dict[str, float] = {}
+        self._registerlås = threading.Lock()
+
+    def registrera(self, namn: str, fabrik: Callable[[], Any]):
+        """Registrerar en fabriksfunktion som bygger modellen vid första användning"""
+        with self._registerlås:
+            self._fabriker[namn] = fabrik
+            self._lås.setdefault(namn, threading.Lock())
+            self._modeller.pop(namn, None)
+
+    def hämta(self, namn: str) -> Any:
+        """Hämtar modellen och laddar den om den inte redan finns i processen"""
+        modell = self._modeller.get(namn)
+        if modell is not None:
+            return modell
+
+        if namn not in self._fabriker:
+            raise KeyError(f"Okänd modell: {namn}")
+
+        with self._lås[namn]:
+            modell = self._modeller.get(namn)
+            if modell is None:
+                start = time.perf_counter()
+                modell = self._fabriker[namn]()
+                self._laddtider[namn] = time.perf_counter() - start
+                self._modeller[namn] = modell
+                logger.info(f"Laddade modell '{namn}' på {self._laddtider[namn]:.2f} s")
+        return modell
+
+    def är_laddad(self, namn: str) -> bool:
+        """Anger om modellen redan är laddad i processen"""
+        return namn in self._modeller
+
+    def värm_upp(self, namn: Optional[List[str]] = None) -> Dict[str, float]:
+        """Laddar angivna (eller alla) modeller i förväg och returnerar laddtider"""
+        for modell_namn in namn or list(self._fabriker):
+            self.hämta(modell_namn)
+        return dict(self._laddtider)
+
+    def laddtider(self) -> Dict[str, float]:
+        """Returnerar laddtid i sekunder per laddad modell"""
+        return dict(self._laddtider)
+
+
+def _ladda_nlp():
+    """Laddar svensk spaCy-modell med engelsk fallback"""
+    import spacy
+
+    try:
+        return spacy.load("sv_core_news_sm")
+    except OSError:
+        logger.warning("Svensk språkmodell inte tillgänglig, använder engelsk som fallback")
+        return spacy.load("en_core_web_sm")
+
+
+def sentiment_backend() -> str:
+    """Vald backend enligt NEUROHUS_SENTIMENT_BACKEND, standard om inget anges"""
+    backend = os.getenv("NEUROHUS_SENTIMENT_BACKEND", "standard").lower()
+    if backend not in SENTIMENT_BACKENDS:
+        raise ValueError(f"Okänd sentiment-backend '{backend}', välj bland {SENTIMENT_BACKENDS}")
+    return backend
+
+
+def ladda_lokal_sentiment_analyzer(backend: Optional[str] = None):
+    """Bygger pipeline för sentimentanalys i aktuell process med vald backend"""
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer, pipeline
+
+    backend = backend or sentiment_backend()
+    if backend == "standard":
+        return pipeline("sentiment-analysis",
+                        model=SENTIMENT_MODELL,
+                        tokenizer=SENTIMENT_MODELL)
+
+    tokenizer = AutoTokenizer.from_pretrained(SENTIMENT_MODELL)
+    if backend == "int8":
+        import torch
+
+        modell = AutoModelForSequenceClassification.from_pretrained(SENTIMENT_MODELL)
+        modell = torch.quantization.quantize_dynamic(modell, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend == "onnx":
+        modell = _ladda_onnx_modell()
+    else:
+        raise ValueError(f"Okänd sentiment-backend '{backend}', välj bland {SENTIMENT_BACKENDS}")
+
+    return pipeline("sentiment-analysis", model=modell, tokenizer=tokenizer)
+
+
+def _ladda_onnx_modell():
+    """
+    Exporterar modellen till ONNX, eller laddar en tidigare export
+    från NEUROHUS_ONNX_KATALOG så att exporten bara görs en gång
+    """
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+
+    katalog = os.getenv("NEUROHUS_ONNX_KATALOG")
+    if katalog and os.path.isdir(katalog):
+        return ORTModelForSequenceClassification.from_pretrained(katalog)
+
+    modell = ORTModelForSequenceClassification.from_pretrained(SENTIMENT_MODELL, export=True)
+    if katalog:
+        modell.save_pretrained(katalog)
+        logger.info(f"Sparade ONNX-export av {SENTIMENT_MODELL} i {katalog}")
+    return modell
+
+
+def _ladda_sentiment_analyzer():
+    """Använder den lokala inferensservern om NEUROHUS_INFERENS_ADRESS är satt"""
+    if os.getenv("NEUROHUS_INFERENS_ADRESS"):
+        from .inferensserver import InferensKlient, ServerKonfiguration
+
+        konfiguration = ServerKonfiguration.från_miljö()
+        logger.info(f"Sentimentanalys via inferensserver på {konfiguration.adress}")
+        return InferensKlient(konfiguration.adress, konfiguration.nyckel)
+    return ladda_lokal_sentiment_analyzer()
+
+
+register = ModellRegister()
+register.registrera("nlp", _ladda_nlp)
+register.registrera("sentiment_analyzer", _ladda_sentiment_analyzer)
+
+
+def hämta_nlp():
+    """Returnerar spaCy-modellen, laddas vid första anropet"""
+    return register.hämta("nlp")
+
+
+def hämta_sentiment_analyzer():
+    """Returnerar sentimentpipelinen, laddas vid första anropet"""
+    return register.hämta("sentiment_analyzer")
+
+
+def sentiment_modell_id() -> str:
+    """Identifierar aktuell sentimentmodell och backend, används bl.a. som del av cachenycklar"""
+    backend = sentiment_backend()
+    return SENTIMENT_MODELL if backend == "standard" else f"{SENTIMENT_MODELL}:{backend}"
+
+
+def värm_upp(modeller: Optional[List[str]] = None) -> Dict[str, float]:
+    """Laddar modeller i förväg, t.ex. vid uppstart av API-servern"""
+    return register.värm_upp(modeller)
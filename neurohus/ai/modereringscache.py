@@ -0,0 +1,123 @@
+# Cache för modereringsresultat
+# Nycklad på regelversion, roll och hash av texten så att en regeländring ger nya nycklar
+
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from .cache import LRUCache, SqliteLager
+
+# Höjs när det som sparas ändras, så att äldre poster på disk inte läses (2: utan personuppgifter)
+LAGRINGSVERSION = 2
+
+_delad_cache = None
+_delad_lås = threading.Lock()
+
+
+def lagringsbart(resultat: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Kopia av resultatet utan råa personuppgifter (säkerhets_resultat['personuppgifter'])
+    och utan modererings_datum, som anroparen fyller i igen vid träff
+    """
+    resultat = dict(resultat)
+    resultat.pop('modererings_datum', None)
+    säkerhet = resultat.get('säkerhets_resultat')
+    if isinstance(säkerhet, dict) and 'personuppgifter' in säkerhet:
+        resultat['säkerhets_resultat'] = {fält: värde for fält, värde in säkerhet.items() if fält != 'personuppgifter'}
+    return resultat
+
+
+class ModereringsCache:
+    """
+    Modereringsresultat i en LRU i minnet framför ett valfritt SQLite-lager på disk.
+    Nyckeln börjar med regelversionen, så resultat från äldre regler slås aldrig upp
+    igen och faller ur minnet i LRU-ordning. Vid pickling (t.ex. till arbetsprocesser)
+    följer bara inställningarna med och varje process får ett eget minne.
+    Råa personuppgifter och modereringstidpunkt sparas aldrig, se lagringsbart
+    """
+
+    def __init__(self, sökväg: Optional[str] = None, max_i_minnet: int = 10_000):
+        self.sökväg = sökväg
+        self.max_i_minnet = max_i_minnet
+        self.minne = LRUCache(max_i_minnet)
+        self.lager = SqliteLager(sökväg, tabell="moderering") if sökväg else None
+        self._lås = threading.Lock()
+        self.minnesträffar = 0
+        self.diskträffar = 0
+        self.missar = 0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {'sökväg': self.sökväg, 'max_i_minnet': self.max_i_minnet}
+
+    def __setstate__(self, tillstånd: Dict[str, Any]):
+        self.__init__(**tillstånd)
+
+    @classmethod
+    def från_miljö(cls) -> "ModereringsCache":
+        """Skapar cache med disklager om NEUROHUS_MODERERING_CACHE anger en sökväg"""
+        return cls(sökväg=os.getenv("NEUROHUS_MODERERING_CACHE"))
+
+    @classmethod
+    def delad(cls) -> "ModereringsCache":
+        """Processgemensam cache som delas av alla modereringsinstanser"""
+        global _delad_cache
+        with _delad_lås:
+            if _delad_cache is None:
+                _delad_cache = cls.från_miljö()
+        return _delad_cache
+
+    @staticmethod
+    def nyckel(regelversion: str, *delar: Any) -> str:
+        """Stabil nyckel för exakt denna text, roll och övriga indata under en regelversion"""
+        # repr är entydigt för strängar, tal, booleska värden och None och snabbare än JSON
+        underlag = repr((LAGRINGSVERSION, delar)).encode('utf-8', 'surrogatepass')
+        return f"{regelversion}:{hashlib.sha256(underlag).hexdigest()}"
+
+    def hämta(self, nyckel: str) -> Optional[Dict[str, Any]]:
+        """
+        Sparat resultat som en ny ytlig kopia, så att anroparen kan lägga till fält.
+        Nästlade dictar delas med cachen och ska ersättas, inte ändras
+        """
+        resultat = self.minne.hämta(nyckel)
+        från_disk = False
+        if resultat is None and self.lager:
+            resultat = self.lager.hämta_många([nyckel]).get(nyckel)
+            if resultat is not None:
+                self.minne.spara(nyckel, resultat)
+                från_disk = True
+        with self._lås:
+            if resultat is None:
+                self.missar += 1
+                return None
+            if från_disk:
+                self.diskträffar += 1
+            else:
+                self.minnesträffar += 1
+        return dict(resultat)
+
+    def spara(self, nyckel: str, resultat: Dict[str, Any]):
+        """Sparar en lagringsbar kopia av resultatet; resultat med fel sparas inte"""
+        if 'fel' in resultat:
+            return
+        resultat = lagringsbart(resultat)
+        self.minne.spara(nyckel, resultat)
+        if self.lager:
+            self.lager.spara_många([(nyckel, resultat)])
+
+    def töm(self):
+        self.minne.töm()
+        if self.lager:
+            self.lager.töm()
+
+    def statistik(self) -> Dict[str, Any]:
+        """Träffräknare, sparade analyser syns som minnes- plus diskträffar"""
+        with self._lås:
+            uppslag = self.minnesträffar + self.diskträffar + self.missar
+            return {
+                'minnesträffar': self.minnesträffar,
+                'diskträffar': self.diskträffar,
+                'missar': self.missar,
+                'träffgrad': (self.minnesträffar + self.diskträffar) / uppslag if uppslag else 0.0,
+                'poster_i_minnet': len(self.minne)
+            }
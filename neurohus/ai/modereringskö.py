@@ -0,0 +1,148 @@
+# Asynkron modereringskö
+# Prioritetskö med bakgrundstrådar som modererar nytt innehåll och rapporterar ködjup, fördröjning och genomströmning
+
+import itertools
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from .mätning import Latensmätare
+
+logger = logging.getLogger(__name__)
+
+# Lägre värde modereras först; nya trådar syns överst i forumet och går före svar
+PRIORITET = {'tråd': 0, 'svar': 1}
+STANDARD_PRIORITET = 2
+
+
+@dataclass(order=True)
+class _Uppgift:
+    prioritet: int
+    löpnummer: int
+    innehåll_id: str = field(compare=False)
+    innehåll_typ: str = field(compare=False)
+    text: str = field(compare=False)
+    roll: str = field(compare=False)
+    ankomst: float = field(compare=False)
+
+
+class ModereringsKö:
+    """
+    Tar emot innehåll i en prioritetskö och modererar det i `arbetare`
+    bakgrundstrådar. Varje utlåtande lämnas till `verkställ(innehåll_id,
+    innehåll_typ, resultat)`. Trådarna startas vid första inlägget. Är kön
+    full (`max_djup`) modereras inlägget direkt i anroparens tråd, så att
+    inget innehåll blir liggande omodererat
+    """
+
+    def __init__(self, verkställ: Callable[[str, str, Dict[str, Any]], Any], moderering: Any = None,
+                 arbetare: int = 2, max_djup: int = 10_000):
+        if moderering is None:
+            from .analys import EmpatiModerering
+
+            moderering = EmpatiModerering()
+        self.moderering = moderering
+        self.verkställ = verkställ
+        self.antal_arbetare = arbetare
+        self._kö: "queue.PriorityQueue[_Uppgift]" = queue.PriorityQueue(maxsize=max_djup)
+        self._löpnummer = itertools.count()
+        self._stoppa = threading.Event()
+        self._trådar: List[threading.Thread] = []
+        self._startlås = threading.Lock()
+        self._lås = threading.Lock()
+        self.väntetid = Latensmätare()
+        self.fördröjning = Latensmätare()
+        self.modereringstid = Latensmätare()
+        self.antal_fel = 0
+        self.antal_direkt = 0
+
+    def starta(self):
+        """Startar arbetstrådarna om de inte redan körs"""
+        with self._startlås:
+            if self._trådar:
+                return
+            self._stoppa.clear()
+            self._trådar = [threading.Thread(target=self._arbeta, name=f"moderering-{i}", daemon=True)
+                            for i in range(self.antal_arbetare)]
+            for tråd in self._trådar:
+                tråd.start()
+        logger.info(f"Modereringskö startad med {self.antal_arbetare} arbetare")
+
+    def stoppa(self, timeout: Optional[float] = None):
+        """Stoppar arbetstrådarna efter pågående uppgifter; kvarvarande uppgifter ligger kvar i kön"""
+        self._stoppa.set()
+        with self._startlås:
+            for tråd in self._trådar:
+                tråd.join(timeout)
+            self._trådar = []
+
+    def lägg_till(self, innehåll_id: str, innehåll_typ: str, text: str, roll: str = 'användare',
+                  prioritet: Optional[int] = None) -> bool:
+        """Köar innehållet och returnerar direkt; False om kön var full och innehållet modererades direkt"""
+        if not self._trådar:
+            self.starta()
+        uppgift = _Uppgift(PRIORITET.get(innehåll_typ, STANDARD_PRIORITET) if prioritet is None else prioritet,
+                           next(self._löpnummer), innehåll_id, innehåll_typ, text, roll, time.perf_counter())
+        try:
+            self._kö.put_nowait(uppgift)
+            return True
+        except queue.Full:
+            logger.warning(f"Modereringskön är full, modererar {innehåll_typ} {innehåll_id} direkt")
+            with self._lås:
+                self.antal_direkt += 1
+            self._behandla(uppgift)
+            return False
+
+    def vänta_tills_tom(self, timeout: Optional[float] = None) -> bool:
+        """Väntar tills allt köat innehåll har modererats, True om kön hann tömmas"""
+        gräns = None if timeout is None else time.monotonic() + timeout
+        with self._kö.all_tasks_done:
+            while self._kö.unfinished_tasks:
+                kvar = None if gräns is None else gräns - time.monotonic()
+                if kvar is not None and kvar <= 0:
+                    return False
+                self._kö.all_tasks_done.wait(kvar)
+        return True
+
+    def _arbeta(self):
+        while not self._stoppa.is_set():
+            try:
+                uppgift = self._kö.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.väntetid.registrera(time.perf_counter() - uppgift.ankomst)
+                self._behandla(uppgift)
+            finally:
+                self._kö.task_done()
+
+    def _behandla(self, uppgift: _Uppgift):
+        start = time.perf_counter()
+        try:
+            resultat = self.moderering.moderera_text(uppgift.text, uppgift.roll)
+            self.verkställ(uppgift.innehåll_id, uppgift.innehåll_typ, resultat)
+        except Exception as e:
+            logger.error(f"Fel vid köad moderering av {uppgift.innehåll_typ} {uppgift.innehåll_id}: {e}")
+            with self._lås:
+                self.antal_fel += 1
+            return
+        slut = time.perf_counter()
+        self.modereringstid.registrera(slut - start)
+        self.fördröjning.registrera(slut - uppgift.ankomst)
+
+    def metrik(self) -> Dict[str, Any]:
+        """Ködjup, väntetid i kö, fördröjning från inlägg till utlåtande (med genomströmning) och modereringstid"""
+        with self._lås:
+            antal_fel, antal_direkt = self.antal_fel, self.antal_direkt
+        return {
+            'ködjup': self._kö.qsize(),
+            'arbetare': len(self._trådar),
+            'väntetid': self.väntetid.sammanfattning(),
+            'fördröjning': self.fördröjning.sammanfattning(),
+            'modereringstid': self.modereringstid.sammanfattning(),
+            'antal_fel': antal_fel,
+            'antal_direkt_modererade': antal_direkt
+        }
@@ -0,0 +1,99 @@
+# Mätverktyg för AI-moduler
+# Latensprover med percentiler och räknare för genomströmning
+
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable
+
+
+def percentil(sorterade: list, andel: float) -> float:
+    """Percentil med linjär interpolation över en redan sorterad lista"""
+    if not sorterade:
+        return 0.0
+    position = (len(sorterade) - 1) * andel
+    nedre = int(position)
+    övre = min(nedre + 1, len(sorterade) - 1)
+    return sorterade[nedre] + (sorterade[övre] - sorterade[nedre]) * (position - nedre)
+
+
+class Latensmätare:
+    """
+    Samlar de senaste latensproverna, totalt antal och genomströmningen under de
+    senaste `fönster_sekunder`, räknad i ett glidande fönster av sekundhinkar
+    """
+
+    def __init__(self, max_prov: int = 10_000, fönster_sekunder: float = 60.0):
+        self._prov = deque(maxlen=max_prov)
+        self._lås = threading.Lock()
+        self._start = time.monotonic()
+        self.fönster_sekunder = fönster_sekunder
+        # [hel sekund, antal enheter] per sekund med registreringar, äldst först
+        self._hinkar: deque = deque()
+        self.antal = 0
+        self.total_tid = 0.0
+
+    def _rensa(self, nu: float):
+        gräns = nu - self.fönster_sekunder
+        while self._hinkar and self._hinkar[0][0] + 1 <= gräns:
+            self._hinkar.popleft()
+
+    def registrera(self, sekunder: float, antal: int = 1):
+        """Registrerar ett prov som avser `antal` behandlade enheter"""
+        nu = time.monotonic()
+        sekund = int(nu)
+        with self._lås:
+            self._prov.append(sekunder)
+            self.antal += antal
+            self.total_tid += sekunder
+            if self._hinkar and self._hinkar[-1][0] == sekund:
+                self._hinkar[-1][1] += antal
+            else:
+                self._hinkar.append([sekund, antal])
+                self._rensa(nu)
+
+    def sammanfattning(self, percentiler: Iterable[float] = (0.5, 0.95, 0.99)) -> Dict[str, float]:
+        """Percentiler i millisekunder, totalt antal och enheter per sekund under det senaste fönstret"""
+        nu = time.monotonic()
+        with self._lås:
+            sorterade = sorted(self._prov)
+            antal = self.antal
+            self._rensa(nu)
+            i_fönstret = sum(n for _, n in self._hinkar)
+        # Strax efter start har fönstret inte hunnit fyllas
+        spann = min(self.fönster_sekunder, nu - self._start)
+        resultat = {f"p{round(p * 100)}_ms": percentil(sorterade, p) * 1000 for p in percentiler}
+        resultat['antal'] = antal
+        resultat['per_sekund'] = i_fönstret / spann if spann > 0 else 0.0
+        return resultat
+
+
+class StegStatistik:
+    """
+    Mätsink för tider per steg. Alla objekt med `registrera(steg, nanosekunder)`
+    kan användas som sink, t.ex. en adapter mot ett externt metriksystem;
+    denna sparar de senaste `max_prov` tiderna per steg utan lås i mätvägen
+    """
+
+    def __init__(self, max_prov: int = 10_000):
+        self.max_prov = max_prov
+        self._prov: Dict[str, deque] = {}
+        self._lås = threading.Lock()
+
+    def registrera(self, steg: str, nanosekunder: int):
+        prov = self._prov.get(steg)
+        if prov is None:
+            with self._lås:
+                prov = self._prov.setdefault(steg, deque(maxlen=self.max_prov))
+        prov.append(nanosekunder)
+
+    def sammanfattning(self, percentiler: Iterable[float] = (0.5, 0.95, 0.99)) -> Dict[str, Dict[str, float]]:
+        """Percentiler i millisekunder och antal prov per steg, i den ordning stegen först registrerades"""
+        with self._lås:
+            prov = dict(self._prov)
+        resultat = {}
+        for steg, tider in prov.items():
+            sorterade = sorted(tider)
+            resultat[steg] = {f"p{round(p * 100)}_ms": percentil(sorterade, p) / 1e6 for p in percentiler}
+            resultat[steg]['antal'] = len(sorterade)
+        return resultat
@@ -0,0 +1,244 @@
+# Återupptagbar ommoderering av recensioner
+# Strömmar recensioner i id-ordning genom processpoolen och skriver utlåtanden och kontrollpunkt i samma transaktion
+
+import argparse
+import io
+import logging
+import os
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import islice
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from .batchmoderering import moderera_batch
+from .databasström import läs_strömmande
+
+logger = logging.getLogger(__name__)
+
+KONTROLLPUNKTSTABELL = "ommoderering_kontrollpunkter"
+
+
+@dataclass
+class Kontrollpunkt:
+    """Hur långt ett jobb har kommit: senast skrivna id och räknare sedan start"""
+    jobb: str
+    senaste_id: str
+    antal: int
+    godkända: int
+    regelversion: str
+    uppdaterad: str
+
+
+def skapa_sqlite_recensioner(anslutning):
+    """Recensionstabellen i en SQLite-databas, som lokal ersättning för PostgreSQL i tester och mätningar"""
+    anslutning.execute("""
+        CREATE TABLE IF NOT EXISTS recensioner (
+            id INTEGER PRIMARY KEY,
+            innehåll TEXT,
+            rubrik TEXT,
+            betyg INTEGER,
+            modererad BOOLEAN DEFAULT 0,
+            godkänd BOOLEAN DEFAULT 0
+        )
+    """)
+    anslutning.commit()
+
+
+class OmmodereringsJobb:
+    """
+    Modererar om alla recensioner med `moderering.moderera_recension`. Raderna
+    läses med en serverside-markör i id-ordning (keyset efter kontrollpunkten),
+    modereras i processpoolen och skrivs tillbaka batch för batch med
+    executemany, eller med COPY till en temporär tabell när drivrutinen stöder
+    det (psycopg2). Kontrollpunkten uppdateras i samma transaktion som batchen,
+    så ett avbrutet jobb fortsätter efter sista skrivna rad. Ändras
+    modereringens regelversion börjar jobbet om från början.
+
+    Använd gärna en separat `skriv_anslutning` mot PostgreSQL; med samma
+    anslutning måste serverside-markören hållas öppen över commit (WITH HOLD)
+    """
+
+    def __init__(self, moderering: Any, anslutning, skriv_anslutning=None, jobb: str = "recensioner",
+                 batch_storlek: int = 1000, bitstorlek: int = 256, processer: Optional[int] = None,
+                 platshållare: str = "%s", använd_copy: Optional[bool] = None):
+        self.moderering = moderering
+        self.anslutning = anslutning
+        self.skriv_anslutning = skriv_anslutning or anslutning
+        self.jobb = jobb
+        self.batch_storlek = batch_storlek
+        self.bitstorlek = bitstorlek
+        self.processer = processer
+        self.p = platshållare
+        self.använd_copy = använd_copy
+        self.regelversion = str(getattr(moderering, 'regelversion', ''))
+
+    def _skapa_kontrollpunktstabell(self):
+        markör = self.skriv_anslutning.cursor()
+        markör.execute(f"""
+            CREATE TABLE IF NOT EXISTS {KONTROLLPUNKTSTABELL} (
+                jobb TEXT PRIMARY KEY,
+                senaste_id TEXT NOT NULL,
+                antal INTEGER NOT NULL,
+                godkända INTEGER NOT NULL,
+                regelversion TEXT NOT NULL,
+                uppdaterad TEXT NOT NULL
+            )
+        """)
+        markör.close()
+        self.skriv_anslutning.commit()
+
+    def kontrollpunkt(self) -> Optional[Kontrollpunkt]:
+        """Jobbets sparade kontrollpunkt, None om jobbet inte har påbörjats"""
+        self._skapa_kontrollpunktstabell()
+        markör = self.skriv_anslutning.cursor()
+        markör.execute(f"SELECT jobb, senaste_id, antal, godkända, regelversion, uppdaterad "
+                       f"FROM {KONTROLLPUNKTSTABELL} WHERE jobb = {self.p}", (self.jobb,))
+        rad = markör.fetchone()
+        markör.close()
+        return Kontrollpunkt(*rad) if rad else None
+
+    def nollställ(self):
+        """Tar bort kontrollpunkten så att nästa körning börjar från första recensionen"""
+        self._skapa_kontrollpunktstabell()
+        markör = self.skriv_anslutning.cursor()
+        markör.execute(f"DELETE FROM {KONTROLLPUNKTSTABELL} WHERE jobb = {self.p}", (self.jobb,))
+        markör.close()
+        self.skriv_anslutning.commit()
+
+    def _recensioner(self, efter_id: Optional[str], id_i_luften: Deque[Any]) -> Iterator[Dict[str, Any]]:
+        if efter_id is None:
+            fråga, parametrar = "SELECT id, innehåll, rubrik, betyg FROM recensioner ORDER BY id", ()
+        else:
+            fråga = f"SELECT id, innehåll, rubrik, betyg FROM recensioner WHERE id > {self.p} ORDER BY id"
+            parametrar = (efter_id,)
+        for rad_id, innehåll, rubrik, betyg in läs_strömmande(self.anslutning, fråga, parametrar,
+                                                               batch_storlek=self.batch_storlek):
+            id_i_luften.append(rad_id)
+            recension = {'innehåll': innehåll or '', 'rubrik': rubrik or ''}
+            if betyg is not None:
+                recension['betyg'] = betyg
+            yield recension
+
+    def _skriv_batch(self, markör, batch: List[Tuple[bool, Any]]):
+        if self.använd_copy:
+            # Utlåtandena kopieras till en temporär tabell med samma kolumntyper och uppdateras i en sats
+            markör.execute("CREATE TEMP TABLE IF NOT EXISTS ommoderering_utlåtanden ON COMMIT DELETE ROWS "
+                           "AS SELECT id, godkänd FROM recensioner WITH NO DATA")
+            data = io.StringIO("".join(f"{rad_id}\t{'t' if godkänd else 'f'}\n" for godkänd, rad_id in batch))
+            markör.copy_expert("COPY ommoderering_utlåtanden (id, godkänd) FROM STDIN", data)
+            markör.execute("UPDATE recensioner AS r SET modererad = TRUE, godkänd = u.godkänd "
+                           "FROM ommoderering_utlåtanden AS u WHERE r.id = u.id")
+        else:
+            markör.executemany(f"UPDATE recensioner SET modererad = TRUE, godkänd = {self.p} WHERE id = {self.p}",
+                               batch)
+
+    def _spara_kontrollpunkt(self, markör, punkt: Kontrollpunkt):
+        p = self.p
+        markör.execute(
+            f"INSERT INTO {KONTROLLPUNKTSTABELL} (jobb, senaste_id, antal, godkända, regelversion, uppdaterad) "
+            f"VALUES ({p}, {p}, {p}, {p}, {p}, {p}) ON CONFLICT (jobb) DO UPDATE SET "
+            f"senaste_id = excluded.senaste_id, antal = excluded.antal, godkända = excluded.godkända, "
+            f"regelversion = excluded.regelversion, uppdaterad = excluded.uppdaterad",
+            (punkt.jobb, punkt.senaste_id, punkt.antal, punkt.godkända, punkt.regelversion, punkt.uppdaterad))
+
+    def kör(self, börja_om: bool = False, max_rader: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Kör jobbet från kontrollpunkten (eller från början) tills alla recensioner
+        är modererade eller `max_rader` rader har skrivits i denna körning.
+        Returnerar räknare för körningen och totalt sedan jobbet började
+        """
+        self._skapa_kontrollpunktstabell()
+        punkt = None if börja_om else self.kontrollpunkt()
+        if punkt is not None and punkt.regelversion != self.regelversion:
+            logger.info(f"Regelversionen har ändrats ({punkt.regelversion} -> {self.regelversion}), börjar om")
+            punkt = None
+        if punkt is None:
+            punkt = Kontrollpunkt(self.jobb, "", 0, 0, self.regelversion, "")
+            efter_id = None
+        else:
+            efter_id = punkt.senaste_id
+            logger.info(f"Fortsätter {self.jobb} efter id {efter_id} ({punkt.antal} redan modererade)")
+        if self.använd_copy is None:
+            markör = self.skriv_anslutning.cursor()
+            self.använd_copy = hasattr(markör, 'copy_expert')
+            markör.close()
+
+        id_i_luften: Deque[Any] = deque()
+        resultat = moderera_batch(self.moderering, self._recensioner(efter_id, id_i_luften),
+                                  bitstorlek=self.bitstorlek, processer=self.processer)
+        körning = {'modererade': 0, 'godkända': 0}
+        klar = False
+        try:
+            while not klar:
+                if max_rader is not None and körning['modererade'] >= max_rader:
+                    # Gränsen nådd; jobbet är ändå klart om inga recensioner återstår
+                    klar = next(resultat, None) is None
+                    break
+                antal = self.batch_storlek if max_rader is None else min(self.batch_storlek,
+                                                                        max_rader - körning['modererade'])
+                utlåtanden = list(islice(resultat, antal))
+                klar = len(utlåtanden) < antal
+                if not utlåtanden:
+                    break
+                batch = [(bool(utlåtande.get('godkänd')) and bool(utlåtande.get('recension_godkänd', True)),
+                          id_i_luften.popleft()) for utlåtande in utlåtanden]
+
+                godkända = sum(godkänd for godkänd, _ in batch)
+                punkt.senaste_id = str(batch[-1][1])
+                punkt.antal += len(batch)
+                punkt.godkända += godkända
+                punkt.uppdaterad = datetime.now().isoformat()
+
+                markör = self.skriv_anslutning.cursor()
+                try:
+                    self._skriv_batch(markör, batch)
+                    self._spara_kontrollpunkt(markör, punkt)
+                finally:
+                    markör.close()
+                self.skriv_anslutning.commit()
+
+                körning['modererade'] += len(batch)
+                körning['godkända'] += godkända
+                if körning['modererade'] % (10 * self.batch_storlek) < len(batch):
+                    logger.info(f"Ommoderering {self.jobb}: {punkt.antal} recensioner klara, senaste id {punkt.senaste_id}")
+        finally:
+            resultat.close()
+
+        return {**körning, 'totalt_modererade': punkt.antal, 'totalt_godkända': punkt.godkända,
+                'senaste_id': punkt.senaste_id or None,
+                'klar': klar}
+
+
+def moderera_recensioner_i_databas(moderering: Any, anslutning, skriv_anslutning=None,
+                                   batch_storlek: int = 1000, bitstorlek: int = 256,
+                                   processer: Optional[int] = None, platshållare: str = "%s") -> Dict[str, int]:
+    """Modererar om alla recensioner från början utan att fortsätta en tidigare körning, se OmmodereringsJobb"""
+    räknare = OmmodereringsJobb(moderering, anslutning, skriv_anslutning, batch_storlek=batch_storlek,
+                                bitstorlek=bitstorlek, processer=processer,
+                                platshållare=platshållare).kör(börja_om=True)
+    return {'modererade': räknare['modererade'], 'godkända': räknare['godkända']}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Modererar om alla recensioner, återupptas från kontrollpunkten")
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="PostgreSQL-DSN, standard $DATABASE_URL")
+    parser.add_argument("--batch-storlek", type=int, default=1000)
+    parser.add_argument("--processer", type=int, default=None)
+    parser.add_argument("--max-rader", type=int, default=None, help="avbryt efter så många rader i denna körning")
+    parser.add_argument("--borja-om", action="store_true", help="ignorera kontrollpunkten")
+    parser.add_argument("--executemany", action="store_true", help="skriv med executemany i stället för COPY")
+    args = parser.parse_args()
+
+    import psycopg2
+
+    from .analys import EmpatiModerering
+
+    logging.basicConfig(level=logging.INFO)
+    # Separata anslutningar så att läsmarkören inte påverkas av skrivningarnas commit
+    with psycopg2.connect(args.dsn) as läs, psycopg2.connect(args.dsn) as skriv:
+        jobb = OmmodereringsJobb(EmpatiModerering(), läs, skriv, batch_storlek=args.batch_storlek,
+                                 processer=args.processer, använd_copy=False if args.executemany else None)
+        räknare = jobb.kör(börja_om=args.borja_om, max_rader=args.max_rader)
+    logger.info(f"{'Klart' if räknare['klar'] else 'Avbrutet'}: {räknare['modererade']} recensioner i denna körning, "
+                f"{räknare['totalt_modererade']} totalt varav {räknare['totalt_godkända']} godkända")
@@ -0,0 +1,76 @@
+# Samplande profilering
+# En bakgrundstråd tar stickprov på en annan tråds anropsstack och räknar var tiden går
+
+import os
+import sys
+import threading
+from collections import Counter
+from typing import List, Optional, Tuple
+
+
+def _funktion(ram) -> str:
+    kod = ram.f_code
+    return f"{os.path.basename(kod.co_filename)}:{kod.co_firstlineno}({kod.co_name})"
+
+
+class Samplingsprofilerare:
+    """
+    Tar ett stickprov var `intervall_ms` på anropsstacken i tråden som startade
+    profileringen (eller `tråd_id`). Egen tid räknas på den innersta funktionen
+    och kumulativ tid på varje funktion i stacken. Stickproven tas mellan
+    bytena av GIL, så korta intervall begränsas av sys.getswitchinterval().
+    Kan användas som kontexthanterare
+    """
+
+    def __init__(self, intervall_ms: float = 1.0, tråd_id: Optional[int] = None):
+        self.intervall = intervall_ms / 1000
+        self.tråd_id = tråd_id
+        self.egen: Counter = Counter()
+        self.kumulativ: Counter = Counter()
+        self.antal_prov = 0
+        self._stoppa = threading.Event()
+        self._tråd: Optional[threading.Thread] = None
+
+    def starta(self) -> "Samplingsprofilerare":
+        if self._tråd is not None:
+            return self
+        if self.tråd_id is None:
+            self.tråd_id = threading.get_ident()
+        self._stoppa.clear()
+        self._tråd = threading.Thread(target=self._samla, name="profilering", daemon=True)
+        self._tråd.start()
+        return self
+
+    def stoppa(self):
+        self._stoppa.set()
+        if self._tråd is not None:
+            self._tråd.join()
+            self._tråd = None
+
+    def __enter__(self) -> "Samplingsprofilerare":
+        return self.starta()
+
+    def __exit__(self, *fel):
+        self.stoppa()
+
+    def _samla(self):
+        while not self._stoppa.wait(self.intervall):
+            ram = sys._current_frames().get(self.tråd_id)
+            if ram is None:
+                continue
+            self.egen[_funktion(ram)] += 1
+            sedda = set()
+            while ram is not None:
+                namn = _funktion(ram)
+                if namn not in sedda:
+                    sedda.add(namn)
+                    self.kumulativ[namn] += 1
+                ram = ram.f_back
+            self.antal_prov += 1
+
+    def rapport(self, antal: int = 15) -> List[Tuple[str, float, float]]:
+        """De `antal` funktioner med mest egen tid som (funktion, andel egen, andel kumulativ)"""
+        if not self.antal_prov:
+            return []
+        return [(namn, n / self.antal_prov, self.kumulativ[namn] / self.antal_prov)
+                for namn, n in self.egen.most_common(antal)]
@@ -0,0 +1,311 @@
+# Regelmotor för moderering
+# Nyckelord, fraser, persondatamönster och hotmönster kompileras en gång och söks i ett pass över texten
+
+import hashlib
+import json
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+# Persondatamönstren kräver siffror eller @, texter utan dem hoppar över det uttrycket
+_PERSONDATA_VAKT = re.compile(r"[\d@]")
+_ICKE_BLANKSTEG = re.compile(r"\S+")
+
+# Böjningsändelser per grundord, t.ex. hat -> hatar, problem -> problemen. Bara ord som
+# står här matchar böjda former; ändelserna är valda per ord så att "hat" inte
+# matchar "hatt" och "hot" inte "hotell". Ord utan post matchar bara exakt form
+BÖJNINGAR: Dict[str, Tuple[str, ...]] = {
+    # Kränkande språk
+    'hat': ("a", "ar", "ade", "at", "et"),
+    'hot': ("a", "ar", "ade", "at", "en", "et"),
+    'diskriminering': ("en", "ar", "arna"),
+    'mobbning': ("en",),
+    'trakasseri': ("er", "erna", "et"),
+    'dum': ("ma", "me", "t"),
+    'korkad': ("e", "a"),
+    'idiot': ("en", "er", "erna"),
+    'avskum': ("met",),
+    'värdelös': ("a", "t"),
+    # Empati och stöd
+    'respekt': ("en",),
+    'förståelse': ("n",),
+    'empati': ("n",),
+    'stöd': ("et", "ja", "jer", "de"),
+    'hjälp': ("a", "en", "er", "te"),
+    'tack': ("a", "ar", "ade"),
+    'uppskattning': ("en",),
+    'värdefull': ("a", "t"),
+    'viktig': ("a", "are", "aste", "t"),
+    'fantastisk': ("a", "t"),
+    'professionell': ("a", "t"),
+    'kompetent': ("a",),
+    'varm': ("a", "t"),
+    'utmärkt': ("a",),
+    'perfekt': ("a",),
+    # Negativt sentiment
+    'dålig': ("a", "t"),
+    'fruktansvärd': ("a", "t"),
+    'undvik': ("a", "er"),
+    'problem': ("en", "et", "ens", "ets"),
+    'fel': ("en", "et"),
+    'lösning': ("en", "ar", "arna"),
+    # Rolltermer
+    'diagnos': ("en", "er", "erna"),
+    'behandling': ("en", "ar", "arna"),
+    'terapi': ("n", "er"),
+    'medicin': ("en", "er", "erna"),
+    'brukare': ("n", "na"),
+    'omsorg': ("en",),
+    'assistans': ("en",),
+    'verksamhet': ("en", "er", "erna"),
+    'tjänst': ("en", "er", "erna"),
+    'insats': ("en", "er", "erna"),
+    'samhällsansvar': ("et",),
+}
+
+
+def regelversion(*delar: Any) -> str:
+    """Kort fingeravtryck av regeldata, ändras när någon regel eller inställning ändras"""
+    underlag = json.dumps(delar, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(underlag.encode('utf-8')).hexdigest()[:16]
+
+
+class Träff(NamedTuple):
+    """En regelträff med kategori, regelns term och position i texten"""
+    kategori: str
+    term: str
+    start: int
+    slut: int
+    text: str
+
+
+def _normalisera(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _trie_mönster(former: Iterable[str]) -> str:
+    """
+    Reguljärt uttryck för en mängd ord och fraser där gemensamma prefix delas,
+    så att motorn provar varje tecken en gång i stället för varje ord för sig.
+    Längre former prövas före kortare och blanksteg i fraser matchar \\s+
+    """
+    trie: Dict[str, dict] = {}
+    for form in former:
+        nod = trie
+        for tecken in form:
+            nod = nod.setdefault(tecken, {})
+        nod[""] = {}
+
+    def bygg(nod: Dict[str, dict]) -> str:
+        grenar = [(r"\s+" if tecken == " " else re.escape(tecken)) + bygg(barn)
+                  for tecken, barn in sorted(nod.items()) if tecken]
+        if not grenar:
+            return ""
+        kropp = grenar[0] if len(grenar) == 1 else "(?:" + "|".join(grenar) + ")"
+        if "" in nod:
+            return ("(?:" + kropp + ")?") if len(grenar) == 1 else kropp + "?"
+        return kropp
+
+    return bygg(trie)
+
+
+class Träffar:
+    """Alla träffar från en sökning, i textordning, med uppslag per kategori"""
+
+    def __init__(self, träffar: List[Träff], ordning: Mapping[Tuple[str, str], int]):
+        self.träffar = träffar
+        self._ordning = ordning
+        self._per_kategori: Dict[str, List[Träff]] = {}
+        for träff in träffar:
+            if träff.kategori in self._per_kategori:
+                self._per_kategori[träff.kategori].append(träff)
+            else:
+                self._per_kategori[träff.kategori] = [träff]
+
+    def __iter__(self) -> Iterator[Träff]:
+        return iter(self.träffar)
+
+    def __len__(self) -> int:
+        return len(self.träffar)
+
+    def i_kategori(self, kategori: str) -> Sequence[Träff]:
+        return self._per_kategori.get(kategori, ())
+
+    def har(self, kategori: str) -> bool:
+        return kategori in self._per_kategori
+
+    def termer(self, kategori: str) -> List[str]:
+        """Unika termer som träffats i kategorin, i regellistans ordning"""
+        träffar = self._per_kategori.get(kategori)
+        if not träffar:
+            return []
+        if len(träffar) == 1:
+            return [träffar[0].term]
+        return sorted({träff.term for träff in träffar}, key=lambda term: self._ordning[(kategori, term)])
+
+    def texter(self, kategori: str) -> List[str]:
+        """Den matchade texten för varje träff i kategorin, i textordning"""
+        return [träff.text for träff in self.i_kategori(kategori)]
+
+
+class Regelmotor:
+    """
+    Kompilerar regler i tre slag:
+
+    - `ordlistor`: ord och fraser som matchas på hela ord, där böjda former
+      räknas som grundordet för ord som har ändelser i `böjningar` (standard BÖJNINGAR)
+    - `villkor`: hotmönster som (utlösande ord, fortsättning), där fortsättningen
+      är ett reguljärt uttryck som prövas direkt efter de utlösande orden
+    - `mönster`: fria reguljära uttryck för persondata, t.ex. personnummer och e-post;
+      `mönster_början` är ett valfritt uttryck som gäller där varje sådan träff börjar
+
+    Alla ordformer och utlösande ord blir ett enda prefixdelat uttryck med
+    ordgränser som körs över texten i gemener; varje träff slås upp till sina
+    (kategori, term). Persondatamönstren är namngivna grupper i ett eget
+    uttryck som bara körs när texten innehåller siffror eller @. Längsta form
+    vinner, så "inte bra" räknas inte också som "bra". `version` är ett
+    fingeravtryck av alla regler och används som nyckeldel i resultatcacher
+    """
+
+    def __init__(self, ordlistor: Optional[Mapping[str, Sequence[str]]] = None,
+                 mönster: Optional[Mapping[str, Sequence[str]]] = None,
+                 villkor: Optional[Mapping[str, Sequence[Tuple[str, str]]]] = None,
+                 mönster_början: Optional[str] = None,
+                 böjningar: Optional[Mapping[str, Sequence[str]]] = None):
+        self.ordlistor = {kategori: list(termer) for kategori, termer in (ordlistor or {}).items()}
+        self.mönster = {kategori: list(uttryck) for kategori, uttryck in (mönster or {}).items()}
+        self.villkor = {kategori: list(par) for kategori, par in (villkor or {}).items()}
+        self.böjningar = {_normalisera(term): tuple(ändelser)
+                          for term, ändelser in (BÖJNINGAR if böjningar is None else böjningar).items()}
+        self.version = regelversion(self.ordlistor, self.mönster, self.villkor, mönster_början, self.böjningar)
+
+        self._ordning: Dict[Tuple[str, str], int] = {}
+
+        self._grupper: Dict[str, Tuple[str, str]] = {}
+        delar = []
+        for kategori, uttryck in self.mönster.items():
+            for i, mönstret in enumerate(uttryck):
+                namn = f"m{len(self._grupper)}"
+                self._grupper[namn] = (kategori, mönstret)
+                self._ordning.setdefault((kategori, mönstret), i)
+                delar.append(f"(?P<{namn}>{mönstret})")
+        alternativ = "|".join(delar)
+        if delar and mönster_början:
+            alternativ = f"(?=(?:{mönster_början}))(?:{alternativ})"
+        self.persondata_uttryck = re.compile(alternativ) if delar else None
+
+        # Varje form, även böjd, pekar på alla (kategori, grundord) den räknas som
+        former: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+        for kategori, termer in self.ordlistor.items():
+            for i, term in enumerate(termer):
+                term = _normalisera(term)
+                self._ordning.setdefault((kategori, term), i)
+                for ändelse in ("",) + self.böjningar.get(term, ()):
+                    if (kategori, term) not in former[term + ändelse]:
+                        former[term + ändelse].append((kategori, term))
+        self._former = dict(former)
+
+        # Villkor per träffad form som (ordindex där utlösaren börjar, kategori, term, fortsättning).
+        # En utlösare som avslutar en längre form ("kommer" i "jag kommer") prövas också då
+        utlösare: Dict[str, List[Tuple[str, str, "re.Pattern"]]] = defaultdict(list)
+        for kategori, par in self.villkor.items():
+            for i, (utlösande, fortsättning) in enumerate(par):
+                term = utlösande + fortsättning
+                self._ordning.setdefault((kategori, term), i)
+                utlösare[_normalisera(utlösande)].append((kategori, term, re.compile(fortsättning, re.IGNORECASE)))
+        self._villkor: Dict[str, List[Tuple[int, str, str, "re.Pattern"]]] = {}
+        for form in set(utlösare) | set(self._former):
+            ord_i_form = form.split(" ")
+            poster = [(k, *villkor) for k in range(len(ord_i_form))
+                      for villkor in utlösare.get(" ".join(ord_i_form[k:]), ())]
+            if poster:
+                self._villkor[form] = poster
+
+        self.uttryck = re.compile(rf"\b(?:{_trie_mönster(set(self._former) | set(utlösare))})\b")
+        self._uttryck_utan_skiftläge = None
+
+    def sök(self, text: str) -> Träffar:
+        """Alla träffar i texten, sorterade på position"""
+        träffar = []
+        if self.persondata_uttryck is not None and _PERSONDATA_VAKT.search(text):
+            for m in self.persondata_uttryck.finditer(text):
+                kategori, term = self._grupper[m.lastgroup]
+                träffar.append(Träff(kategori, term, m.start(), m.end(), m.group()))
+        sortera = bool(träffar)
+
+        # Positionerna i gemener gäller originaltexten så länge längden är oförändrad
+        gemener = text.lower()
+        if len(gemener) == len(text):
+            uttryck = self.uttryck
+        else:
+            if self._uttryck_utan_skiftläge is None:
+                self._uttryck_utan_skiftläge = re.compile(self.uttryck.pattern, re.IGNORECASE)
+            uttryck, gemener = self._uttryck_utan_skiftläge, text
+
+        former, villkor = self._former, self._villkor
+        for m in uttryck.finditer(gemener):
+            form = m.group()
+            if not form.isalpha():
+                form = _normalisera(form)
+            start, slut = m.span()
+            if form in villkor:
+                ordstarter = [start + o.start() for o in _ICKE_BLANKSTEG.finditer(m.group())]
+                for k, kategori, term, fortsättning in villkor[form]:
+                    fortsatt = fortsättning.match(gemener, slut)
+                    if fortsatt:
+                        början = ordstarter[k]
+                        träffar.append(Träff(kategori, term, början, fortsatt.end(), text[början:fortsatt.end()]))
+                        sortera = True
+            poster = former.get(form)
+            if poster:
+                träfftext = text[start:slut]
+                träffar.extend([Träff(kategori, term, start, slut, träfftext) for kategori, term in poster])
+
+        if sortera:
+            träffar.sort(key=lambda träff: träff.start)
+        return Träffar(träffar, self._ordning)
+
+    def samla(self, träffar: Iterable[Träff]) -> Träffar:
+        """Träffar från flera sökningar, t.ex. delar av en lång text, som en gemensam Träffar"""
+        return Träffar(sorted(träffar, key=lambda träff: träff.start), self._ordning)
+
+    def ändringar(self, text: str, kategori: str, ersättningar: Mapping[str, str],
+                  träffar: Optional[Träffar] = None) -> List[Tuple[int, int, str]]:
+        """
+        Ersättningar för oböjda träffar i `kategori` enligt `ersättningar` (term -> ny text)
+        som (start, slut, ny text) i textordning, med stor begynnelsebokstav bevarad
+        """
+        träffar = träffar if träffar is not None else self.sök(text)
+        resultat, position = [], 0
+        for träff in träffar.i_kategori(kategori):
+            ny = ersättningar.get(träff.term)
+            if ny is None or träff.start < position or _normalisera(träff.text) != träff.term:
+                continue
+            if träff.text[:1].isupper():
+                ny = ny[:1].upper() + ny[1:]
+            resultat.append((träff.start, träff.slut, ny))
+            position = träff.slut
+        return resultat
+
+    def ersätt(self, text: str, kategori: str, ersättningar: Mapping[str, str],
+               träffar: Optional[Träffar] = None) -> str:
+        """Byter ut oböjda träffar i `kategori`, se ändringar. Återanvänder `träffar` om de redan finns"""
+        return foga_in(text, self.ändringar(text, kategori, ersättningar, träffar))
+
+
+def foga_in(text: str, ändringar: Iterable[Tuple[int, int, str]]) -> str:
+    """
+    Bygger ny text av (start, slut, ny text) sorterade på start i en enda join.
+    Ändringar som överlappar en tidigare hoppas över
+    """
+    delar, position = [], 0
+    for start, slut, ny in ändringar:
+        if start < position:
+            continue
+        delar.append(text[position:start])
+        delar.append(ny)
+        position = slut
+    if not delar:
+        return text
+    delar.append(text[position:])
+    return "".join(delar)
@@ -0,0 +1,116 @@
+# Cache för rekommendationsresultat
+# Nycklad på ett fingeravtryck av poängsättande profilfält och katalogens version
+
+import hashlib
+import json
+import threading
+import time
+from dataclasses import asdict, is_dataclass
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .cache import LRUCache
+
+
+def profil_fingeravtryck(användar_profil: Any, **parametrar: Any) -> str:
+    """
+    Stabil hash av de fält som påverkar poängsättningen (kommun, diagnoser, behov,
+    åldersgrupp och koordinater) samt sökparametrarna. Ordning och dubbletter i
+    listorna spelar ingen roll, precis som i matchningen
+    """
+    for namn, värde in list(parametrar.items()):
+        if is_dataclass(värde):
+            parametrar[namn] = asdict(värde)
+    underlag = {
+        'kommun': användar_profil.kommun,
+        'diagnoser': sorted(set(användar_profil.diagnoser or ())),
+        'behov': sorted(set(användar_profil.behov or ())),
+        'åldersgrupp': användar_profil.åldersgrupp,
+        'koordinater': list(användar_profil.koordinater) if användar_profil.koordinater else None,
+        'parametrar': parametrar,
+    }
+    text = json.dumps(underlag, sort_keys=True, ensure_ascii=False, default=list)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+_KATALOGFÄLT = attrgetter('verksamhet_id', 'typ', 'kommun', 'åldersgrupp', 'koordinater',
+                          'diagnoser', 'tjänster', 'beskrivning', 'recensioner')
+
+
+def recensions_fingeravtryck(recensioner: Optional[Sequence[Dict[str, Any]]]) -> int:
+    """
+    Fingeravtryck av en verksamhets recensioner i ordning: id, betyg och text.
+    En ny, borttagen eller redigerad recension ger ett nytt värde
+    """
+    return hash(tuple([(recension.get('id'), recension.get('betyg'), recension.get('innehåll'))
+                       for recension in recensioner or ()]))
+
+
+def katalog_fingeravtryck(verksamheter: Sequence[Any]) -> int:
+    """
+    Fingeravtryck av katalogens innehåll i ordning: id, fälten som påverkar
+    matchningen och textsökningen samt recensionernas innehåll per verksamhet.
+    Samma innehåll i en ny lista ger samma värde, en redigerad verksamhet eller
+    recension ett nytt. Bygger på Pythons hash och gäller därför bara inom processen
+    """
+    return hash(tuple([(verksamhet_id, typ, kommun, åldersgrupp, tuple(koordinater) if koordinater else None,
+                        *(diagnoser or ()), None, *(tjänster or ()), beskrivning,
+                        recensions_fingeravtryck(recensioner))
+                       for verksamhet_id, typ, kommun, åldersgrupp, koordinater, diagnoser, tjänster, beskrivning,
+                       recensioner in map(_KATALOGFÄLT, verksamheter)]))
+
+
+class RekommendationsCache:
+    """
+    LRU-cache för topplistor. Varje post bär katalogversionen den beräknades mot
+    och en utgångstid; poster från en äldre version eller efter TTL räknas som missar
+    """
+
+    def __init__(self, ttl_sekunder: float = 300.0, max_storlek: int = 10_000,
+                 klocka: Callable[[], float] = time.monotonic):
+        self.ttl_sekunder = ttl_sekunder
+        self.minne = LRUCache(max_storlek)
+        self._klocka = klocka
+        self._lås = threading.Lock()
+        self.träffar = 0
+        self.missar = 0
+        self.utgångna = 0
+        self.inaktuella = 0
+
+    def hämta(self, fingeravtryck: str, katalogversion: int) -> Optional[List[Tuple[str, float]]]:
+        """Sparad topplista om den är beräknad mot `katalogversion` och inte gått ut"""
+        post = self.minne.hämta(fingeravtryck)
+        with self._lås:
+            if post is None:
+                self.missar += 1
+                return None
+            version, utgång, resultat = post
+            if version != katalogversion:
+                self.inaktuella += 1
+                self.missar += 1
+                return None
+            if self._klocka() >= utgång:
+                self.utgångna += 1
+                self.missar += 1
+                return None
+            self.träffar += 1
+        return list(resultat)
+
+    def spara(self, fingeravtryck: str, katalogversion: int, resultat: List[Tuple[str, float]]):
+        self.minne.spara(fingeravtryck, (katalogversion, self._klocka() + self.ttl_sekunder, tuple(resultat)))
+
+    def töm(self):
+        self.minne.töm()
+
+    def statistik(self) -> Dict[str, Any]:
+        """Träffar och missar, där missar delas upp i utgångna och inaktuella (äldre katalog)"""
+        with self._lås:
+            uppslag = self.träffar + self.missar
+            return {
+                'träffar': self.träffar,
+                'missar': self.missar,
+                'utgångna': self.utgångna,
+                'inaktuella': self.inaktuella,
+                'träffgrad': self.träffar / uppslag if uppslag else 0.0,
+                'poster': len(self.minne)
+            }
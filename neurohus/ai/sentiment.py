@@ -0,0 +1,263 @@
+# Batchad sentimentanalys
+# Poängsätter många texter per anrop till pipelinen och redovisar bortfall
+
+import hashlib
+import logging
+import os
+import threading
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from .cache import LRUCache, SqliteLager
+from .modeller import hämta_sentiment_analyzer, sentiment_modell_id
+
+logger = logging.getLogger(__name__)
+
+# Modellens tokengräns och ett försiktigt antal ord per bit (svenska ord blir ofta flera tokens)
+MAX_TOKENS = 512
+ORD_PER_BIT = 200
+
+_delad_cache = None
+_delad_lås = threading.Lock()
+
+
+@dataclass
+class SentimentResultat:
+    """Resultat från batchad poängsättning, en poäng och ev. bortfallsorsak per inskickad text"""
+    poäng: List[Optional[float]]
+    orsaker: List[Optional[str]] = field(default_factory=list)
+    antal_uppdelade: int = 0
+
+    @property
+    def bortfall(self) -> Dict[str, int]:
+        return dict(Counter(orsak for orsak in self.orsaker if orsak))
+
+    @property
+    def antal_bortfall(self) -> int:
+        return sum(1 for orsak in self.orsaker if orsak)
+
+
+class SentimentCache:
+    """
+    Cache för sentimentpoäng nycklad på (modell-id, hash av normaliserad text)
+    LRU i minnet framför ett valfritt SQLite-lager på disk
+    """
+
+    def __init__(self, sökväg: Optional[str] = None, max_i_minnet: int = 50_000):
+        self.minne = LRUCache(max_i_minnet)
+        self.lager = SqliteLager(sökväg, tabell="sentiment") if sökväg else None
+        self._lås = threading.Lock()
+        self.minnesträffar = 0
+        self.diskträffar = 0
+        self.missar = 0
+
+    @classmethod
+    def från_miljö(cls) -> "SentimentCache":
+        """Skapar cache med disklager om NEUROHUS_SENTIMENT_CACHE anger en sökväg"""
+        return cls(sökväg=os.getenv("NEUROHUS_SENTIMENT_CACHE"))
+
+    @classmethod
+    def delad(cls) -> "SentimentCache":
+        """Processgemensam cache som delas av alla analysinstanser"""
+        global _delad_cache
+        with _delad_lås:
+            if _delad_cache is None:
+                _delad_cache = cls.från_miljö()
+        return _delad_cache
+
+    @staticmethod
+    def nyckel(text: str, modell_id: str) -> str:
+        """Stabil nyckel, oberoende av Unicode-form och överflödiga blanksteg"""
+        normaliserad = " ".join(unicodedata.normalize("NFC", text).split())
+        return f"{modell_id}:{hashlib.sha256(normaliserad.encode('utf-8')).hexdigest()}"
+
+    def hämta_många(self, nycklar: List[str]) -> Dict[str, float]:
+        """Slår upp nycklar i minnet och sedan på disk"""
+        funna: Dict[str, float] = {}
+        saknas = []
+        for nyckel in nycklar:
+            värde = self.minne.hämta(nyckel)
+            if värde is None:
+                saknas.append(nyckel)
+            else:
+                funna[nyckel] = värde
+        minnesträffar = len(funna)
+
+        if saknas and self.lager:
+            från_disk = self.lager.hämta_många(saknas)
+            for nyckel, värde in från_disk.items():
+                self.minne.spara(nyckel, värde)
+            funna.update(från_disk)
+
+        with self._lås:
+            self.minnesträffar += minnesträffar
+            self.diskträffar += len(funna) - minnesträffar
+            self.missar += len(nycklar) - len(funna)
+        return funna
+
+    def spara_många(self, poäng: Dict[str, float]):
+        for nyckel, värde in poäng.items():
+            self.minne.spara(nyckel, värde)
+        if self.lager:
+            self.lager.spara_många(poäng.items())
+
+    def statistik(self) -> Dict[str, Any]:
+        """Träffräknare, sparade modellanrop syns som minnes- plus diskträffar"""
+        uppslag = self.minnesträffar + self.diskträffar + self.missar
+        return {
+            'minnesträffar': self.minnesträffar,
+            'diskträffar': self.diskträffar,
+            'missar': self.missar,
+            'träffgrad': (self.minnesträffar + self.diskträffar) / uppslag if uppslag else 0.0,
+            'poster_i_minnet': len(self.minne)
+        }
+
+
+def till_sentiment_poäng(resultat: Dict[str, Any]) -> float:
+    """Omvandlar pipelinens etikett och sannolikhet till poäng 0-1"""
+    return resultat['score'] if resultat['label'] == 'POSITIVE' else 1 - resultat['score']
+
+
+def dela_upp_text(text: str, ord_per_bit: int = ORD_PER_BIT) -> List[str]:
+    """Delar upp långa texter i bitar om högst `ord_per_bit` ord"""
+    ord_lista = text.split()
+    if len(ord_lista) <= ord_per_bit:
+        return [text]
+    return [" ".join(ord_lista[i:i + ord_per_bit])
+            for i in range(0, len(ord_lista), ord_per_bit)]
+
+
+def poängsätt_texter(texter: Iterable[str], analyzer=None,
+                     batch_storlek: int = 32,
+                     max_tokens: int = MAX_TOKENS,
+                     ord_per_bit: int = ORD_PER_BIT,
+                     cache: Optional[SentimentCache] = None) -> SentimentResultat:
+    """
+    Poängsätter texter i batchar mot sentimentpipelinen
+    Långa texter delas i bitar vars poäng viktas efter längd, och
+    texter som inte kan poängsättas räknas per orsak i `bortfall`.
+    Med `cache` skickas bara texter utan sparad poäng till modellen.
+    """
+    texter = list(texter)
+    if cache is not None:
+        return _poängsätt_med_cache(texter, cache, analyzer=analyzer,
+                                    batch_storlek=batch_storlek, max_tokens=max_tokens,
+                                    ord_per_bit=ord_per_bit)
+
+    poäng: List[Optional[float]] = [None] * len(texter)
+    orsaker: List[Optional[str]] = [None] * len(texter)
+
+    if analyzer is None:
+        try:
+            analyzer = hämta_sentiment_analyzer()
+        except Exception as e:
+            logger.error(f"Sentimentmodell kunde inte laddas: {e}")
+            return SentimentResultat(poäng=poäng, orsaker=['modell_otillgänglig'] * len(texter))
+
+    # Platta ut alla bitar och kom ihåg vilken text de hör till
+    bitar, ägare, vikter = [], [], []
+    antal_uppdelade = 0
+    for i, text in enumerate(texter):
+        if not text or not text.strip():
+            orsaker[i] = 'tom_text'
+            continue
+        delar = dela_upp_text(text, ord_per_bit)
+        if len(delar) > 1:
+            antal_uppdelade += 1
+        for del_text in delar:
+            bitar.append(del_text)
+            ägare.append(i)
+            vikter.append(len(del_text))
+
+    bit_poäng = _kör_i_batchar(analyzer, bitar, batch_storlek, max_tokens)
+
+    summor: Dict[int, float] = {}
+    viktsummor: Dict[int, int] = {}
+    for bit_index, resultat in enumerate(bit_poäng):
+        i = ägare[bit_index]
+        if isinstance(resultat, str):
+            orsaker[i] = orsaker[i] or resultat
+            continue
+        summor[i] = summor.get(i, 0.0) + resultat * vikter[bit_index]
+        viktsummor[i] = viktsummor.get(i, 0) + vikter[bit_index]
+
+    for i, summa in summor.items():
+        if orsaker[i] is None:
+            poäng[i] = summa / viktsummor[i]
+
+    resultat = SentimentResultat(poäng=poäng, orsaker=orsaker, antal_uppdelade=antal_uppdelade)
+    if resultat.antal_bortfall:
+        logger.warning(f"Sentimentanalys: {resultat.antal_bortfall} av {len(texter)} texter föll bort {resultat.bortfall}")
+    return resultat
+
+
+def _poängsätt_med_cache(texter: List[str], cache: SentimentCache,
+                         **kwargs) -> SentimentResultat:
+    """Slår upp texter i cachen och poängsätter endast unika missar"""
+    modell_id = sentiment_modell_id()
+    poäng: List[Optional[float]] = [None] * len(texter)
+    orsaker: List[Optional[str]] = [None] * len(texter)
+    nycklar: Dict[int, str] = {}
+    for i, text in enumerate(texter):
+        if not text or not text.strip():
+            orsaker[i] = 'tom_text'
+        else:
+            nycklar[i] = cache.nyckel(text, modell_id)
+
+    sparade = cache.hämta_många(list(dict.fromkeys(nycklar.values())))
+
+    # Varje unik text som saknas poängsätts en gång
+    saknade: Dict[str, str] = {}
+    for i, nyckel in nycklar.items():
+        if nyckel not in sparade and nyckel not in saknade:
+            saknade[nyckel] = texter[i]
+
+    # Vid bara träffar behöver modellen inte laddas alls
+    nya_orsaker: Dict[str, Optional[str]] = {}
+    antal_uppdelade = 0
+    if saknade:
+        resultat = poängsätt_texter(list(saknade.values()), **kwargs)
+        nya_orsaker = dict(zip(saknade, resultat.orsaker))
+        nya = {nyckel: värde for nyckel, värde in zip(saknade, resultat.poäng) if värde is not None}
+        cache.spara_många(nya)
+        sparade.update(nya)
+        antal_uppdelade = resultat.antal_uppdelade
+
+    for i, nyckel in nycklar.items():
+        poäng[i] = sparade.get(nyckel)
+        if poäng[i] is None:
+            orsaker[i] = nya_orsaker.get(nyckel) or 'okänt'
+
+    return SentimentResultat(poäng=poäng, orsaker=orsaker, antal_uppdelade=antal_uppdelade)
+
+
+def _kör_i_batchar(analyzer, bitar: List[str], batch_storlek: int,
+                   max_tokens: int) -> List[Any]:
+    """Returnerar poäng per bit, eller felorsak som sträng för bitar som misslyckades"""
+    resultat: List[Any] = []
+    # Skicka flera batchar per anrop så att pipelinen kan fylla sina batchar själv
+    block = max(batch_storlek * 8, 1)
+
+    for start in range(0, len(bitar), block):
+        block_bitar = bitar[start:start + block]
+        try:
+            utdata = analyzer(block_bitar, batch_size=batch_storlek,
+                              truncation=True, max_length=max_tokens)
+            resultat.extend([till_sentiment_poäng(_första(r)) for r in utdata])
+        except Exception:
+            # Isolera felet genom att köra blockets bitar en och en
+            for bit in block_bitar:
+                try:
+                    utdata = analyzer(bit, truncation=True, max_length=max_tokens)
+                    resultat.append(till_sentiment_poäng(_första(utdata)))
+                except Exception as e:
+                    resultat.append(f"fel_{type(e).__name__}")
+
+    return resultat
+
+
+def _första(utdata: Any) -> Dict[str, Any]:
+    """Pipelinen returnerar ibland en lista per text, ibland ett dict"""
+    return utdata[0] if isinstance(utdata, list) else utdata
@@ -0,0 +1,83 @@
+# Spatialt index över verksamheters koordinater
+# Radie- och närmaste-granne-sökning med storcirkelavstånd för avståndsmedveten matchning
+
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+JORDRADIE_KM = 6371.0088
+
+# Närhetspoängen avtar exponentiellt med avståndet ner mot golvet
+NÄRHET_SKALA_KM = 20.0
+NÄRHET_GOLV = 0.3
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Storcirkelavstånd i km, fungerar för skalärer och arrayer"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * JORDRADIE_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def närhetspoäng(avstånd_km, skala_km: float = NÄRHET_SKALA_KM):
+    """
+    Kontinuerlig ersättning för kommunmatchningens 1.0/0.3: 1.0 på noll km
+    och avtagande mot samma golv (0.3) som annan kommun gav tidigare
+    """
+    return NÄRHET_GOLV + (1.0 - NÄRHET_GOLV) * np.exp(-np.asarray(avstånd_km) / skala_km)
+
+
+def _enhetsvektorer(latituder: np.ndarray, longituder: np.ndarray) -> np.ndarray:
+    lat, lon = np.radians(latituder), np.radians(longituder)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _korda(avstånd_km: float) -> float:
+    """Kordalängd på enhetssfären för ett storcirkelavstånd, monoton i avståndet"""
+    return 2 * np.sin(min(avstånd_km / JORDRADIE_KM, np.pi) / 2)
+
+
+class SpatialtIndex:
+    """
+    KD-träd över punkter på enhetssfären. Rader utan koordinater (NaN) tas inte
+    med och returneras aldrig; radnummer avser ordningen i indata
+    """
+
+    def __init__(self, latituder: np.ndarray, longituder: np.ndarray):
+        self.latituder = np.asarray(latituder, dtype=np.float64)
+        self.longituder = np.asarray(longituder, dtype=np.float64)
+        self.rader = np.flatnonzero(np.isfinite(self.latituder) & np.isfinite(self.longituder))
+        self._träd = cKDTree(_enhetsvektorer(self.latituder[self.rader], self.longituder[self.rader]))
+
+    def __len__(self) -> int:
+        return len(self.rader)
+
+    def avstånd(self, lat: float, lon: float, rader: Optional[np.ndarray] = None) -> np.ndarray:
+        """Avstånd i km till alla rader (eller `rader`), NaN där koordinater saknas"""
+        if rader is None:
+            return haversine_km(lat, lon, self.latituder, self.longituder)
+        return haversine_km(lat, lon, self.latituder[rader], self.longituder[rader])
+
+    def inom_radie(self, lat: float, lon: float, radie_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Rader inom `radie_km`, i stigande radordning, och deras avstånd i km"""
+        punkt = _enhetsvektorer(np.array([lat]), np.array([lon]))[0]
+        träffar = np.asarray(self._träd.query_ball_point(punkt, _korda(radie_km)), dtype=np.int64)
+        rader = np.sort(self.rader[träffar])
+        avstånd = self.avstånd(lat, lon, rader)
+        inom = avstånd <= radie_km
+        return rader[inom], avstånd[inom]
+
+    def närmaste(self, lat: float, lon: float, k: int = 10,
+                 max_avstånd_km: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """De `k` närmaste raderna, närmast först, och deras avstånd i km"""
+        k = min(k, len(self.rader))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        punkt = _enhetsvektorer(np.array([lat]), np.array([lon]))[0]
+        gräns = _korda(max_avstånd_km) if max_avstånd_km is not None else np.inf
+        _, index = self._träd.query(punkt, k=k, distance_upper_bound=gräns)
+        index = np.atleast_1d(index)
+        index = index[index < len(self.rader)]
+        rader = self.rader[index]
+        return rader, self.avstånd(lat, lon, rader)
@@ -0,0 +1,137 @@
+# Strömmande moderering av långa texter
+# Texten granskas i överlappande bitar, varje bit ger ett delresultat och granskningen kan avbrytas vid första hot eller personuppgift
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Union
+
+from .regelmotor import Träff, foga_in
+
+# Träffar i dessa kategorier gör att texten underkänns oavsett övriga poäng
+BLOCKERANDE = ('hot', 'personuppgift')
+
+
+@dataclass
+class Delresultat:
+    """Granskad del av texten [start, slut) med nya träffar och maskerad text för just den delen"""
+    start: int
+    slut: int
+    träffar: List[Träff]
+    maskerad_text: str
+    blockerande: List[Träff] = field(default_factory=list)
+
+
+def _sista_blanksteg(text: str, före: int, efter: int = 0) -> int:
+    """Position efter sista blanksteget i text[efter:före], -1 om det saknas"""
+    for i in range(före - 1, efter - 1, -1):
+        if text[i].isspace():
+            return i + 1
+    return -1
+
+
+class StrömModerering:
+    """
+    Modererar en sträng eller en ström av textdelar (t.ex. en fil) i bitar om
+    högst `bitstorlek` tecken som skärs vid blanksteg och överlappar med
+    `överlapp` tecken. Varje träff rapporteras en gång, av den bit där den
+    börjar före överlappet, så träffar kortare än överlappet hittas även när de
+    ligger över en bitgräns. Med `avbryt_vid_blockering` slutar läsningen efter
+    den bit där ett hot eller en personuppgift hittades.
+
+    Iterera för att få Delresultat i textordning; `resultat()` ger sedan samma
+    bedömning som moderera_text för den granskade delen, utan hela texten i minnet
+    """
+
+    def __init__(self, moderering: Any, text: Union[str, Iterable[str]], användare_roll: str = 'användare',
+                 bitstorlek: int = 8192, överlapp: int = 256, avbryt_vid_blockering: bool = True):
+        if bitstorlek <= 4 * överlapp:
+            raise ValueError("bitstorlek måste vara större än fyra gånger överlappet")
+        self.moderering = moderering
+        self.delar = iter([text]) if isinstance(text, str) else iter(text)
+        self.användare_roll = användare_roll
+        self.bitstorlek = bitstorlek
+        self.överlapp = överlapp
+        self.avbryt_vid_blockering = avbryt_vid_blockering
+        self.träffar: List[Träff] = []
+        self.granskade_tecken = 0
+        self.avbruten = False
+        self._påbörjad = False
+
+    def _bitar(self) -> Iterator[tuple]:
+        """(global start, bit, gräns i biten där överlappet börjar) tills texten är slut"""
+        # Bufferten läses från index `i` och kortas bara när mer text läses in,
+        # så en lång sträng kopieras inte om för varje bit
+        buffert, i, början, slut_på_text = "", 0, 0, False
+        while True:
+            if not slut_på_text and len(buffert) - i < self.bitstorlek:
+                delar = [buffert[i:]]
+                längd = len(delar[0])
+                while längd < self.bitstorlek:
+                    try:
+                        delar.append(next(self.delar))
+                    except StopIteration:
+                        slut_på_text = True
+                        break
+                    längd += len(delar[-1])
+                buffert, i = "".join(delar), 0
+            if slut_på_text and len(buffert) - i <= self.bitstorlek:
+                if len(buffert) > i:
+                    yield början, buffert[i:], len(buffert) - i
+                return
+
+            # Skär vid sista blanksteget så att ordgränserna i biten stämmer med hela texten
+            bit = buffert[i:i + self.bitstorlek]
+            skärning = _sista_blanksteg(bit, self.bitstorlek, self.bitstorlek // 2)
+            if skärning < 0:
+                skärning = self.bitstorlek
+            gräns = skärning - self.överlapp
+            yield början, bit[:skärning], gräns
+
+            # Nästa bit börjar vid ordet som innehåller gränsen
+            nästa = _sista_blanksteg(bit, gräns, gräns - self.överlapp)
+            nästa = gräns if nästa < 0 else nästa
+            i += nästa
+            början += nästa
+
+    def __iter__(self) -> Iterator[Delresultat]:
+        if self._påbörjad:
+            raise RuntimeError("En StrömModerering kan bara itereras en gång")
+        self._påbörjad = True
+        regler, maskerare = self.moderering.regler, self.moderering.maskerare
+        position = 0
+        for början, bit, gräns in self._bitar():
+            lokal_position = position - början
+            träffar = regler.sök(bit)
+            nya = [träff for träff in träffar if lokal_position <= träff.start < gräns]
+            spann = [s for s in maskerare.spann_från_träffar(träffar) if lokal_position <= s.start < gräns]
+
+            # Delen sträcker sig förbi gränsen om en maskerad personuppgift gör det
+            slut = max([gräns] + [s.slut for s in spann])
+            maskerad = bit[lokal_position:slut]
+            if spann:
+                maskerad = foga_in(maskerad, [(start - lokal_position, stopp - lokal_position, etikett)
+                                              for start, stopp, etikett in maskerare.ändringar(spann)])
+
+            globala = [Träff(kategori, term, start + början, stopp + början, träfftext)
+                       for kategori, term, start, stopp, träfftext in nya]
+            blockerande = [träff for träff in globala if träff.kategori in BLOCKERANDE]
+            self.träffar.extend(globala)
+            position = början + slut
+            self.granskade_tecken = position
+            yield Delresultat(början + lokal_position, position, globala, maskerad, blockerande)
+
+            if blockerande and self.avbryt_vid_blockering:
+                self.avbruten = True
+                return
+
+    def resultat(self) -> Dict[str, Any]:
+        """Bedömning av allt som granskats hittills, med samma poäng och delresultat som moderera_text"""
+        träffar = self.moderering.regler.samla(self.träffar)
+        resultat = self.moderering._bedöm("", self.användare_roll, träffar, längd=self.granskade_tecken)
+        resultat.update({
+            'granskade_tecken': self.granskade_tecken,
+            'avbruten': self.avbruten,
+            'blockerande_träffar': [träff.text for träff in self.träffar if träff.kategori in BLOCKERANDE],
+            'modererings_datum': datetime.now().isoformat()
+        })
+        return resultat
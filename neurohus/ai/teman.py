@@ -0,0 +1,230 @@
+# Inkrementell temaanalys
+# Håller termstatistik per korpus så att nya poster uppdaterar toppteman utan omvektorisering
+
+import hashlib
+import json
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+
+
+# Ett dokuments bidrag: kolumner, antal per kolumn och l2-normen av hela termvektorn
+Bidrag = Tuple[np.ndarray, np.ndarray, float]
+
+_TOMT_BIDRAG: Bidrag = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64), 1.0)
+
+
+def _innehållshash(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=8).hexdigest()
+
+
+class TemaIndex:
+    """
+    Beständig vokabulär med löpande summor per term:
+    dokumentfrekvens, rå termfrekvens och summan av l2-normerad tf per dokument.
+    Temapoängen motsvarar kolumnmedelvärdet i en TF-IDF-matris (tf-normering
+    görs före idf-viktning eftersom idf förändras när korpusen växer).
+    Varje posts bidrag sparas under sin nyckel så att ändrade och borttagna
+    poster kan dras av. När vokabulären passerar `max_termer` behålls bara
+    den vanligare halvan; de bortbeskurna termerna är för ovanliga för att
+    konkurrera om `max_features` och räknas från noll om de dyker upp igen
+    """
+
+    def __init__(self, ngram_range: Tuple[int, int] = (1, 2), max_features: Optional[int] = 500,
+                 max_termer: Optional[int] = None):
+        self.ngram_range = tuple(ngram_range)
+        self.max_features = max_features
+        self.max_termer = max_termer if max_termer is not None else max(50_000, 20 * (max_features or 0))
+        self._analyserare = CountVectorizer(ngram_range=self.ngram_range).build_analyzer()
+        self.vokabulär: Dict[str, int] = {}
+        self._termer: List[str] = []
+        self._dokumentfrekvens = np.zeros(1024, dtype=np.int64)
+        self._termfrekvens = np.zeros(1024, dtype=np.int64)
+        self._tf_summa = np.zeros(1024, dtype=np.float64)
+        self.antal_dokument = 0
+        # Postnyckel -> (innehållshash, kolumner, antal, norm)
+        self._poster: Dict[str, Tuple[str, np.ndarray, np.ndarray, float]] = {}
+
+    def _index_för(self, term: str) -> int:
+        index = self.vokabulär.get(term)
+        if index is None:
+            index = len(self._termer)
+            self.vokabulär[term] = index
+            self._termer.append(term)
+        return index
+
+    def _säkerställ_kapacitet(self):
+        behov = len(self._termer)
+        if behov <= len(self._tf_summa):
+            return
+        ny_storlek = max(behov, len(self._tf_summa) * 2)
+        for attribut in ("_dokumentfrekvens", "_termfrekvens", "_tf_summa"):
+            gammal = getattr(self, attribut)
+            ny = np.zeros(ny_storlek, dtype=gammal.dtype)
+            ny[:len(gammal)] = gammal
+            setattr(self, attribut, ny)
+
+    def _räkna(self, text: str) -> Bidrag:
+        räkning = Counter(self._analyserare(text))
+        if not räkning:
+            return _TOMT_BIDRAG
+        norm = float(np.sqrt(sum(n * n for n in räkning.values())))
+        kolumner = np.fromiter((self._index_för(term) for term in räkning), dtype=np.int64, count=len(räkning))
+        antal = np.fromiter(räkning.values(), dtype=np.float64, count=len(räkning))
+        return kolumner, antal, norm
+
+    def _uppdatera(self, bidrag: List[Bidrag], tecken: int):
+        """Lägger till (tecken 1) eller drar av (tecken -1) dokumentens bidrag i ett svep"""
+        bidrag = [b for b in bidrag if len(b[0])]
+        if not bidrag:
+            return
+        self._säkerställ_kapacitet()
+        storlek = len(self._tf_summa)
+        kolumner = np.concatenate([k for k, _, _ in bidrag])
+        antal = np.concatenate([a for _, a, _ in bidrag])
+        normer = np.concatenate([np.full(len(k), norm) for k, _, norm in bidrag])
+        self._dokumentfrekvens += tecken * np.bincount(kolumner, minlength=storlek)
+        self._termfrekvens += tecken * np.rint(np.bincount(kolumner, weights=antal, minlength=storlek)).astype(np.int64)
+        self._tf_summa += tecken * np.bincount(kolumner, weights=antal / normer, minlength=storlek)
+        if tecken < 0:
+            # Avdragen flyttalssumma blir inte exakt noll när sista dokumentet med termen försvinner
+            self._tf_summa[self._dokumentfrekvens == 0] = 0.0
+
+    def lägg_till(self, texter: Iterable[str]) -> int:
+        """Lägger till texter som inte kan tas bort igen och returnerar antal nya dokument"""
+        bidrag = [self._räkna(text) for text in texter]
+        self._uppdatera(bidrag, 1)
+        self.antal_dokument += len(bidrag)
+        self._beskär_vid_behov()
+        return len(bidrag)
+
+    @staticmethod
+    def _postnyckel(post: Dict[str, Any], text: str) -> str:
+        return str(post.get('id') or hashlib.sha1(f"{post.get('skapad')}|{text}".encode('utf-8')).hexdigest())
+
+    def lägg_till_poster(self, poster: Iterable[Dict[str, Any]]) -> int:
+        """
+        Synkar indexet mot `poster`, som är hela korpusen för indexet. Poster
+        identifieras via 'id' (annars skapad och innehåll): nya läggs till,
+        poster med ändrat innehåll byts ut och poster som inte längre finns med
+        dras av. Ordningen spelar ingen roll. Returnerar antal nya eller ändrade poster
+        """
+        aktuella: Dict[str, str] = {}
+        for post in poster:
+            text = post.get('innehåll', '') or post.get('beskrivning', '')
+            if text:
+                aktuella[self._postnyckel(post, text)] = text
+
+        avdrag = [self._poster.pop(nyckel)[1:] for nyckel in [n for n in self._poster if n not in aktuella]]
+        tillägg = []
+        for nyckel, text in aktuella.items():
+            innehåll = _innehållshash(text)
+            tidigare = self._poster.get(nyckel)
+            if tidigare is not None:
+                if tidigare[0] == innehåll:
+                    continue
+                avdrag.append(tidigare[1:])
+            bidrag = self._räkna(text)
+            self._poster[nyckel] = (innehåll, *bidrag)
+            tillägg.append(bidrag)
+
+        self._uppdatera(avdrag, -1)
+        self._uppdatera(tillägg, 1)
+        self.antal_dokument += len(tillägg) - len(avdrag)
+        self._beskär_vid_behov()
+        return len(tillägg)
+
+    def _beskär_vid_behov(self):
+        """Behåller de max_termer // 2 vanligaste termerna som finns i något dokument och numrerar om kolumnerna"""
+        n = len(self._termer)
+        if n <= self.max_termer:
+            return
+        levande = np.flatnonzero(self._dokumentfrekvens[:n] > 0)
+        gräns = self.max_termer // 2
+        if len(levande) > gräns:
+            levande = levande[np.argpartition(-self._termfrekvens[levande], gräns)[:gräns]]
+        behåll = np.sort(levande)
+        ny_kolumn = np.full(n, -1, dtype=np.int64)
+        ny_kolumn[behåll] = np.arange(len(behåll))
+
+        self._termer = [self._termer[i] for i in behåll]
+        self.vokabulär = {term: i for i, term in enumerate(self._termer)}
+        for attribut in ("_dokumentfrekvens", "_termfrekvens", "_tf_summa"):
+            setattr(self, attribut, getattr(self, attribut)[behåll].copy())
+        # Normen behålls, så att kvarvarande kolumner dras av med samma vikt som de lades till
+        for nyckel, (innehåll, kolumner, antal, norm) in self._poster.items():
+            nya = ny_kolumn[kolumner]
+            kvar = nya >= 0
+            self._poster[nyckel] = (innehåll, nya[kvar], antal[kvar], norm)
+
+    def poäng(self) -> np.ndarray:
+        """Temapoäng per term i vokabulären"""
+        n = len(self._termer)
+        if n == 0 or self.antal_dokument == 0:
+            return np.zeros(0)
+        idf = np.log((1 + self.antal_dokument) / (1 + self._dokumentfrekvens[:n])) + 1
+        poäng = self._tf_summa[:n] * idf / self.antal_dokument
+
+        # Som TfidfVectorizer(max_features): bara de vanligaste termerna konkurrerar
+        if self.max_features and n > self.max_features:
+            vanligaste = np.argpartition(-self._termfrekvens[:n], self.max_features)[:self.max_features]
+            begränsad = np.zeros(n)
+            begränsad[vanligaste] = poäng[vanligaste]
+            poäng = begränsad
+        return poäng
+
+    def toppteman(self, antal: int = 10) -> List[str]:
+        """De `antal` högst viktade termerna"""
+        poäng = self.poäng()
+        if poäng.size == 0:
+            return []
+        antal = min(antal, poäng.size)
+        topp = np.argpartition(-poäng, antal - 1)[:antal]
+        topp = topp[np.argsort(-poäng[topp], kind="stable")]
+        return [self._termer[i] for i in topp if poäng[i] > 0]
+
+    def spara(self, sökväg: str):
+        """Sparar vokabulär, summor och postbidrag till en .npz-fil"""
+        n = len(self._termer)
+        nycklar = list(self._poster)
+        poster = [self._poster[nyckel] for nyckel in nycklar]
+        np.savez_compressed(
+            sökväg,
+            termer=np.asarray(self._termer, dtype=str),
+            dokumentfrekvens=self._dokumentfrekvens[:n],
+            termfrekvens=self._termfrekvens[:n],
+            tf_summa=self._tf_summa[:n],
+            post_nycklar=np.asarray(nycklar, dtype=str),
+            post_innehåll=np.asarray([p[0] for p in poster], dtype=str),
+            post_gränser=np.cumsum([0] + [len(p[1]) for p in poster]).astype(np.int64),
+            post_kolumner=np.concatenate([p[1] for p in poster] or [np.empty(0, dtype=np.int64)]),
+            post_antal=np.concatenate([p[2] for p in poster] or [np.empty(0, dtype=np.float64)]),
+            post_normer=np.asarray([p[3] for p in poster], dtype=np.float64),
+            meta=np.asarray(json.dumps({
+                'antal_dokument': self.antal_dokument,
+                'ngram_range': list(self.ngram_range),
+                'max_features': self.max_features,
+                'max_termer': self.max_termer
+            }))
+        )
+
+    @classmethod
+    def ladda(cls, sökväg: str) -> "TemaIndex":
+        with np.load(sökväg, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            index = cls(ngram_range=tuple(meta['ngram_range']), max_features=meta['max_features'],
+                        max_termer=meta['max_termer'])
+            index._termer = [str(t) for t in data['termer']]
+            index.vokabulär = {term: i for i, term in enumerate(index._termer)}
+            index._dokumentfrekvens = data['dokumentfrekvens'].copy()
+            index._termfrekvens = data['termfrekvens'].copy()
+            index._tf_summa = data['tf_summa'].copy()
+            gränser, kolumner, antal = data['post_gränser'], data['post_kolumner'], data['post_antal']
+            for i, (nyckel, innehåll, norm) in enumerate(zip(data['post_nycklar'], data['post_innehåll'],
+                                                             data['post_normer'])):
+                index._poster[str(nyckel)] = (str(innehåll), kolumner[gränser[i]:gränser[i + 1]].copy(),
+                                              antal[gränser[i]:gränser[i + 1]].copy(), float(norm))
+        index.antal_dokument = meta['antal_dokument']
+        return index
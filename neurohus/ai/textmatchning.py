@@ -0,0 +1,123 @@
+# Approximativ textmatchning mot verksamheter
+# TF-IDF slumpprojiceras till en kompakt float32-matris med LSH-tabeller för snabb likhetssökning
+
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Under denna katalogstorlek är en matris-vektorprodukt över alla float32-vektorer
+# snabbare än LSH-uppslag (cirka 3 ms vid 50 000 verksamheter på en kärna)
+EXAKT_GRÄNS = 100_000
+
+
+def verksamhetstext(verksamhet: Any) -> str:
+    """Beskrivning och recensionstexter som en sammanhängande text"""
+    delar = [getattr(verksamhet, 'beskrivning', None) or '']
+    delar.extend(recension.get('innehåll', '') for recension in verksamhet.recensioner or [])
+    return " ".join(del_text for del_text in delar if del_text)
+
+
+def _normera(matris: np.ndarray) -> np.ndarray:
+    normer = np.linalg.norm(matris, axis=1, keepdims=True)
+    np.divide(matris, normer, out=matris, where=normer > 0)
+    return matris
+
+
+class TextIndex:
+    """
+    Cosinuslikhet mellan fritext och verksamhetstexter. Glesa TF-IDF-vektorer
+    projiceras med en gaussisk slumpmatris till `dimensioner` float32 och
+    indexeras med `antal_tabeller` SimHash-tabeller om `bitar` bitar vardera.
+    Sökningen hämtar kandidater ur frågans hinkar (plus hinkar en bit bort)
+    och rangordnar dem exakt på de projicerade vektorerna. Blir kandidaterna
+    fler än halva katalogen jämförs i stället mot alla vektorer direkt
+    """
+
+    def __init__(self, vektoriserare: Any, dimensioner: int = 128, antal_tabeller: int = 16,
+                 bitar: int = 12, seed: int = 0):
+        self.vektoriserare = vektoriserare
+        self.dimensioner = dimensioner
+        self.antal_tabeller = antal_tabeller
+        self.bitar = bitar
+        self._slump = np.random.default_rng(seed)
+        self.ids: List[str] = []
+        self.vektorer = np.empty((0, dimensioner), dtype=np.float32)
+        self._projektion: Optional[np.ndarray] = None
+        self._plan: Optional[np.ndarray] = None
+        self._koder: List[np.ndarray] = []
+        self._ordning: List[np.ndarray] = []
+        self._vikter = (1 << np.arange(bitar)).astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def bygg(self, ids: Sequence[str], texter: Sequence[str]) -> "TextIndex":
+        """Anpassar TF-IDF på texterna och bygger vektorer och hashtabeller"""
+        tfidf = self.vektoriserare.fit_transform(texter)
+        antal_termer = tfidf.shape[1]
+        self._projektion = (self._slump.standard_normal((antal_termer, self.dimensioner))
+                            / np.sqrt(self.dimensioner)).astype(np.float32)
+        self._plan = self._slump.standard_normal(
+            (self.antal_tabeller, self.dimensioner, self.bitar)).astype(np.float32)
+
+        self.ids = list(ids)
+        self.vektorer = _normera(np.asarray(tfidf @ self._projektion, dtype=np.float32))
+
+        self._koder, self._ordning = [], []
+        for tabell in range(self.antal_tabeller):
+            koder = self._hasha(self.vektorer, tabell)
+            ordning = np.argsort(koder, kind="stable")
+            self._koder.append(koder[ordning])
+            self._ordning.append(ordning)
+        return self
+
+    def _hasha(self, vektorer: np.ndarray, tabell: int) -> np.ndarray:
+        return ((vektorer @ self._plan[tabell]) > 0).astype(np.int64) @ self._vikter
+
+    def vektor(self, text: str) -> np.ndarray:
+        """Projicerad och normerad vektor för en fritext, nollvektor utan kända termer"""
+        tfidf = self.vektoriserare.transform([text])
+        return _normera(np.asarray(tfidf @ self._projektion, dtype=np.float32))[0]
+
+    def _kandidater(self, fråga: np.ndarray, granne_bitar: bool) -> np.ndarray:
+        rader = []
+        for tabell in range(self.antal_tabeller):
+            kod = int(self._hasha(fråga[None, :], tabell)[0])
+            hinkar = [kod] + ([kod ^ int(v) for v in self._vikter] if granne_bitar else [])
+            koder = self._koder[tabell]
+            for hink in hinkar:
+                start, slut = np.searchsorted(koder, [hink, hink + 1])
+                if slut > start:
+                    rader.append(self._ordning[tabell][start:slut])
+        if not rader:
+            return np.empty(0, dtype=np.int64)
+        mask = np.zeros(len(self.ids), dtype=bool)
+        for lista in rader:
+            mask[lista] = True
+        return np.flatnonzero(mask)
+
+    def sök(self, text: str, antal: int = 10, exakt: Optional[bool] = None,
+            granne_bitar: bool = True) -> List[Tuple[str, float]]:
+        """
+        De `antal` mest lika verksamheterna som (id, cosinuslikhet). Med `exakt`
+        jämförs mot alla vektorer, annars bara mot LSH-kandidaterna; None väljer
+        exakt sökning för kataloger under EXAKT_GRÄNS
+        """
+        if not self.ids:
+            return []
+        if exakt is None:
+            exakt = len(self.ids) < EXAKT_GRÄNS
+        fråga = self.vektor(text)
+        if not fråga.any():
+            return []
+
+        rader = None if exakt else self._kandidater(fråga, granne_bitar)
+        if rader is None or not antal <= len(rader) <= len(self.ids) // 2:
+            rader = np.arange(len(self.ids))
+            likhet = self.vektorer @ fråga
+        else:
+            likhet = self.vektorer[rader] @ fråga
+        antal = min(antal, len(rader))
+        topp = np.argpartition(-likhet, antal - 1)[:antal]
+        topp = topp[np.argsort(-likhet[topp], kind="stable")]
+        return [(self.ids[rader[i]], float(likhet[i])) for i in topp if likhet[i] > 0]
@@ -0,0 +1,112 @@
+# Vektoriserad tidsindelning för trendanalys
+# Delar in datetime64-tidpunkter i dagar, veckor, månader eller kvartal
+
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+import numpy as np
+
+UPPLÖSNINGAR = ("dag", "vecka", "månad", "kvartal")
+
+
+@dataclass
+class Tidsserie:
+    """Antal per tidshink samt förändring mot föregående hink"""
+    upplösning: str
+    hinkar: np.ndarray          # hinknummer, se hink_nummer
+    antal: np.ndarray
+    förändring: np.ndarray
+    förändring_procent: np.ndarray
+
+    @property
+    def etiketter(self) -> List[str]:
+        return hink_etiketter(self.hinkar, self.upplösning)
+
+    def som_dict(self) -> Dict[str, Dict[str, Any]]:
+        """Samma format som TrendAnalys alltid returnerat, nycklat på etikett"""
+        return {
+            etikett: {
+                'antal_poster': int(n),
+                'förändring': int(diff),
+                'förändring_procent': float(procent)
+            }
+            for etikett, n, diff, procent in zip(self.etiketter, self.antal,
+                                                 self.förändring, self.förändring_procent)
+        }
+
+
+def hink_nummer(tider: np.ndarray, upplösning: str = "månad") -> np.ndarray:
+    """
+    Heltalsnummer per tidpunkt: dagar, måndagsveckor, månader eller kvartal sedan 1970.
+    1970-01-01 var en torsdag, så +3 dagar förskjuter veckorna till att börja på måndag
+    """
+    if upplösning == "dag":
+        return tider.astype("datetime64[D]").astype(np.int64)
+    if upplösning == "vecka":
+        return (tider.astype("datetime64[D]").astype(np.int64) + 3) // 7
+    if upplösning == "månad":
+        return tider.astype("datetime64[M]").astype(np.int64)
+    if upplösning == "kvartal":
+        return tider.astype("datetime64[M]").astype(np.int64) // 3
+    raise ValueError(f"Okänd upplösning '{upplösning}', välj bland {UPPLÖSNINGAR}")
+
+
+def hink_start(hinkar: np.ndarray, upplösning: str) -> np.ndarray:
+    """Första dagen i varje hink som datetime64[D]"""
+    hinkar = np.asarray(hinkar, dtype=np.int64)
+    if upplösning == "dag":
+        return hinkar.astype("datetime64[D]")
+    if upplösning == "vecka":
+        return (hinkar * 7 - 3).astype("datetime64[D]")
+    if upplösning == "månad":
+        return hinkar.astype("datetime64[M]").astype("datetime64[D]")
+    if upplösning == "kvartal":
+        return (hinkar * 3).astype("datetime64[M]").astype("datetime64[D]")
+    raise ValueError(f"Okänd upplösning '{upplösning}', välj bland {UPPLÖSNINGAR}")
+
+
+def hink_etiketter(hinkar: np.ndarray, upplösning: str) -> List[str]:
+    """Läsbara etiketter: 2023-05-17, 2023-W20 (ISO-vecka), 2023-05 eller 2023-Q2"""
+    if upplösning == "vecka":
+        # ISO-året och veckonumret bestäms av veckans torsdag
+        torsdagar = hink_start(hinkar, "vecka") + np.timedelta64(3, "D")
+        år = torsdagar.astype("datetime64[Y]")
+        veckor = (torsdagar - år.astype("datetime64[D]")).astype(np.int64) // 7 + 1
+        return [f"{a}-W{v:02d}" for a, v in zip(år.astype(np.int64) + 1970, veckor)]
+    if upplösning == "kvartal":
+        return [f"{h // 4 + 1970}-Q{h % 4 + 1}" for h in np.asarray(hinkar, dtype=np.int64)]
+    if upplösning == "månad":
+        return [str(m) for m in np.asarray(hinkar, dtype=np.int64).astype("datetime64[M]")]
+    return [str(d) for d in hink_start(hinkar, upplösning)]
+
+
+def _förändringar(antal: np.ndarray):
+    föregående = np.concatenate([antal[:1], antal[:-1]])
+    förändring = antal - föregående
+    with np.errstate(divide="ignore", invalid="ignore"):
+        procent = np.where(föregående > 0, förändring / np.maximum(föregående, 1) * 100, 0.0)
+    return förändring, procent
+
+
+def dela_in(tider: np.ndarray, upplösning: str = "månad", fyll_luckor: bool = True) -> Tidsserie:
+    """
+    Räknar tidpunkter per hink i ett svep. Med `fyll_luckor` tas tomma hinkar
+    mellan första och sista tidpunkten med så att förändringen avser föregående
+    kalenderperiod; annars jämförs mot föregående hink som har data
+    """
+    tider = np.asarray(tider)
+    if tider.size == 0:
+        tom = np.empty(0, dtype=np.int64)
+        return Tidsserie(upplösning, tom, tom, tom, np.empty(0))
+
+    nummer = hink_nummer(tider, upplösning)
+    if fyll_luckor:
+        lägsta = nummer.min()
+        antal = np.bincount(nummer - lägsta)
+        hinkar = np.arange(lägsta, lägsta + len(antal))
+    else:
+        hinkar, antal = np.unique(nummer, return_counts=True)
+
+    antal = antal.astype(np.int64)
+    förändring, procent = _förändringar(antal)
+    return Tidsserie(upplösning, hinkar, antal, förändring, procent)
@@ -0,0 +1,121 @@
+# Löpande sentimenttrender
+# Uppdateras i konstant tid per ny poäng i stället för polyfit över hela historiken
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+# Samma gräns för lutningen som trendanalysen alltid använt
+TREND_TRÖSKEL = 0.01
+
+
+@dataclass
+class OnlineTrend:
+    """
+    Minsta-kvadrat-lutning över (löpnummer, poäng) med Welfords centrerade
+    summor, samt exponentiellt viktat medelvärde. x är postens löpnummer
+    precis som np.arange i den tidigare np.polyfit-beräkningen
+    """
+    alfa: float = 0.05
+    n: int = 0
+    medel_x: float = 0.0
+    medel_y: float = 0.0
+    m2_x: float = 0.0
+    c_xy: float = 0.0
+    ewm: Optional[float] = None
+
+    @classmethod
+    def från_serie(cls, poäng: Iterable[float], alfa: float = 0.05) -> "OnlineTrend":
+        trend = cls(alfa=alfa)
+        trend.uppdatera_många(np.fromiter(poäng, dtype=np.float64))
+        return trend
+
+    def uppdatera(self, y: float):
+        """Lägger till en poäng i O(1)"""
+        x = float(self.n)
+        self.n += 1
+        dx = x - self.medel_x
+        self.medel_x += dx / self.n
+        self.medel_y += (y - self.medel_y) / self.n
+        self.m2_x += dx * (x - self.medel_x)
+        self.c_xy += dx * (y - self.medel_y)
+        self.ewm = y if self.ewm is None else self.alfa * y + (1 - self.alfa) * self.ewm
+
+    def uppdatera_många(self, y: np.ndarray):
+        """Lägger till en serie poäng genom att slå ihop dess summor med de befintliga"""
+        y = np.asarray(y, dtype=np.float64)
+        k = len(y)
+        if k == 0:
+            return
+        x = np.arange(self.n, self.n + k, dtype=np.float64)
+        medel_x_b, medel_y_b = x.mean(), y.mean()
+        m2_b = float(((x - medel_x_b) ** 2).sum())
+        c_b = float(((x - medel_x_b) * (y - medel_y_b)).sum())
+
+        n = self.n + k
+        dx, dy = medel_x_b - self.medel_x, medel_y_b - self.medel_y
+        vikt = self.n * k / n
+        self.m2_x += m2_b + dx * dx * vikt
+        self.c_xy += c_b + dx * dy * vikt
+        self.medel_x += dx * k / n
+        self.medel_y += dy * k / n
+        self.n = n
+
+        # Exponentiellt viktat medel: äldre värden vägs ned med (1 - alfa) per steg
+        if self.ewm is None:
+            start, resten = y[0], y[1:]
+        else:
+            start, resten = self.ewm, y
+        vikter = self.alfa * (1 - self.alfa) ** np.arange(len(resten) - 1, -1, -1)
+        self.ewm = float((1 - self.alfa) ** len(resten) * start + (vikter * resten).sum())
+
+    @property
+    def lutning(self) -> float:
+        return self.c_xy / self.m2_x if self.n > 1 and self.m2_x > 0 else 0.0
+
+    def trend(self, tröskel: float = TREND_TRÖSKEL) -> str:
+        if self.n < 2:
+            return 'neutral'
+        if self.lutning > tröskel:
+            return 'förbättring'
+        if self.lutning < -tröskel:
+            return 'försämring'
+        return 'stabil'
+
+    def sammanfattning(self) -> Dict[str, Any]:
+        return {
+            'genomsnittligt_sentiment': self.medel_y if self.n else 0.5,
+            'viktat_sentiment': self.ewm if self.ewm is not None else 0.5,
+            'lutning': self.lutning,
+            'trend': self.trend(),
+            'antal_analyserade': self.n
+        }
+
+
+class TrendAckumulatorer:
+    """
+    En OnlineTrend per kommun, per kategori, per kombination och totalt.
+    None fungerar som jokertecken, (None, None) är hela landet
+    """
+
+    def __init__(self, alfa: float = 0.05):
+        self.alfa = alfa
+        self._trender: Dict[Tuple[Optional[str], Optional[str]], OnlineTrend] = {}
+        self._lås = threading.Lock()
+
+    def registrera(self, kommun: Optional[str], kategori: Optional[str], poäng: float):
+        """Uppdaterar de fyra berörda trenderna i konstant tid"""
+        with self._lås:
+            for nyckel in {(kommun, kategori), (kommun, None), (None, kategori), (None, None)}:
+                trend = self._trender.get(nyckel)
+                if trend is None:
+                    trend = self._trender[nyckel] = OnlineTrend(alfa=self.alfa)
+                trend.uppdatera(poäng)
+
+    def hämta(self, kommun: Optional[str] = None, kategori: Optional[str] = None) -> Dict[str, Any]:
+        """Aktuell trend för kommun och/eller kategori"""
+        with self._lås:
+            trend = self._trender.get((kommun, kategori))
+            return trend.sammanfattning() if trend else OnlineTrend().sammanfattning()
@@ -0,0 +1,190 @@
+# Kolumnlager för trendanalys
+# Poster läses in en gång till NumPy-kolumner med radindex per kommun och kategori
+
+import warnings
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .trendackumulator import OnlineTrend
+
+
+def tolka_tider(värden: List[Any]) -> np.ndarray:
+    """
+    Tolkar ISO-strängar eller datetime-objekt till datetime64[s] i ett svep.
+    Tidszonsangivelser behålls som lokal väggklocka, precis som datetime.fromisoformat
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        try:
+            return np.array(värden, dtype="datetime64[s]")
+        except (ValueError, TypeError, UserWarning):
+            pass
+
+    tolkade = []
+    for värde in värden:
+        if isinstance(värde, str):
+            värde = datetime.fromisoformat(värde)
+        tolkade.append(värde.replace(tzinfo=None))
+    return np.array(tolkade, dtype="datetime64[s]")
+
+
+class _Kodning:
+    """Kategoriska koder för strängvärden, None får egen kod"""
+
+    def __init__(self):
+        self.koder: Dict[Optional[str], int] = {}
+        self.värden: List[Optional[str]] = []
+
+    def koda(self, värden: Iterable[Optional[str]]) -> np.ndarray:
+        koder = self.koder
+        resultat = []
+        for värde in värden:
+            kod = koder.get(värde)
+            if kod is None:
+                kod = koder[värde] = len(self.värden)
+                self.värden.append(värde)
+            resultat.append(kod)
+        return np.asarray(resultat, dtype=np.int32)
+
+
+class TrendStore:
+    """
+    Poster lagrade kolumnvis: tidpunkt (datetime64), kommun- och kategorikod,
+    sentiment (NaN tills poängsatt) samt radindex per kommun och kategori.
+    Sentimenttrenden per (kommunkod, kategorikod) hålls i en OnlineTrend som
+    matas med nya poäng i radordning när de sparas
+    """
+
+    def __init__(self):
+        self.poster: List[Dict[str, Any]] = []
+        self.texter: List[str] = []
+        self.tider = np.empty(0, dtype="datetime64[s]")
+        self.kommun_koder = np.empty(0, dtype=np.int32)
+        self.kategori_koder = np.empty(0, dtype=np.int32)
+        self.sentiment = np.empty(0, dtype=np.float64)
+        self.har_text = np.empty(0, dtype=bool)
+        self.försökt = np.empty(0, dtype=bool)
+        self.kommuner = _Kodning()
+        self.kategorier = _Kodning()
+        self._kommun_index: Optional[Dict[int, np.ndarray]] = None
+        self._kategori_index: Optional[Dict[int, np.ndarray]] = None
+        # Löpande trend och första ej matade radnummer per (kommunkod, kategorikod), None är jokertecken
+        self._trender: Dict[Tuple[Optional[int], Optional[int]], OnlineTrend] = {}
+        self._matade: Dict[Tuple[Optional[int], Optional[int]], int] = {}
+
+    @classmethod
+    def från_poster(cls, poster: Iterable[Dict[str, Any]]) -> "TrendStore":
+        lager = cls()
+        lager.lägg_till(poster)
+        return lager
+
+    def __len__(self) -> int:
+        return len(self.poster)
+
+    def lägg_till(self, poster: Iterable[Dict[str, Any]]):
+        """Läser in nya poster, kolumner växer och radindexen byggs om vid nästa uppslag"""
+        poster = list(poster)
+        if not poster:
+            return
+
+        nu = datetime.now()
+        texter = [post.get('innehåll', '') or post.get('beskrivning', '') or '' for post in poster]
+        tider = tolka_tider([post.get('skapad') or nu for post in poster])
+
+        self.poster.extend(poster)
+        self.texter.extend(texter)
+        self.tider = np.concatenate([self.tider, tider])
+        self.kommun_koder = np.concatenate([
+            self.kommun_koder, self.kommuner.koda(post.get('kommun') for post in poster)])
+        self.kategori_koder = np.concatenate([
+            self.kategori_koder, self.kategorier.koda(post.get('kategori') for post in poster)])
+        self.sentiment = np.concatenate([self.sentiment, np.full(len(poster), np.nan)])
+        self.har_text = np.concatenate([self.har_text, np.fromiter((bool(t) for t in texter),
+                                                                   dtype=bool, count=len(texter))])
+        self.försökt = np.concatenate([self.försökt, np.zeros(len(poster), dtype=bool)])
+        self._kommun_index = None
+        self._kategori_index = None
+
+    @staticmethod
+    def _bygg_index(koder: np.ndarray, antal_koder: int) -> Dict[int, np.ndarray]:
+        """Sorterade radnummer per kod via en stabil sortering"""
+        ordning = np.argsort(koder, kind="stable")
+        gränser = np.searchsorted(koder[ordning], np.arange(antal_koder + 1))
+        return {kod: ordning[gränser[kod]:gränser[kod + 1]] for kod in range(antal_koder)}
+
+    def _index(self, kolumn: str) -> Dict[int, np.ndarray]:
+        if kolumn == "kommun":
+            if self._kommun_index is None:
+                self._kommun_index = self._bygg_index(self.kommun_koder, len(self.kommuner.värden))
+            return self._kommun_index
+        if self._kategori_index is None:
+            self._kategori_index = self._bygg_index(self.kategori_koder, len(self.kategorier.värden))
+        return self._kategori_index
+
+    def koder_för(self, kommun: Optional[str] = None,
+                  kategori: Optional[str] = None) -> Tuple[Optional[int], Optional[int]]:
+        """Kommun- och kategorikod för ett uppslag, None för tomt värde (alla); okända värden får kod -1"""
+        return (self.kommuner.koder.get(kommun, -1) if kommun else None,
+                self.kategorier.koder.get(kategori, -1) if kategori else None)
+
+    def rader(self, kommun: Optional[str] = None, kategori: Optional[str] = None) -> np.ndarray:
+        """Radnummer (stigande) för poster som matchar kommun och kategori"""
+        return self.rader_för_koder(*self.koder_för(kommun, kategori))
+
+    def rader_för_koder(self, kommun_kod: Optional[int] = None, kategori_kod: Optional[int] = None,
+                        från: int = 0) -> np.ndarray:
+        """Radnummer (stigande) från och med `från` för kommun- och kategorikod, None matchar alla"""
+        rader = None
+        if kommun_kod is not None:
+            rader = self._index("kommun").get(kommun_kod, np.empty(0, dtype=np.int64))
+            rader = rader[np.searchsorted(rader, från):] if från else rader
+        if kategori_kod is not None:
+            kategori_rader = self._index("kategori").get(kategori_kod, np.empty(0, dtype=np.int64))
+            kategori_rader = kategori_rader[np.searchsorted(kategori_rader, från):] if från else kategori_rader
+            rader = kategori_rader if rader is None else np.intersect1d(rader, kategori_rader, assume_unique=True)
+        return np.arange(från, len(self.poster)) if rader is None else rader
+
+    def poster_för(self, rader: np.ndarray) -> List[Dict[str, Any]]:
+        return [self.poster[i] for i in rader]
+
+    def texter_för(self, rader: np.ndarray) -> List[str]:
+        return [self.texter[i] for i in rader]
+
+    def saknar_sentiment(self, rader: np.ndarray) -> np.ndarray:
+        """Rader med text som ännu inte fått någon sentimentpoäng"""
+        return rader[self.har_text[rader] & np.isnan(self.sentiment[rader])]
+
+    def sätt_sentiment(self, rader: np.ndarray, poäng: Iterable[Optional[float]]):
+        """Sparar poäng (None vid bortfall) och matar de trender som redan följs"""
+        rader = np.asarray(rader, dtype=np.int64)
+        tidigare = rader[self.försökt[rader]]
+        self.sentiment[rader] = np.array([np.nan if p is None else p for p in poäng], dtype=np.float64)
+        self.försökt[rader] = True
+        if len(tidigare) and not np.isnan(self.sentiment[tidigare]).all():
+            # Ett tidigare bortfall fick poäng och hamnar mitt i serierna, som då byggs om
+            self._trender = {nyckel: OnlineTrend() for nyckel in self._trender}
+            self._matade.clear()
+        for kommun_kod, kategori_kod in list(self._trender):
+            self.sentiment_trend(kommun_kod, kategori_kod)
+
+    def sentiment_trend(self, kommun_kod: Optional[int] = None, kategori_kod: Optional[int] = None) -> OnlineTrend:
+        """
+        Löpande sentimenttrend för gruppen. Matas med gruppens rader efter de redan
+        matade, fram till första rad med text som ännu inte poängsatts, så att x
+        förblir postens löpnummer bland de poängsatta
+        """
+        nyckel = (kommun_kod, kategori_kod)
+        trend = self._trender.get(nyckel)
+        if trend is None:
+            trend = self._trender[nyckel] = OnlineTrend()
+        nya = self.rader_för_koder(kommun_kod, kategori_kod, från=self._matade.get(nyckel, 0))
+        väntar = np.flatnonzero(self.har_text[nya] & ~self.försökt[nya])
+        if len(väntar):
+            nya = nya[:väntar[0]]
+        if len(nya):
+            poäng = self.sentiment[nya]
+            trend.uppdatera_många(poäng[~np.isnan(poäng)])
+            self._matade[nyckel] = int(nya[-1]) + 1
+        return trend
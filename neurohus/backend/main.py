@@ -3,11 +3,17 @@ Neuroljus Neurohus Backend
 FastAPI server för Sveriges första digitala hus för empati, kunskap och neurodiversitet
 """
 
+import asyncio
+import logging
+import os
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
 
+logger = logging.getLogger(__name__)
+
 # Skapa FastAPI app
 app = FastAPI(
     title="Neuroljus Neurohus API",
@@ -33,6 +39,27 @@ async def add_utf8_header(request, call_next):
     response.headers["Content-Type"] = "application/json; charset=utf-8"
     return response
 
+@app.on_event("startup")
+async def värm_upp_ai_modeller():
+    """
+    Laddar AI-modeller vid uppstart så att första anropet inte väntar
+    Stängs av med NEUROHUS_VARM_UPP=0
+    """
+    if os.getenv("NEUROHUS_VARM_UPP", "1") == "0":
+        return
+
+    try:
+        from neurohus.ai import värm_upp
+    except ImportError as e:
+        logger.warning(f"AI-moduler inte tillgängliga, hoppar över uppvärmning: {e}")
+        return
+
+    try:
+        laddtider = await asyncio.to_thread(värm_upp)
+        logger.info(f"AI-modeller uppvärmda: {laddtider}")
+    except Exception as e:
+        logger.error(f"Fel vid uppvärmning av AI-modeller: {e}")
+
 @app.get("/")
 async def root():
     """
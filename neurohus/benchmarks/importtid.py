@@ -0,0 +1,36 @@
+# Mätning av importtid för neurohus.ai
+# Kör `python -X importtime` i nya processer och rapporterar medianen
+
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROT = Path(__file__).resolve().parents[2]
+
+
+def mät_importtid(modul: str, upprepningar: int) -> list:
+    """Returnerar kumulativ importtid i millisekunder per körning"""
+    tider = []
+    for _ in range(upprepningar):
+        resultat = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {modul}"],
+            cwd=REPO_ROT, capture_output=True, text=True, check=True
+        )
+        for rad in resultat.stderr.splitlines():
+            delar = [d.strip() for d in rad.split("|")]
+            if len(delar) == 3 and delar[2] == modul:
+                tider.append(int(delar[1]) / 1000)
+    return tider
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mäter importtid för en modul")
+    parser.add_argument("--modul", default="neurohus.ai")
+    parser.add_argument("--upprepningar", type=int, default=10)
+    args = parser.parse_args()
+
+    tider = mät_importtid(args.modul, args.upprepningar)
+    print(f"{args.modul}: median {statistics.median(tider):.1f} ms, "
+          f"min {min(tider):.1f} ms, max {max(tider):.1f} ms ({len(tider)} körningar)")
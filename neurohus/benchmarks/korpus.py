@@ -0,0 +1,132 @@
+# Syntetisk korpus för prestandamätningar
+# Genererar recensioner och foruminlägg med kommun, kategori och datum
+
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+KOMMUNER = [f"Kommun {i:03d}" for i in range(290)]
+KATEGORIER = ["allmänt", "boende", "assistans", "familj", "forskning"]
+
+_FRASER = [
+    "Personalen visar stor empati och förståelse för autism",
+    "Kommunikationen med boendet har varit bristfällig",
+    "Min dotter känner sig trygg och respekterad",
+    "Det är svårt att få svar från handläggaren",
+    "Fantastiskt stöd under hela ansökningsprocessen",
+    "Dagverksamheten har för få aktiviteter",
+    "Assistenterna är professionella och varma",
+    "Vi har haft problem med schemaläggningen",
+    "Rekommenderar verkligen detta familjehem",
+    "Lokalerna är slitna men stämningen är god",
+]
+
+
+def generera_poster(antal: int, seed: int = 42,
+                    start: datetime = datetime(2021, 1, 1),
+                    dagar: int = 1000) -> List[Dict[str, Any]]:
+    """Genererar `antal` poster i samma format som recensioner och foruminlägg"""
+    slump = random.Random(seed)
+    poster = []
+    for i in range(antal):
+        meningar = slump.randint(1, 4)
+        poster.append({
+            'id': f"post-{i}",
+            'innehåll': ". ".join(slump.choice(_FRASER) for _ in range(meningar)) + ".",
+            'kommun': slump.choice(KOMMUNER),
+            'kategori': slump.choice(KATEGORIER),
+            'skapad': (start + timedelta(minutes=slump.randrange(dagar * 24 * 60))).isoformat(),
+            'betyg': slump.randint(1, 5),
+        })
+    return poster
+
+
+DIAGNOSER = ["Autism", "ADHD", "Intellektuell funktionsnedsättning", "Downs syndrom",
+             "Tourettes syndrom", "Språkstörning", "Epilepsi", "Cerebral pares"]
+TJÄNSTER = ["Personlig assistans", "Dagverksamhet", "Korttidsboende", "Gruppboende",
+            "Ledsagning", "Avlösning", "Kontaktperson", "Daglig verksamhet", "Habilitering"]
+TYPER = ["gruppboende", "servicebostad", "daglig_verksamhet", "assistansbolag", "korttidsboende"]
+ÅLDERSGRUPPER = ["0-6", "7-17", "18-65", "65+"]
+
+# Påhittade kommuncentrum inom Sveriges ungefärliga utbredning (latitud, longitud)
+_centrum_slump = random.Random(290)
+KOMMUN_KOORDINATER = {kommun: (_centrum_slump.uniform(55.4, 68.5), _centrum_slump.uniform(11.5, 23.5))
+                      for kommun in KOMMUNER}
+
+
+_PROFILFRASER = [
+    "Vi arbetar lågaffektivt med tydlig struktur och bildstöd",
+    "Lugn miljö med små grupper och fasta rutiner",
+    "Personal med specialpedagogisk kompetens och lång erfarenhet",
+    "Fokus på delaktighet, självständighet och meningsfull sysselsättning",
+    "Nära samarbete med familj, skola och habilitering",
+    "Sensoriskt anpassade lokaler med möjlighet till avskildhet",
+    "Utevistelse, musik och skapande aktiviteter varje vecka",
+    "Stöd i vardagen med matlagning, ekonomi och hushåll",
+]
+
+
+def _beskrivning(typ: str, tjänster: List[str], diagnoser: List[str], slump: random.Random) -> str:
+    delar = [f"{typ.replace('_', ' ').capitalize()} som erbjuder {', '.join(tjänster).lower() or 'stöd'}"]
+    if diagnoser:
+        delar.append(f"Erfarenhet av {', '.join(diagnoser).lower()}")
+    delar.extend(slump.sample(_PROFILFRASER, 2))
+    return ". ".join(delar) + "."
+
+
+def _punkt_i(kommun: str, slump: random.Random, spridning: float = 0.15):
+    lat, lon = KOMMUN_KOORDINATER[kommun]
+    return (lat + slump.uniform(-spridning, spridning), lon + slump.uniform(-2 * spridning, 2 * spridning))
+
+
+def generera_verksamheter(antal: int, seed: int = 42, recensioner_per: int = 3,
+                          med_koordinater: bool = False) -> List[Any]:
+    """Genererar `antal` VerksamhetsProfil med beskrivning och några recensioner var, valfritt med koordinater nära kommunen"""
+    from neurohus.ai import VerksamhetsProfil
+
+    slump = random.Random(seed)
+    # Egen slumpström för beskrivningar så att övriga fält är oförändrade per seed
+    text_slump = random.Random(seed + 1)
+    verksamheter = []
+    for i in range(antal):
+        kommun = slump.choice(KOMMUNER)
+        typ = slump.choice(TYPER)
+        diagnoser = slump.sample(DIAGNOSER, slump.randint(0, 3))
+        tjänster = slump.sample(TJÄNSTER, slump.randint(0, 4))
+        verksamheter.append(VerksamhetsProfil(
+            verksamhet_id=f"verk-{i}",
+            typ=typ,
+            kommun=kommun,
+            diagnoser=diagnoser,
+            tjänster=tjänster,
+            åldersgrupp=slump.choice(ÅLDERSGRUPPER),
+            kapacitet=slump.randint(2, 40),
+            recensioner=[{'innehåll': slump.choice(_FRASER), 'betyg': slump.randint(1, 5)}
+                         for _ in range(slump.randint(0, recensioner_per))],
+            kvalitetsindikatorer={},
+            koordinater=_punkt_i(kommun, slump) if med_koordinater else None,
+            beskrivning=_beskrivning(typ, tjänster, diagnoser, text_slump)
+        ))
+    return verksamheter
+
+
+def generera_användare(antal: int, seed: int = 7, med_koordinater: bool = False) -> List[Any]:
+    """Genererar `antal` AnvändarProfil med diagnoser och behov, valfritt med hemkoordinater"""
+    from neurohus.ai import AnvändarProfil
+
+    slump = random.Random(seed)
+    användare = []
+    for i in range(antal):
+        kommun = slump.choice(KOMMUNER)
+        användare.append(AnvändarProfil(
+            användare_id=f"användare-{i}",
+            roll="familj",
+            kommun=kommun,
+            preferenser={},
+            tidigare_interaktioner=[],
+            diagnoser=slump.sample(DIAGNOSER, slump.randint(0, 2)),
+            åldersgrupp=slump.choice(ÅLDERSGRUPPER),
+            behov=slump.sample(TJÄNSTER, slump.randint(0, 3)),
+            koordinater=_punkt_i(kommun, slump) if med_koordinater else None
+        ))
+    return användare
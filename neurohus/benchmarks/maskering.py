@@ -0,0 +1,49 @@
+# Mätning av personuppgiftsmaskering
+# Ett kombinerat pass med spann och en join mot findall per mönster och str.replace per träff
+
+import argparse
+import random
+import re
+import time
+
+from neurohus.ai.maskering import Maskerare
+from neurohus.benchmarks.korpus import generera_poster
+
+_UPPGIFTER = ["ring 070-123 45 67", "pnr 19800101-1234", "mejla anna.svensson@exempel.se",
+              "nummer 0701234567", "född 1980-01-01", "+46 8 123 456"]
+
+
+def per_mönster(maskerare: Maskerare, text: str) -> str:
+    """Det gamla sättet: findall för varje mönster och en kopia av texten per träff"""
+    for typ, uttryck in maskerare.mönster.items():
+        for mönstret in uttryck:
+            for träff in re.findall(mönstret, text):
+                text = text.replace(träff, maskerare.etiketter[typ])
+    return text
+
+
+def _mät(funktion, maskerare, texter) -> float:
+    start = time.perf_counter()
+    for text in texter:
+        funktion(maskerare, text)
+    return sum(map(len, texter)) / (time.perf_counter() - start) / 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Megatecken per sekund för maskering av personuppgifter")
+    parser.add_argument("--texter", type=int, default=20_000)
+    parser.add_argument("--poster-per-text", type=int, nargs="+", default=[1, 16, 256],
+                        help="antal korpusposter per text, från recension till långt dokument")
+    args = parser.parse_args()
+
+    maskerare = Maskerare()
+    print(f"{'tecken':>8} {'per mönster MB/s':>17} {'ett pass MB/s':>14} {'faktor':>7}")
+    for per_text in args.poster_per_text:
+        slump = random.Random(5)
+        poster = [p['innehåll'] + (" " + slump.choice(_UPPGIFTER) if slump.random() < 0.2 else "")
+                  for p in generera_poster(args.texter)]
+        texter = [" ".join(poster[i:i + per_text]) for i in range(0, len(poster), per_text)]
+
+        före = _mät(per_mönster, maskerare, texter)
+        efter = _mät(lambda m, t: m.maskera(t), maskerare, texter)
+        print(f"{sum(map(len, texter)) / len(texter):>8.0f} {före:>17.1f} {efter:>14.1f} {efter / före:>6.1f}x")
@@ -0,0 +1,67 @@
+# Mätning av bulkmoderering
+# Recensioner per sekund i en tråd mot processpoolen, och strömmande ommoderering mot en sqlite-databas
+
+import argparse
+import os
+import sqlite3
+import time
+import tracemalloc
+
+from neurohus.ai.analys import EmpatiModerering
+from neurohus.ai.modereringscache import ModereringsCache
+from neurohus.ai.ommoderering import moderera_recensioner_i_databas, skapa_sqlite_recensioner
+from neurohus.benchmarks.korpus import generera_poster
+
+
+def _sqlite_med_recensioner(antal: int) -> sqlite3.Connection:
+    """Minnesdatabas med recensionstabellens kolumner, fylld med korpusposter"""
+    anslutning = sqlite3.connect(":memory:")
+    skapa_sqlite_recensioner(anslutning)
+    anslutning.executemany("INSERT INTO recensioner (innehåll, rubrik, betyg) VALUES (?, ?, ?)",
+                           ((p['innehåll'], "Omdöme om boendet", p['betyg']) for p in generera_poster(antal)))
+    anslutning.commit()
+    return anslutning
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genomströmning för moderera_batch")
+    parser.add_argument("--poster", type=int, default=50_000)
+    parser.add_argument("--processer", type=int, nargs="+", default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument("--bitstorlek", type=int, default=256)
+    args = parser.parse_args()
+
+    # Utan resultatcache så att varje körning analyserar alla recensioner
+    moderering = EmpatiModerering(cache=ModereringsCache(max_i_minnet=0))
+    recensioner = generera_poster(args.poster)
+
+    t0 = time.perf_counter()
+    for recension in recensioner:
+        moderering.moderera_recension(recension)
+    en_i_taget = len(recensioner) / (time.perf_counter() - t0)
+    print(f"moderera_recension en i taget: {en_i_taget:.0f}/s")
+
+    for processer in sorted(set(args.processer)):
+        t0 = time.perf_counter()
+        antal = sum(1 for _ in moderering.moderera_batch(recensioner, bitstorlek=args.bitstorlek,
+                                                          processer=processer))
+        per_sekund = antal / (time.perf_counter() - t0)
+        print(f"moderera_batch, {processer} processer: {per_sekund:.0f}/s ({per_sekund / en_i_taget:.1f}x)")
+
+    # Toppminnet ska vara konstant när antalet rader växer; tracemalloc mäts i en egen körning
+    # eftersom den själv sänker genomströmningen flera gånger om
+    for antal in (args.poster // 4, args.poster):
+        anslutning = _sqlite_med_recensioner(antal)
+        t0 = time.perf_counter()
+        räknare = moderera_recensioner_i_databas(moderering, anslutning, platshållare="?",
+                                                 processer=max(args.processer))
+        tid = time.perf_counter() - t0
+        anslutning.close()
+
+        anslutning = _sqlite_med_recensioner(antal)
+        tracemalloc.start()
+        moderera_recensioner_i_databas(moderering, anslutning, platshållare="?", processer=max(args.processer))
+        _, topp = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        anslutning.close()
+        print(f"sqlite, {antal} rader: {antal / tid:.0f}/s, {räknare['godkända']} godkända, "
+              f"toppminne {topp / 1e6:.1f} MB")
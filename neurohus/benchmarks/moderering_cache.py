@@ -0,0 +1,39 @@
+# Mätning av resultatcachen för moderering
+# Första granskning, omgranskning med en andel redigerade recensioner och en regeländring
+
+import argparse
+import random
+import time
+
+from neurohus.ai.analys import EmpatiModerering
+from neurohus.ai.modereringscache import ModereringsCache
+from neurohus.benchmarks.korpus import generera_poster
+
+
+def _mät(moderering: EmpatiModerering, recensioner) -> float:
+    start = time.perf_counter()
+    for recension in recensioner:
+        moderering.moderera_recension(recension)
+    return len(recensioner) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recensioner per sekund med och utan cacheträffar")
+    parser.add_argument("--recensioner", type=int, default=20_000)
+    parser.add_argument("--redigerade", type=float, default=0.1, help="andel som ändras före omgranskningen")
+    args = parser.parse_args()
+
+    recensioner = [dict(p, rubrik="Omdöme om boendet") for p in generera_poster(args.recensioner)]
+    slump = random.Random(11)
+    redigerade = [dict(r, innehåll=r['innehåll'] + " Uppdaterat.") if slump.random() < args.redigerade else r
+                  for r in recensioner]
+
+    moderering = EmpatiModerering(cache=ModereringsCache(max_i_minnet=args.recensioner * 2))
+    print(f"första granskning:  {_mät(moderering, recensioner):>8.0f}/s")
+    print(f"omgranskning:       {_mät(moderering, redigerade):>8.0f}/s")
+    statistik = moderering.cache_statistik()
+    print(f"träffgrad {statistik['träffgrad']:.0%}, {statistik['poster_i_minnet']} poster i minnet")
+
+    moderering.förbättringar['problem'] = 'svårighet'
+    moderering.kompilera_regler()
+    print(f"efter regeländring: {_mät(moderering, recensioner):>8.0f}/s (regelversion {moderering.regelversion})")
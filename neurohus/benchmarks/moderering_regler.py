@@ -0,0 +1,81 @@
+# Jämförelse av regelkontrollerna i EmpatiModerering
+# Ett sökpass i den kompilerade regelmotorn mot en delsträngs- eller regexsökning per regel
+
+import argparse
+import random
+import re
+import time
+
+from neurohus.ai.analys import EmpatiModerering
+from neurohus.ai.modereringscache import ModereringsCache
+from neurohus.benchmarks.korpus import generera_poster
+
+_INSLAG = ["Ring mig på 0701234567", "Han är en idiot", "Det var inte bra alls", "jag ska döda dig",
+           "mejla anna.svensson@exempel.se", "Vi hatar schemat", "Tack för ert stöd och er respekt"]
+
+
+def regel_för_regel(moderering: EmpatiModerering, text: str, roll: str) -> dict:
+    """Det gamla sättet: gemener per kontroll och en sökning per nyckelord, mönster och ersättning"""
+    text_lower = text.lower()
+    resultat = {
+        'negativa': [o for o in moderering.negativa_nyckelord if o in text_lower],
+        'personuppgifter': [t for m in moderering.personuppgifts_mönster for t in re.findall(m, text)],
+        'hot': [u + f for u, f in moderering.hot_mönster if re.search(u + f, text_lower)],
+    }
+    text_lower = text.lower()
+    resultat['empatiska'] = [o for o in moderering.empatiska_nyckelord if o in text_lower]
+    resultat['positiva'] = sum(1 for o in moderering.positiva_ord if o in text_lower)
+    resultat['negativa_sentiment'] = sum(1 for o in moderering.negativa_ord if o in text_lower)
+    text_lower = text.lower()
+    resultat['roll'] = [t for t in moderering.roll_termer.get(roll, []) if t in text_lower]
+    förbättrad = text
+    for gammalt, nytt in moderering.förbättringar.items():
+        förbättrad = förbättrad.replace(gammalt, nytt)
+    resultat['förbättrad'] = förbättrad
+    return resultat
+
+
+def ett_pass(moderering: EmpatiModerering, text: str, roll: str) -> dict:
+    träffar = moderering.regler.sök(text)
+    return {
+        'negativa': träffar.termer('negativ'),
+        'personuppgifter': träffar.texter('personuppgift'),
+        'hot': träffar.termer('hot'),
+        'empatiska': träffar.termer('empatisk'),
+        'positiva': len(träffar.termer('positiv')),
+        'negativa_sentiment': len(träffar.termer('negativ_sentiment')),
+        'roll': träffar.termer(f'roll:{roll}'),
+        'förbättrad': moderering.regler.ersätt(text, 'förbättring', moderering.förbättringar, träffar),
+    }
+
+
+def _mät(funktion, moderering, texter) -> float:
+    start = time.perf_counter()
+    for text in texter:
+        funktion(moderering, text, 'assistent')
+    return len(texter) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Texter per sekund för modereringens regelkontroller")
+    parser.add_argument("--texter", type=int, default=20_000)
+    parser.add_argument("--poster-per-text", type=int, nargs="+", default=[1, 4, 16],
+                        help="antal korpusposter som slås ihop till en text, från recension till långt foruminlägg")
+    args = parser.parse_args()
+
+    # Utan resultatcache så att varje text analyseras
+    moderering = EmpatiModerering(cache=ModereringsCache(max_i_minnet=0))
+    print(f"{'tecken':>7} {'regel för regel/s':>18} {'ett pass/s':>11} {'faktor':>7} {'moderera_text/s':>16}")
+    for per_text in args.poster_per_text:
+        slump = random.Random(3)
+        poster = [p['innehåll'] for p in generera_poster(args.texter * per_text)]
+        texter = [" ".join(poster[i:i + per_text]) + (" " + slump.choice(_INSLAG) if slump.random() < 0.3 else "")
+                  for i in range(0, len(poster), per_text)]
+        # Samma antal tecken per mätning så att längre texter inte tar längre tid totalt
+        texter = texter[:max(1_000, args.texter // per_text)]
+
+        före = _mät(regel_för_regel, moderering, texter)
+        efter = _mät(ett_pass, moderering, texter)
+        hela = _mät(lambda m, t, r: m.moderera_text(t, r), moderering, texter)
+        print(f"{sum(map(len, texter)) / len(texter):>7.0f} {före:>18.0f} {efter:>11.0f} "
+              f"{efter / före:>6.1f}x {hela:>16.0f}")
@@ -0,0 +1,56 @@
+# Tider per steg i modereringen
+# Spelar upp en korpus av svenska recensioner genom moderera_text och skriver p50/p95/p99 per steg
+
+import argparse
+import random
+import time
+
+from neurohus.ai.analys import EmpatiModerering
+from neurohus.ai.modereringscache import ModereringsCache
+from neurohus.ai.mätning import StegStatistik
+from neurohus.ai.profilering import Samplingsprofilerare
+from neurohus.benchmarks.korpus import generera_poster
+
+_ROLLER = ['användare', 'familj', 'assistent', 'kommun']
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="p50/p95/p99 per steg i moderera_text")
+    parser.add_argument("--recensioner", type=int, default=20_000)
+    parser.add_argument("--poster-per-text", type=int, default=1,
+                        help="korpusposter per text, högre värde ger längre texter")
+    parser.add_argument("--cache", action="store_true", help="mät med resultatcachen påslagen")
+    parser.add_argument("--profilera", action="store_true", help="kör även den samplande profileraren")
+    parser.add_argument("--intervall-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    poster = [p['innehåll'] for p in generera_poster(args.recensioner * args.poster_per_text)]
+    texter = [" ".join(poster[i:i + args.poster_per_text]) for i in range(0, len(poster), args.poster_per_text)]
+    slump = random.Random(9)
+    roller = [slump.choice(_ROLLER) for _ in texter]
+
+    sink = StegStatistik(max_prov=len(texter))
+    cache = None if args.cache else ModereringsCache(max_i_minnet=0)
+    moderering = EmpatiModerering(cache=cache, mätsink=sink)
+
+    profilerare = Samplingsprofilerare(args.intervall_ms) if args.profilera else None
+    if profilerare:
+        profilerare.starta()
+    start = time.perf_counter()
+    for text, roll in zip(texter, roller):
+        moderering.moderera_text(text, roll)
+    tid = time.perf_counter() - start
+    if profilerare:
+        profilerare.stoppa()
+
+    print(f"{len(texter)} texter, {sum(map(len, texter)) / len(texter):.0f} tecken i snitt, "
+          f"{len(texter) / tid:.0f} texter/s")
+    print(f"{'steg':>17} {'p50 µs':>9} {'p95 µs':>9} {'p99 µs':>9} {'antal':>7}")
+    for steg, statistik in sink.sammanfattning().items():
+        print(f"{steg:>17} {statistik['p50_ms'] * 1000:>9.1f} {statistik['p95_ms'] * 1000:>9.1f} "
+              f"{statistik['p99_ms'] * 1000:>9.1f} {statistik['antal']:>7}")
+
+    if profilerare:
+        print(f"\nsamplande profilering, {profilerare.antal_prov} prov")
+        print(f"{'egen':>6} {'kumul.':>6}  funktion")
+        for funktion, egen, kumulativ in profilerare.rapport():
+            print(f"{egen:>6.1%} {kumulativ:>6.1%}  {funktion}")
@@ -0,0 +1,56 @@
+# Mätning av strömmande moderering
+# Hela texten i ett anrop mot överlappande bitar, med och utan avbrott vid första blockerande träff
+
+import argparse
+import time
+import tracemalloc
+
+from neurohus.ai.analys import EmpatiModerering
+from neurohus.ai.modereringscache import ModereringsCache
+from neurohus.benchmarks.korpus import generera_poster
+
+
+def _mät(funktion):
+    tracemalloc.start()
+    start = time.perf_counter()
+    svar = funktion()
+    tid = time.perf_counter() - start
+    _, topp = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return svar, tid * 1000, topp / 1e6
+
+
+def _strömma(moderering, delar, avbryt):
+    ström = moderering.moderera_ström(delar, 'användare', avbryt_vid_blockering=avbryt)
+    for _ in ström:
+        pass
+    return ström.resultat()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tid och toppminne för moderering av långa dokument")
+    parser.add_argument("--tecken", type=int, default=2_000_000)
+    parser.add_argument("--personuppgift-vid", type=float, default=0.1,
+                        help="var i dokumentet en personuppgift ligger, som andel av längden")
+    args = parser.parse_args()
+
+    poster, längd = [], 0
+    for post in generera_poster(args.tecken // 40):
+        poster.append(post['innehåll'])
+        längd += len(post['innehåll']) + 1
+        if längd >= args.tecken:
+            break
+    poster.insert(int(len(poster) * args.personuppgift_vid), "Ring mig på 070-123 45 67.")
+    text = " ".join(poster)
+    # Dokumentet läses i delar om 64 kB, som från en fil
+    delar = lambda: (text[i:i + 65_536] for i in range(0, len(text), 65_536))
+
+    moderering = EmpatiModerering(cache=ModereringsCache(max_i_minnet=0))
+    print(f"dokument: {len(text)} tecken")
+    resultat, tid, topp = _mät(lambda: moderering.moderera_text(text, 'användare'))
+    print(f"moderera_text:          {tid:>8.1f} ms, toppminne {topp:>6.1f} MB, godkänd {resultat['godkänd']}")
+    resultat, tid, topp = _mät(lambda: _strömma(moderering, delar(), avbryt=False))
+    print(f"ström, hela texten:     {tid:>8.1f} ms, toppminne {topp:>6.1f} MB, godkänd {resultat['godkänd']}")
+    resultat, tid, topp = _mät(lambda: _strömma(moderering, delar(), avbryt=True))
+    print(f"ström, avbryt vid träff:{tid:>8.1f} ms, toppminne {topp:>6.1f} MB, godkänd {resultat['godkänd']}, "
+          f"{resultat['granskade_tecken']} tecken granskade")
@@ -0,0 +1,55 @@
+# Mätning av den asynkrona modereringskön
+# Skrivlatens för nya forumsvar med kö mot direkt moderering, och tid till utlåtande
+
+import argparse
+import time
+
+import numpy as np
+
+from neurohus.ai.analys import EmpatiModerering
+from neurohus.ai.modereringscache import ModereringsCache
+from neurohus.benchmarks.korpus import generera_poster
+from neurohus.community import CommunityManager
+
+
+def _skriv(manager: CommunityManager, tråd_id: str, texter, direkt: EmpatiModerering = None) -> np.ndarray:
+    tider = []
+    for text in texter:
+        start = time.perf_counter()
+        svar = manager.skapa_svar(tråd_id, "bänk", text)
+        if direkt is not None:
+            resultat = direkt.moderera_text(text, 'användare')
+            manager.moderera_innehåll(svar['svar_id'], 'svar', {'godkänd': resultat['godkänd']})
+        tider.append(time.perf_counter() - start)
+    return np.array(tider) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Skrivlatens och tid till modereringsutlåtande")
+    parser.add_argument("--svar", type=int, default=5_000)
+    parser.add_argument("--arbetare", type=int, default=2)
+    parser.add_argument("--poster-per-svar", type=int, default=8, help="korpusposter per forumsvar")
+    args = parser.parse_args()
+
+    poster = [p['innehåll'] for p in generera_poster(args.svar * args.poster_per_svar)]
+    texter = [" ".join(poster[i:i + args.poster_per_svar]) for i in range(0, len(poster), args.poster_per_svar)]
+    # Utan resultatcache så att varje svar analyseras
+    moderering = EmpatiModerering(cache=ModereringsCache(max_i_minnet=0))
+
+    manager = CommunityManager(automatisk_moderering=False)
+    tråd_id = manager.skapa_tråd("allmänt", "bänk", "Bänktråd", "Mätning")['tråd_id']
+    tider = _skriv(manager, tråd_id, texter, direkt=moderering)
+    print(f"direkt moderering: skrivning p50 {np.percentile(tider, 50):.3f} ms, p99 {np.percentile(tider, 99):.3f} ms")
+
+    manager = CommunityManager(moderering=moderering, modereringsarbetare=args.arbetare)
+    tråd_id = manager.skapa_tråd("allmänt", "bänk", "Bänktråd", "Mätning")['tråd_id']
+    start = time.perf_counter()
+    tider = _skriv(manager, tråd_id, texter)
+    manager.moderering_kö.vänta_tills_tom()
+    total = time.perf_counter() - start
+    metrik = manager.hämta_modereringsmetrik()
+    print(f"modereringskö:     skrivning p50 {np.percentile(tider, 50):.3f} ms, p99 {np.percentile(tider, 99):.3f} ms")
+    print(f"  tid till utlåtande p50 {metrik['fördröjning']['p50_ms']:.1f} ms, "
+          f"p99 {metrik['fördröjning']['p99_ms']:.1f} ms, {len(texter) / total:.0f} svar/s, "
+          f"{sum(s.modereringsstatus != 'väntar' for s in manager.forum_svar.values())} av {len(texter)} modererade")
+    manager.moderering_kö.stoppa()
@@ -0,0 +1,61 @@
+# Mätning av återupptagbar ommoderering
+# Avbryter jobbet mitt i mot en SQLite-fil och kontrollerar att fortsättningen ger samma resultat som en hel körning
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+from neurohus.ai.analys import EmpatiModerering
+from neurohus.ai.modereringscache import ModereringsCache
+from neurohus.ai.ommoderering import OmmodereringsJobb
+from neurohus.benchmarks.moderering_batch import _sqlite_med_recensioner
+
+
+def _utlåtanden(anslutning: sqlite3.Connection):
+    return anslutning.execute("SELECT id, modererad, godkänd FROM recensioner ORDER BY id").fetchall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ommoderering med kontrollpunkt mot SQLite")
+    parser.add_argument("--poster", type=int, default=20_000)
+    parser.add_argument("--batch-storlek", type=int, default=1000)
+    parser.add_argument("--processer", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    moderering = EmpatiModerering(cache=ModereringsCache(max_i_minnet=0))
+
+    # Referens: hela tabellen i en körning
+    referens = _sqlite_med_recensioner(args.poster)
+    t0 = time.perf_counter()
+    räknare = OmmodereringsJobb(moderering, referens, platshållare="?", batch_storlek=args.batch_storlek,
+                                processer=args.processer).kör()
+    tid = time.perf_counter() - t0
+    print(f"hel körning: {räknare['modererade'] / tid:.0f}/s, {räknare['godkända']} godkända")
+
+    # Avbruten körning i en fil, fortsatt från kontrollpunkten med nya anslutningar
+    with tempfile.TemporaryDirectory() as katalog:
+        sökväg = os.path.join(katalog, "recensioner.db")
+        fil = sqlite3.connect(sökväg)
+        referens.backup(fil)
+        fil.execute("UPDATE recensioner SET modererad = 0, godkänd = 0")
+        fil.commit()
+
+        jobb = OmmodereringsJobb(moderering, fil, platshållare="?", batch_storlek=args.batch_storlek,
+                                 processer=args.processer)
+        jobb.nollställ()
+        första = jobb.kör(max_rader=args.poster // 3)
+        fil.close()
+        print(f"avbruten efter {första['modererade']} rader, kontrollpunkt vid id {första['senaste_id']}")
+
+        fil = sqlite3.connect(sökväg)
+        jobb = OmmodereringsJobb(moderering, fil, platshållare="?", batch_storlek=args.batch_storlek,
+                                 processer=args.processer)
+        andra = jobb.kör()
+        print(f"fortsatt: {andra['modererade']} rader till, totalt {andra['totalt_modererade']}, "
+              f"{andra['totalt_godkända']} godkända")
+        print(f"samma resultat som hel körning: {_utlåtanden(fil) == _utlåtanden(referens)}")
+        print(f"ny körning utan regeländring: {jobb.kör()['modererade']} rader")
+        fil.close()
+    referens.close()
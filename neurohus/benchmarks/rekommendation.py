@@ -0,0 +1,67 @@
+# Mätning av verksamhetsrekommendationer
+# Jämför poängsättning per par med den förkompilerade kandidatmatrisen
+
+import argparse
+import time
+
+import numpy as np
+
+from neurohus.ai import EmpatiRekommendation, Urval
+from neurohus.benchmarks.korpus import generera_användare, generera_verksamheter
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rekommendationslatens per användare")
+    parser.add_argument("--verksamheter", type=int, default=50_000)
+    parser.add_argument("--anvandare", type=int, default=200)
+    parser.add_argument("--per-par", type=int, default=2_000,
+                        help="antal verksamheter för referensmätningen med beräkna_matchning")
+    args = parser.parse_args()
+
+    verksamheter = generera_verksamheter(args.verksamheter)
+    användare = generera_användare(args.anvandare)
+    # Ändringar anmäls via skrivvägarna, så samma lista fingeravtrycks inte per anrop
+    rekommendation = EmpatiRekommendation(kontrollera_katalog=False)
+
+    t0 = time.perf_counter()
+    rekommendation.kompilera_kandidater(verksamheter)
+    print(f"kompilering av {len(verksamheter)} verksamheter: {time.perf_counter() - t0:.2f} s")
+
+    tider = []
+    for profil in användare:
+        t0 = time.perf_counter()
+        rekommendation.rekommendera_verksamheter(profil, verksamheter)
+        tider.append(time.perf_counter() - t0)
+    p50, p95, p99 = np.percentile(tider, [50, 95, 99]) * 1000
+    print(f"kandidatmatris: p50 {p50:.2f} ms, p95 {p95:.2f} ms, p99 {p99:.2f} ms per användare")
+
+    # Med innehållskontroll fingeravtrycks hela katalogen vid varje anrop
+    rekommendation.kontrollera_katalog = True
+    t0 = time.perf_counter()
+    for profil in användare[:20]:
+        rekommendation.rekommendera_verksamheter(profil, verksamheter)
+    print(f"  med innehållskontroll: {(time.perf_counter() - t0) / 20 * 1000:.2f} ms per användare")
+    rekommendation.kontrollera_katalog = False
+
+    # Förfiltrering på hårda krav innan poängsättning
+    for namn, urval in (("gemensam diagnos", Urval(kräv_diagnos=True)),
+                        ("diagnos + åldersgrupp", Urval(kräv_diagnos=True, kräv_åldersgrupp=True)),
+                        ("typ + åldersgrupp", Urval(typer=["gruppboende"], kräv_åldersgrupp=True))):
+        # Beskärningsgraden ska gälla just detta urval
+        rekommendation.nollställ_förfilter_statistik()
+        tider = []
+        for profil in användare:
+            t0 = time.perf_counter()
+            rekommendation.rekommendera_verksamheter(profil, verksamheter, urval=urval)
+            tider.append(time.perf_counter() - t0)
+        p50, p95 = np.percentile(tider, [50, 95]) * 1000
+        statistik = rekommendation.förfilter_statistik()
+        print(f"  {namn:>22}: p50 {p50:.2f} ms, p95 {p95:.2f} ms, "
+              f"beskärningsgrad {statistik['beskärningsgrad']:.0%}")
+
+    # Referens: beräkna_matchning per par, uppräknad till hela katalogen
+    stickprov = verksamheter[:args.per_par]
+    t0 = time.perf_counter()
+    for profil in användare[:5]:
+        sorted((rekommendation.beräkna_matchning(profil, v) for v in stickprov), reverse=True)[:5]
+    per_användare = (time.perf_counter() - t0) / 5 * len(verksamheter) / len(stickprov)
+    print(f"per par (uppskattat för {len(verksamheter)}): {per_användare * 1000:.0f} ms per användare")
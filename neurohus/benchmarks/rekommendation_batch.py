@@ -0,0 +1,46 @@
+# Mätning av rekommendationer för många användare
+# Blockvis poängmatris användare x verksamheter jämfört med ett anrop per användare
+
+import argparse
+import time
+
+from neurohus.ai import EmpatiRekommendation, Urval
+from neurohus.benchmarks.korpus import generera_användare, generera_verksamheter
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rekommendationer för många användare samtidigt")
+    parser.add_argument("--verksamheter", type=int, default=20_000)
+    parser.add_argument("--anvandare", type=int, default=1_000)
+    parser.add_argument("--max-minne-mb", type=float, default=32)
+    args = parser.parse_args()
+
+    verksamheter = generera_verksamheter(args.verksamheter)
+    användare = generera_användare(args.anvandare)
+    rekommendation = EmpatiRekommendation()
+    rekommendation.kompilera_kandidater(verksamheter)
+
+    t0 = time.perf_counter()
+    for profil in användare:
+        rekommendation.rekommendera_verksamheter(profil)
+    en_i_taget = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    resultat = rekommendation.rekommendera_för_många(användare, max_minne_mb=args.max_minne_mb)
+    batch = time.perf_counter() - t0
+
+    par = len(användare) * len(verksamheter)
+    print(f"{len(användare)} användare x {len(verksamheter)} verksamheter")
+    print(f"  en i taget: {en_i_taget:6.2f} s, {len(användare) / en_i_taget:8.0f} användare/s")
+    print(f"  batch:      {batch:6.2f} s, {len(användare) / batch:8.0f} användare/s, "
+          f"{par / batch / 1e6:.0f} M par/s ({len(resultat)} topplistor)")
+
+    # Förfiltrering: varje användare poängsätts bara mot sina kandidatrader
+    for namn, urval in (("gemensam diagnos", Urval(kräv_diagnos=True)),
+                        ("diagnos + åldersgrupp", Urval(kräv_diagnos=True, kräv_åldersgrupp=True))):
+        rekommendation.nollställ_förfilter_statistik()
+        t0 = time.perf_counter()
+        rekommendation.rekommendera_för_många(användare, max_minne_mb=args.max_minne_mb, urval=urval)
+        tid = time.perf_counter() - t0
+        statistik = rekommendation.förfilter_statistik()
+        print(f"  {namn:>22}: {tid:6.2f} s, {len(användare) / tid:8.0f} användare/s, "
+              f"beskärningsgrad {statistik['beskärningsgrad']:.0%}")
@@ -0,0 +1,74 @@
+# Jämförelse av sentiment-backends: träffsäkerhet mot latens
+# Kör standard, int8 och onnx mot ett märkt urval svenska recensioner
+
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+from neurohus.ai.modeller import SENTIMENT_BACKENDS, ladda_lokal_sentiment_analyzer
+from neurohus.ai.sentiment import poängsätt_texter, till_sentiment_poäng
+
+MÄRKT_URVAL = Path(__file__).parent / "data" / "recensioner_markta.jsonl"
+
+
+def läs_urval(sökväg: Path):
+    with open(sökväg, encoding="utf-8") as f:
+        rader = [json.loads(rad) for rad in f if rad.strip()]
+    return [r['innehåll'] for r in rader], [r['etikett'] == 'positiv' for r in rader]
+
+
+def mät_backend(backend: str, texter, etiketter, upprepningar: int):
+    start = time.perf_counter()
+    analyzer = ladda_lokal_sentiment_analyzer(backend)
+    laddtid = time.perf_counter() - start
+    analyzer(texter[0])
+
+    # Latens för enskilda texter, så som en API-förfrågan ser den
+    enskilda = []
+    for _ in range(upprepningar):
+        for text in texter:
+            start = time.perf_counter()
+            till_sentiment_poäng(analyzer(text)[0])
+            enskilda.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(upprepningar):
+        resultat = poängsätt_texter(texter, analyzer=analyzer)
+    batch_tid = (time.perf_counter() - start) / upprepningar
+
+    prediktioner = [p is not None and p >= 0.5 for p in resultat.poäng]
+    träffsäkerhet = sum(p == e for p, e in zip(prediktioner, etiketter)) / len(etiketter)
+    return {
+        'laddtid_s': laddtid,
+        'median_ms': statistics.median(enskilda) * 1000,
+        'p95_ms': sorted(enskilda)[int(len(enskilda) * 0.95)] * 1000,
+        'texter_per_s_batch': len(texter) / batch_tid,
+        'träffsäkerhet': träffsäkerhet,
+        'poäng': resultat.poäng,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Jämför sentiment-backends")
+    parser.add_argument("--backends", nargs="+", default=list(SENTIMENT_BACKENDS))
+    parser.add_argument("--urval", type=Path, default=MÄRKT_URVAL)
+    parser.add_argument("--upprepningar", type=int, default=5)
+    args = parser.parse_args()
+
+    texter, etiketter = läs_urval(args.urval)
+    resultat = {backend: mät_backend(backend, texter, etiketter, args.upprepningar)
+                for backend in args.backends}
+
+    referens = resultat.get("standard")
+    print(f"{'backend':>9} {'ladd s':>7} {'p50 ms':>8} {'p95 ms':>8} {'batch/s':>9} "
+          f"{'träff':>6} {'överens':>8}")
+    for backend, r in resultat.items():
+        överens = "-"
+        if referens and backend != "standard":
+            lika = sum((a is not None and a >= 0.5) == (b is not None and b >= 0.5)
+                       for a, b in zip(r['poäng'], referens['poäng']))
+            överens = f"{lika / len(texter):.0%}"
+        print(f"{backend:>9} {r['laddtid_s']:>7.1f} {r['median_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+              f"{r['texter_per_s_batch']:>9.1f} {r['träffsäkerhet']:>6.0%} {överens:>8}")
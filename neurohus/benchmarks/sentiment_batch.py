@@ -0,0 +1,48 @@
+# Jämförelse av sentimentanalys per text mot batchad poängsättning
+# Kräver transformers och torch, körs på CPU
+
+import argparse
+import time
+
+from neurohus.ai.modeller import hämta_sentiment_analyzer
+from neurohus.ai.sentiment import poängsätt_texter, till_sentiment_poäng
+from neurohus.benchmarks.korpus import generera_poster
+
+
+def per_text(analyzer, texter):
+    """Det gamla sättet: ett anrop till pipelinen per text"""
+    poäng = []
+    for text in texter:
+        try:
+            poäng.append(till_sentiment_poäng(analyzer(text)[0]))
+        except Exception:
+            continue
+    return poäng
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mäter genomströmning för sentimentanalys")
+    parser.add_argument("--storlekar", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--batch-storlek", type=int, default=32)
+    parser.add_argument("--max-per-text", type=int, default=2_000,
+                        help="Antal texter som körs per text innan resultatet extrapoleras")
+    args = parser.parse_args()
+
+    analyzer = hämta_sentiment_analyzer()
+    analyzer("uppvärmning")
+
+    print(f"{'poster':>8} {'per text/s':>12} {'batchad/s':>12} {'faktor':>8} {'bortfall':>9}")
+    for storlek in args.storlekar:
+        texter = [p['innehåll'] for p in generera_poster(storlek)]
+
+        urval = texter[:args.max_per_text]
+        start = time.perf_counter()
+        per_text(analyzer, urval)
+        per_text_takt = len(urval) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        resultat = poängsätt_texter(texter, analyzer=analyzer, batch_storlek=args.batch_storlek)
+        batch_takt = len(texter) / (time.perf_counter() - start)
+
+        print(f"{storlek:>8} {per_text_takt:>12.1f} {batch_takt:>12.1f} "
+              f"{batch_takt / per_text_takt:>7.1f}x {resultat.antal_bortfall:>9}")
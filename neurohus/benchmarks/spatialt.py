@@ -0,0 +1,56 @@
+# Mätning av spatialt index på nationell skala
+# Radie- och närmaste-granne-sökning samt rekommendationer med avståndsfilter
+
+import argparse
+import time
+
+import numpy as np
+
+from neurohus.ai import EmpatiRekommendation
+from neurohus.benchmarks.korpus import generera_användare, generera_verksamheter
+
+
+def _percentiler(tider):
+    p50, p95, p99 = np.percentile(tider, [50, 95, 99]) * 1000
+    return f"p50 {p50:.3f} ms, p95 {p95:.3f} ms, p99 {p99:.3f} ms"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Spatialt index över verksamheter i hela landet")
+    parser.add_argument("--verksamheter", type=int, default=100_000)
+    parser.add_argument("--anvandare", type=int, default=500)
+    args = parser.parse_args()
+
+    verksamheter = generera_verksamheter(args.verksamheter, recensioner_per=1, med_koordinater=True)
+    användare = generera_användare(args.anvandare, med_koordinater=True)
+    rekommendation = EmpatiRekommendation()
+    kandidater = rekommendation.kompilera_kandidater(verksamheter)
+
+    t0 = time.perf_counter()
+    index = kandidater.spatialt_index
+    print(f"index över {len(index)} verksamheter byggt på {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    for radie in (10, 25, 50):
+        tider, träffar = [], []
+        for profil in användare:
+            t0 = time.perf_counter()
+            rader, _ = index.inom_radie(*profil.koordinater, radie)
+            tider.append(time.perf_counter() - t0)
+            träffar.append(len(rader))
+        print(f"radie {radie:>3} km: {_percentiler(tider)}, i snitt {np.mean(träffar):.0f} träffar")
+
+    tider = []
+    for profil in användare:
+        t0 = time.perf_counter()
+        index.närmaste(*profil.koordinater, k=10)
+        tider.append(time.perf_counter() - t0)
+    print(f"10 närmaste:   {_percentiler(tider)}")
+
+    for max_avstånd in (None, 50, 25):
+        tider = []
+        for profil in användare:
+            t0 = time.perf_counter()
+            rekommendation.rekommendera_verksamheter(profil, max_avstånd_km=max_avstånd)
+            tider.append(time.perf_counter() - t0)
+        etikett = "utan filter" if max_avstånd is None else f"inom {max_avstånd} km"
+        print(f"rekommendation {etikett:>11}: {_percentiler(tider)}")
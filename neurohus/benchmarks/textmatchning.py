@@ -0,0 +1,59 @@
+# Mätning av fritextmatchning mot verksamheter
+# LSH-sökning i textindexet jämförs med exakt sökning över alla vektorer
+
+import argparse
+import time
+
+import numpy as np
+
+from neurohus.ai import EmpatiRekommendation
+from neurohus.benchmarks.korpus import generera_verksamheter
+
+FRÅGOR = [
+    "Vi söker lugnt gruppboende med struktur och bildstöd för vår son med autism",
+    "Daglig verksamhet med musik och skapande för vuxen med intellektuell funktionsnedsättning",
+    "Korttidsboende med sensoriskt anpassade lokaler och erfaren personal",
+    "Personlig assistans med stöd i vardagen, matlagning och ekonomi",
+    "Avlösning och ledsagning nära samarbete med familj och habilitering",
+    "Assistansbolag med erfarenhet av epilepsi och cerebral pares",
+]
+
+
+def _percentiler(tider):
+    p50, p95, p99 = np.percentile(tider, [50, 95, 99]) * 1000
+    return f"p50 {p50:.2f} ms, p95 {p95:.2f} ms, p99 {p99:.2f} ms"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fritextmatchning över verksamhetsbeskrivningar och recensioner")
+    parser.add_argument("--verksamheter", type=int, default=200_000)
+    parser.add_argument("--fragor", type=int, default=300)
+    parser.add_argument("--antal", type=int, default=10)
+    args = parser.parse_args()
+
+    verksamheter = generera_verksamheter(args.verksamheter)
+    rekommendation = EmpatiRekommendation()
+    rekommendation.kompilera_kandidater(verksamheter)
+
+    t0 = time.perf_counter()
+    rekommendation.matcha_text(FRÅGOR[0], antal=args.antal)
+    index = rekommendation.textindex
+    print(f"textindex över {len(index)} verksamheter byggt på {time.perf_counter() - t0:.2f} s, "
+          f"{index.vektorer.nbytes / 2**20:.1f} MiB vektorer")
+
+    frågor = [FRÅGOR[i % len(FRÅGOR)] for i in range(args.fragor)]
+    resultat = {}
+    for namn, exakt in (("exakt", True), ("lsh", False)):
+        tider, träffar = [], []
+        for fråga in frågor:
+            t0 = time.perf_counter()
+            träffar.append(index.sök(fråga, args.antal, exakt=exakt))
+            tider.append(time.perf_counter() - t0)
+        resultat[namn] = träffar
+        print(f"{namn:>5}: {_percentiler(tider)}")
+
+    # Korpusen har många likvärdiga texter, så recall räknas på likhet: andelen
+    # LSH-träffar som är minst lika bra som den sämsta exakta topp-träffen
+    recall = np.mean([sum(likhet >= exakt[-1][1] - 1e-6 for _, likhet in lsh) / len(exakt)
+                      for lsh, exakt in zip(resultat["lsh"], resultat["exakt"]) if exakt])
+    print(f"recall@{args.antal} mot exakt sökning: {recall:.2f}")
@@ -0,0 +1,27 @@
+# Mätning av vektoriserad tidsindelning
+# Delar in en miljon tidpunkter per dag, vecka, månad och kvartal
+
+import argparse
+import time
+
+import numpy as np
+
+from neurohus.ai.tidsindelning import UPPLÖSNINGAR, dela_in
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mäter tidsindelning över många poster")
+    parser.add_argument("--antal", type=int, default=1_000_000)
+    parser.add_argument("--upprepningar", type=int, default=5)
+    args = parser.parse_args()
+
+    slump = np.random.default_rng(42)
+    start = np.datetime64("2019-01-01T00:00:00")
+    tider = start + slump.integers(0, 5 * 365 * 86400, args.antal).astype("timedelta64[s]")
+
+    for upplösning in UPPLÖSNINGAR:
+        bästa = float("inf")
+        for _ in range(args.upprepningar):
+            t0 = time.perf_counter()
+            serie = dela_in(tider, upplösning)
+            bästa = min(bästa, time.perf_counter() - t0)
+        print(f"{upplösning:>8}: {len(serie.antal):>5} hinkar, {bästa * 1000:7.1f} ms för {args.antal} poster")
@@ -0,0 +1,35 @@
+# Mätning av trendanalys för alla kommuner
+# Jämför ett anrop per kommun med analysera_alla_kommuner i ett svep
+
+import argparse
+import time
+
+from neurohus.ai import TrendAnalys, TrendStore
+from neurohus.benchmarks.korpus import generera_poster
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trendanalys per kommun jämfört med ett svep")
+    parser.add_argument("--antal", type=int, default=50_000)
+    parser.add_argument("--processer", type=int, default=None)
+    parser.add_argument("--per-kategori", action="store_true")
+    args = parser.parse_args()
+
+    poster = generera_poster(args.antal)
+    analys = TrendAnalys()
+
+    # Sentiment poängsätts en gång i förväg så att båda vägarna mäter samma arbete
+    lager = TrendStore.från_poster(poster)
+    analys.analysera_trender(lager)
+
+    t0 = time.perf_counter()
+    for kommun in lager.kommuner.värden:
+        analys.analysera_trender(lager, kommun=kommun)
+    per_kommun = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    resultat = analys.analysera_alla_kommuner(lager, per_kategori=args.per_kategori, processer=args.processer)
+    svep = time.perf_counter() - t0
+
+    print(f"{len(lager.kommuner.värden)} kommuner, {args.antal} poster")
+    print(f"  ett anrop per kommun: {per_kommun:7.2f} s")
+    print(f"  ett svep:             {svep:7.2f} s ({len(resultat)} kommuner)")
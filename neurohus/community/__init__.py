@@ -8,6 +8,8 @@ from dataclasses import dataclass
 import uuid
 import json
 
+from neurohus.ai.modereringskö import ModereringsKö
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -36,6 +38,7 @@ class ForumTråd:
     antal_svar: int
     antal_visningar: int
     modererad: bool
+    modereringsstatus: str = 'väntar'  # väntar, godkänd eller avvisad
 
 @dataclass
 class ForumSvar:
@@ -47,6 +50,7 @@ class ForumSvar:
     modererad: bool
     skapad: datetime
     redigerad: Optional[datetime]
+    modereringsstatus: str = 'väntar'  # väntar, godkänd eller avvisad
 
 @dataclass
 class PrivatCirkel:
@@ -63,11 +67,15 @@ class PrivatCirkel:
 class CommunityManager:
     """Hanterar community-funktionalitet"""
     
-    def __init__(self):
+    def __init__(self, automatisk_moderering: bool = True, moderering: Any = None,
+                 modereringsarbetare: int = 2):
         self.forum_kategorier = {}
         self.forum_trådar = {}
         self.forum_svar = {}
         self.privata_cirklar = {}
+        # Nya trådar och svar modereras i bakgrunden, skrivningen väntar inte på utlåtandet
+        self.moderering_kö = (ModereringsKö(self._verkställ_moderering, moderering, modereringsarbetare)
+                              if automatisk_moderering else None)
         self._skapa_standard_kategorier()
     
     def _skapa_standard_kategorier(self):
@@ -164,6 +172,8 @@ class CommunityManager:
         )
         
         self.forum_trådar[tråd_id] = tråd
+        if self.moderering_kö:
+            self.moderering_kö.lägg_till(tråd_id, 'tråd', f"{titel}\n{innehåll}")
         
         logger.info(f"Skapade forumtråd: {titel}")
         
@@ -241,6 +251,8 @@ class CommunityManager:
         )
         
         self.forum_svar[svar_id] = svar
+        if self.moderering_kö:
+            self.moderering_kö.lägg_till(svar_id, 'svar', innehåll)
         
         # Uppdatera trådstatistik
         tråd.antal_svar += 1
@@ -343,6 +355,7 @@ class CommunityManager:
                 if innehåll_id in self.forum_trådar:
                     tråd = self.forum_trådar[innehåll_id]
                     tråd.modererad = moderering.get('godkänd', False)
+                    tråd.modereringsstatus = 'godkänd' if tråd.modererad else 'avvisad'
                     
                     if moderering.get('stäng'):
                         tråd.stängd = True
@@ -356,6 +369,7 @@ class CommunityManager:
                 if innehåll_id in self.forum_svar:
                     svar = self.forum_svar[innehåll_id]
                     svar.modererad = moderering.get('godkänd', False)
+                    svar.modereringsstatus = 'godkänd' if svar.modererad else 'avvisad'
                     
                     return {'meddelande': 'Svar modererat framgångsrikt'}
             
@@ -365,6 +379,18 @@ class CommunityManager:
             logger.error(f"Fel vid moderering: {e}")
             return {'fel': str(e)}
     
+    def _verkställ_moderering(self, innehåll_id: str, innehåll_typ: str, resultat: Dict[str, Any]):
+        """Tar emot utlåtanden från modereringskön"""
+        svar = self.moderera_innehåll(innehåll_id, innehåll_typ, {'godkänd': resultat.get('godkänd', False)})
+        if 'fel' in svar:
+            logger.warning(f"Kunde inte verkställa moderering av {innehåll_typ} {innehåll_id}: {svar['fel']}")
+    
+    def hämta_modereringsmetrik(self) -> Dict[str, Any]:
+        """Ködjup, fördröjning och genomströmning för den automatiska modereringen"""
+        if not self.moderering_kö:
+            return {'fel': 'Automatisk moderering är avstängd'}
+        return self.moderering_kö.metrik()
+    
     def hämta_community_statistik(self) -> Dict[str, Any]:
         """Hämtar statistik över community-aktivitet"""
         nu = datetime.now()
@@ -413,7 +439,8 @@ class CommunityManager:
             'senast_svar': tråd.senast_svar.isoformat(),
             'antal_svar': tråd.antal_svar,
             'antal_visningar': tråd.antal_visningar,
-            'modererad': tråd.modererad
+            'modererad': tråd.modererad,
+            'modereringsstatus': tråd.modereringsstatus
         }
     
     def _svar_till_dict(self, svar: ForumSvar) -> Dict[str, Any]:
@@ -424,6 +451,7 @@ class CommunityManager:
             'författare_id': svar.författare_id,
             'innehåll': svar.innehåll,
             'modererad': svar.modererad,
+            'modereringsstatus': svar.modereringsstatus,
             'skapad': svar.skapad.isoformat(),
             'redigerad': svar.redigerad.isoformat() if svar.redigerad else None
         }
@@ -507,6 +535,10 @@ class CommunityAPI:
         """Modererar forumtrådar och svar"""
         return self.community_manager.moderera_innehåll(innehåll_id, innehåll_typ, moderering)
     
+    def hämta_modereringsmetrik(self) -> Dict[str, Any]:
+        """Hämtar metrik för den automatiska modereringskön"""
+        return self.community_manager.hämta_modereringsmetrik()
+    
     def hämta_community_statistik(self) -> Dict[str, Any]:
         """Hämtar statistik över community-aktivitet"""
         return self.community_manager.hämta_community_statistik()
@@ -100,7 +100,16 @@ CREATE TABLE recensioner (
     anonym BOOLEAN DEFAULT TRUE,
     skapad TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     modererad BOOLEAN DEFAULT FALSE,
-    godkänd BOOLEAN DEFAULT FALSE
+    godkänd BOOLEAN DEFAULT FALSE,
+    empati_poäng REAL -- Sätts när recensionen skrivs, NULL tills den poängsatts
+);
+
+-- Löpande empatisumma per verksamhet, hålls aktuell av trigger på recensioner
+CREATE TABLE verksamhet_empati (
+    verksamhet_id UUID PRIMARY KEY REFERENCES verksamheter(id) ON DELETE CASCADE,
+    antal_recensioner INTEGER NOT NULL DEFAULT 0,
+    empati_summa DOUBLE PRECISION NOT NULL DEFAULT 0,
+    uppdaterad TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- ==============================================
@@ -276,8 +285,10 @@ CREATE TABLE audit_loggar (
 
 CREATE INDEX idx_verksamheter_kommun ON verksamheter(kommun);
 CREATE INDEX idx_verksamheter_typ ON verksamheter(typ);
+CREATE INDEX idx_verksamheter_koordinater ON verksamheter USING gist(koordinater);
 CREATE INDEX idx_recensioner_verksamhet ON recensioner(verksamhet_id);
 CREATE INDEX idx_recensioner_användare ON recensioner(användare_id);
+CREATE INDEX idx_recensioner_ej_empatipoängsatta ON recensioner(id) WHERE empati_poäng IS NULL;
 CREATE INDEX idx_kurs_progress_användare ON kurs_progress(användare_id);
 CREATE INDEX idx_forum_trådar_kategori ON forum_trådar(kategori_id);
 CREATE INDEX idx_audit_loggar_användare ON audit_loggar(användare_id);
@@ -476,6 +487,34 @@ CREATE TRIGGER trigger_update_antal_svar
     FOR EACH ROW
     EXECUTE FUNCTION update_antal_svar();
 
+-- Trigger för löpande empatisumma per verksamhet
+CREATE OR REPLACE FUNCTION update_verksamhet_empati()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.verksamhet_id IS NOT NULL AND OLD.empati_poäng IS NOT NULL THEN
+        UPDATE verksamhet_empati SET
+            antal_recensioner = antal_recensioner - 1,
+            empati_summa = empati_summa - OLD.empati_poäng,
+            uppdaterad = CURRENT_TIMESTAMP
+        WHERE verksamhet_id = OLD.verksamhet_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.verksamhet_id IS NOT NULL AND NEW.empati_poäng IS NOT NULL THEN
+        INSERT INTO verksamhet_empati (verksamhet_id, antal_recensioner, empati_summa)
+        VALUES (NEW.verksamhet_id, 1, NEW.empati_poäng)
+        ON CONFLICT (verksamhet_id) DO UPDATE SET
+            antal_recensioner = verksamhet_empati.antal_recensioner + 1,
+            empati_summa = verksamhet_empati.empati_summa + EXCLUDED.empati_summa,
+            uppdaterad = CURRENT_TIMESTAMP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_update_verksamhet_empati
+    AFTER INSERT OR DELETE OR UPDATE OF empati_poäng, verksamhet_id ON recensioner
+    FOR EACH ROW
+    EXECUTE FUNCTION update_verksamhet_empati();
+
 -- ==============================================
 -- VIEWS FÖR RAPPORTER
 -- ==============================================
@@ -0,0 +1,125 @@
+# Tester för bulkmoderering och strömmande databasåtkomst
+# Processpoolen jämförs mot körning i samma process, databasen är SQLite i minnet
+
+import itertools
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from neurohus.ai.analys import EmpatiModerering
+from neurohus.ai.batchmoderering import moderera_batch
+from neurohus.ai.databasström import läs_strömmande, skriv_batchvis
+from neurohus.ai.modereringscache import ModereringsCache
+
+POSTER = [
+    "Personalen visade stor respekt och förståelse, tack för ert stöd",
+    {'innehåll': "Dålig kommunikation och inte bra bemötande", 'betyg': 5, 'rubrik': "Omdöme"},
+    "Ring mig på 070-123 45 67 så berättar jag mer",
+    {'innehåll': "Ni är värdelösa", 'användare_roll': 'familj'},
+    "Ok",
+    {'innehåll': "Värdefull hjälp och empati i vardagen", 'betyg': 4},
+    "Kränkande och nedvärderande kommentarer från ledningen",
+]
+
+
+class LångsamModerering:
+    """Tar en stund per post så att bitar hinner bli väntande i poolen"""
+
+    def moderera_text(self, text, roll):
+        time.sleep(0.05)
+        return {'text': text}
+
+
+def _utan_datum(resultat):
+    return [{nyckel: värde for nyckel, värde in r.items() if nyckel != 'modererings_datum'} for r in resultat]
+
+
+def test_processpool_ger_samma_resultat_i_samma_ordning_som_en_process():
+    moderering = EmpatiModerering(cache=ModereringsCache(max_i_minnet=0))
+    poster = POSTER * 5
+    en_process = list(moderera_batch(moderering, poster, bitstorlek=3, processer=1))
+    två_processer = list(moderera_batch(moderering, poster, bitstorlek=3, processer=2, max_bitar_i_luften=3))
+    assert len(två_processer) == len(poster)
+    assert _utan_datum(två_processer) == _utan_datum(en_process)
+
+
+def test_avbruten_läsning_släpper_väntande_bitar(monkeypatch):
+    framtider = []
+
+    class RegistreradPool(ProcessPoolExecutor):
+        def submit(self, *args, **kwargs):
+            framtid = super().submit(*args, **kwargs)
+            framtider.append(framtid)
+            return framtid
+
+    # Modulen själv, inte den lata proxyn i neurohus.ai
+    monkeypatch.setitem(moderera_batch.__globals__, "ProcessPoolExecutor", RegistreradPool)
+    lästa = itertools.count()
+    oändlig = (f"text {next(lästa)}" for _ in itertools.count())
+
+    resultat = moderera_batch(LångsamModerering(), oändlig, bitstorlek=1, processer=2, max_bitar_i_luften=10)
+    assert next(resultat) == {'text': "text 0"}
+    resultat.close()
+
+    # Högst max_bitar_i_luften bitar har lästs och de som inte startat är avbrutna
+    assert len(framtider) == 10
+    assert next(lästa) <= 11
+    assert all(framtid.done() for framtid in framtider)
+    assert any(framtid.cancelled() for framtid in framtider)
+
+
+class RäknandeAnslutning:
+    """sqlite3-anslutning som räknar fetchmany-anropen på sina markörer"""
+
+    def __init__(self, anslutning):
+        self.anslutning = anslutning
+        self.hämtningar = []
+
+    def cursor(self):
+        markör = self.anslutning.cursor()
+        anslutning = self
+
+        class Markör:
+            def __getattr__(self, namn):
+                return getattr(markör, namn)
+
+            def fetchmany(self, storlek):
+                rader = markör.fetchmany(storlek)
+                anslutning.hämtningar.append(len(rader))
+                return rader
+
+        return Markör()
+
+    def commit(self):
+        self.anslutning.commit()
+
+
+@pytest.fixture
+def anslutning():
+    anslutning = sqlite3.connect(":memory:")
+    anslutning.execute("CREATE TABLE rader (id INTEGER PRIMARY KEY, värde TEXT, kopia TEXT)")
+    yield anslutning
+    anslutning.close()
+
+
+def test_strömmande_läsning_faller_tillbaka_på_fetchmany(anslutning):
+    antal = skriv_batchvis(anslutning, "INSERT INTO rader (id, värde) VALUES (?, ?)",
+                           ((i, f"v{i}") for i in range(1, 11)), batch_storlek=4)
+    assert antal == 10
+
+    räknande = RäknandeAnslutning(anslutning)
+    rader = list(läs_strömmande(räknande, "SELECT id, värde FROM rader WHERE id > ? ORDER BY id", [2],
+                                batch_storlek=3))
+    assert rader == [(i, f"v{i}") for i in range(3, 11)]
+    assert räknande.hämtningar == [3, 3, 2, 0]
+
+
+def test_skrivning_batchvis_under_strömmande_läsning(anslutning):
+    skriv_batchvis(anslutning, "INSERT INTO rader (id, värde) VALUES (?, ?)",
+                   ((i, f"v{i}") for i in range(1, 8)))
+    ström = ((värde, id) for id, värde in
+             läs_strömmande(anslutning, "SELECT id, värde FROM rader ORDER BY id", batch_storlek=2))
+    assert skriv_batchvis(anslutning, "UPDATE rader SET kopia = ? WHERE id = ?", ström, batch_storlek=3) == 7
+    assert anslutning.execute("SELECT COUNT(*) FROM rader WHERE kopia = värde").fetchone() == (7,)
@@ -0,0 +1,89 @@
+# Tester för återupptagbar ommoderering
+# Kör jobbet mot SQLite-ersättningen för recensionstabellen
+
+import sqlite3
+
+import pytest
+
+from neurohus.ai.analys import EmpatiModerering
+from neurohus.ai.modereringscache import ModereringsCache
+from neurohus.ai.ommoderering import OmmodereringsJobb, skapa_sqlite_recensioner
+
+TEXTER = [
+    "Personalen visade stor respekt och förståelse, tack för ert stöd",
+    "Dålig kommunikation och inte bra bemötande",
+    "Ring mig på 070-123 45 67 så berättar jag mer",
+    "Ok",
+    "Värdefull hjälp och empati i vardagen, viktig verksamhet",
+    "Det finns problem men också en lösning på det mesta",
+    "Kränkande och nedvärderande kommentarer från ledningen",
+]
+
+
+@pytest.fixture
+def moderering():
+    return EmpatiModerering(cache=ModereringsCache(max_i_minnet=0))
+
+
+def _databas(antal: int = 60) -> sqlite3.Connection:
+    anslutning = sqlite3.connect(":memory:")
+    skapa_sqlite_recensioner(anslutning)
+    anslutning.executemany(
+        "INSERT INTO recensioner (innehåll, rubrik, betyg) VALUES (?, ?, ?)",
+        ((TEXTER[i % len(TEXTER)], "Omdöme", None if i % 5 == 0 else i % 5 + 1) for i in range(antal)))
+    anslutning.commit()
+    return anslutning
+
+
+def _jobb(moderering, anslutning) -> OmmodereringsJobb:
+    return OmmodereringsJobb(moderering, anslutning, platshållare="?", batch_storlek=8, processer=1)
+
+
+def _utlåtanden(anslutning):
+    return anslutning.execute("SELECT id, modererad, godkänd FROM recensioner ORDER BY id").fetchall()
+
+
+def test_återupptagen_körning_ger_samma_resultat_som_hel_körning(moderering):
+    referens = _databas()
+    hel = _jobb(moderering, referens).kör()
+    assert hel['klar'] and hel['modererade'] == 60
+    assert 0 < hel['godkända'] < 60
+
+    anslutning = _databas()
+    första = _jobb(moderering, anslutning).kör(max_rader=25)
+    assert not första['klar']
+    assert första['modererade'] == 25
+    assert _jobb(moderering, anslutning).kontrollpunkt().senaste_id == första['senaste_id']
+
+    andra = _jobb(moderering, anslutning).kör()
+    assert andra['klar']
+    assert andra['modererade'] == 35
+    assert andra['totalt_modererade'] == hel['totalt_modererade']
+    assert andra['totalt_godkända'] == hel['totalt_godkända']
+    assert _utlåtanden(anslutning) == _utlåtanden(referens)
+
+    # Utan regeländring finns inget kvar att göra
+    assert _jobb(moderering, anslutning).kör()['modererade'] == 0
+
+
+def test_klar_när_gränsen_är_exakt_antalet_rader(moderering):
+    anslutning = _databas(16)
+    räknare = _jobb(moderering, anslutning).kör(max_rader=16)
+    assert räknare['modererade'] == 16
+    assert räknare['klar']
+
+
+def test_ändrad_regelversion_börjar_om(moderering):
+    anslutning = _databas()
+    _jobb(moderering, anslutning).kör(max_rader=20)
+
+    moderering.negativa_nyckelord.append('ledningen')
+    moderering.kompilera_regler()
+    räknare = _jobb(moderering, anslutning).kör()
+    assert räknare['klar']
+    assert räknare['modererade'] == räknare['totalt_modererade'] == 60
+    assert _jobb(moderering, anslutning).kontrollpunkt().regelversion == moderering.regelversion
+
+    referens = _databas()
+    _jobb(moderering, referens).kör()
+    assert _utlåtanden(anslutning) == _utlåtanden(referens)
@@ -0,0 +1,75 @@
+# Tester för regelmotorn
+# Ordgränser, böjningar, fraser, hotmönster, persondata och ersättningar
+
+import pytest
+
+from neurohus.ai.maskering import PERSONUPPGIFTS_BÖRJAN, PERSONUPPGIFTS_MÖNSTER
+from neurohus.ai.regelmotor import Regelmotor
+
+
+@pytest.fixture
+def regler():
+    return Regelmotor(
+        ordlistor={
+            'negativ': ['hat', 'hot', 'idiot'],
+            'empatisk': ['bra', 'stöd'],
+            'förbättring': ['inte bra', 'dålig', 'problem'],
+        },
+        mönster={'personuppgift': [m for uttryck in PERSONUPPGIFTS_MÖNSTER.values() for m in uttryck]},
+        villkor={'hot': [('jag kommer', '.*skada'), ('kommer', '.*att.*skada')]},
+        mönster_början=PERSONUPPGIFTS_BÖRJAN
+    )
+
+
+@pytest.mark.parametrize("text", ["Hotellet var fint", "En hatt på huvudet", "Hatten blåste av",
+                                  "Idiotisk regel", "brasa i kaminen"])
+def test_ord_inuti_andra_ord_träffar_inte(regler, text):
+    assert not regler.sök(text).har('negativ')
+    assert not regler.sök(text).har('empatisk')
+
+
+@pytest.mark.parametrize("text, term", [("De hatar oss", 'hat'), ("Hotet var allvarligt", 'hot'),
+                                         ("Han hotade personalen", 'hot'), ("Idioten skrek", 'idiot'),
+                                         ("Stödet betydde mycket", 'stöd')])
+def test_böjda_former_räknas_som_grundordet(regler, text, term):
+    träffar = regler.sök(text)
+    assert term in (träffar.termer('negativ') + träffar.termer('empatisk'))
+
+
+def test_ord_utan_böjningar_träffar_bara_exakt_form():
+    regler = Regelmotor(ordlistor={'negativ': ['hat']}, böjningar={})
+    assert regler.sök("Hat och hot").termer('negativ') == ['hat']
+    assert not regler.sök("De hatar oss").har('negativ')
+
+
+def test_längsta_fras_vinner(regler):
+    träffar = regler.sök("Maten var inte bra, men personalen var bra")
+    assert [t.term for t in träffar.i_kategori('förbättring')] == ['inte bra']
+    bra = träffar.i_kategori('empatisk')
+    assert len(bra) == 1 and bra[0].start == len("Maten var inte bra, men personalen var ")
+
+
+def test_hot_spänner_över_utlösare_och_fortsättning(regler):
+    text = "Om ni inte lyssnar jag kommer att skada någon"
+    hot = regler.sök(text).i_kategori('hot')
+    assert {t.term for t in hot} == {'jag kommer.*skada', 'kommer.*att.*skada'}
+    for träff in hot:
+        assert text[träff.start:träff.slut] == träff.text
+        assert träff.text.endswith("skada")
+    assert min(t.start for t in hot) == text.index("jag kommer")
+    assert not regler.sök("Jag kommer imorgon").har('hot')
+
+
+def test_persondata_har_rätt_positioner(regler):
+    text = "Ring 070-123 45 67 eller mejla anna.svensson@exempel.se, pnr 19800101-1234."
+    träffar = regler.sök(text).i_kategori('personuppgift')
+    assert [t.text for t in träffar] == ["070-123 45 67", "anna.svensson@exempel.se", "19800101-1234"]
+    for träff in träffar:
+        assert text[träff.start:träff.slut] == träff.text
+
+
+def test_ersättning_bevarar_stor_bokstav_och_hoppar_över_böjda_former(regler):
+    ersättningar = {'inte bra': 'kan förbättras', 'dålig': 'utvecklingspotential', 'problem': 'utmaning'}
+    text = "Dålig mat. Det var inte bra och problemen kvarstår, ett Problem till."
+    assert regler.ersätt(text, 'förbättring', ersättningar) == \
+        "Utvecklingspotential mat. Det var kan förbättras och problemen kvarstår, ett Utmaning till."
@@ -0,0 +1,104 @@
+# Tester för empatiska rekommendationer
+# Syntetisk katalog från benchmarkkorpusen
+
+import dataclasses
+
+import pytest
+
+from neurohus.ai import EmpatiRekommendation, Urval
+from neurohus.ai.rekommendationscache import recensions_fingeravtryck
+from neurohus.benchmarks.korpus import generera_användare, generera_verksamheter
+
+
+@pytest.fixture
+def verksamheter():
+    return generera_verksamheter(300)
+
+
+@pytest.fixture
+def rekommendation(verksamheter):
+    rekommendation = EmpatiRekommendation()
+    rekommendation.kompilera_kandidater(verksamheter)
+    return rekommendation
+
+
+def test_många_användare_ger_en_topplista_per_profil_i_ordning(rekommendation):
+    användare = generera_användare(6)
+    # Samma id och saknat id får inte skriva över varandras topplistor
+    användare[3] = dataclasses.replace(användare[3], användare_id=användare[0].användare_id)
+    användare[4] = dataclasses.replace(användare[4], användare_id=None)
+
+    topplistor = rekommendation.rekommendera_för_många(användare, antal=3)
+    assert len(topplistor) == len(användare)
+    for profil, topplista in zip(användare, topplistor):
+        enskild = rekommendation.rekommendera_verksamheter(profil, antal=3)
+        assert [v for v, _ in topplista] == [v for v, _ in enskild]
+        assert [p for _, p in topplista] == pytest.approx([p for _, p in enskild])
+
+
+def test_förfiltrerad_batch_poängsätter_bara_kandidatrader(rekommendation):
+    användare = generera_användare(40)
+    urval = Urval(kräv_diagnos=True, kräv_åldersgrupp=True)
+
+    rekommendation.nollställ_förfilter_statistik()
+    topplistor = rekommendation.rekommendera_för_många(användare, antal=4, urval=urval)
+    statistik = rekommendation.förfilter_statistik()
+    assert statistik['antal_sökningar'] == len(användare)
+    assert 0 < statistik['beskärningsgrad'] < 1
+
+    kandidater = rekommendation.kandidater
+    for profil, topplista in zip(användare, topplistor):
+        enskild = kandidater.topp(profil, 4, urval=urval)
+        assert [v for v, _ in topplista] == [v for v, _ in enskild]
+        assert [p for _, p in topplista] == pytest.approx([p for _, p in enskild])
+        rader = kandidater.kandidatrader(profil, urval)
+        assert {kandidater.rad_för_id[v] for v, _ in topplista} <= set(rader.tolist())
+
+
+def _med_recension(verksamheter):
+    return next(v for v in verksamheter if v.recensioner)
+
+
+@pytest.mark.parametrize("ändring", ["innehåll", "betyg", "beskrivning"])
+def test_redigerad_recension_eller_beskrivning_ger_cachemiss(rekommendation, verksamheter, ändring):
+    profil = generera_användare(1)[0]
+    rekommendation.rekommendera_verksamheter(profil, verksamheter)
+    rekommendation.rekommendera_verksamheter(profil, verksamheter)
+    före = rekommendation.cache_statistik()
+    assert före['träffar'] == 1
+
+    verksamhet = _med_recension(verksamheter)
+    if ändring == "beskrivning":
+        verksamhet.beskrivning = "Helt ny beskrivning av verksamheten"
+    elif ändring == "betyg":
+        verksamhet.recensioner[0]['betyg'] = verksamhet.recensioner[0]['betyg'] % 5 + 1
+    else:
+        verksamhet.recensioner[0]['innehåll'] += " Uppdaterad efter nytt besök."
+
+    rekommendation.rekommendera_verksamheter(profil, verksamheter)
+    efter = rekommendation.cache_statistik()
+    assert efter['träffar'] == före['träffar']
+    assert efter['inaktuella'] == före['inaktuella'] + 1
+    assert efter['katalogversion'] > före['katalogversion']
+
+
+def test_anmälda_ändringar_utan_innehållskontroll(verksamheter):
+    rekommendation = EmpatiRekommendation(kontrollera_katalog=False)
+    rekommendation.kompilera_kandidater(verksamheter)
+    profil = generera_användare(1)[0]
+    rekommendation.rekommendera_verksamheter(profil, verksamheter)
+
+    # Samma lista jämförs inte, ändringen gäller först när den anmäls
+    verksamhet = _med_recension(verksamheter)
+    verksamhet.recensioner[0]['innehåll'] += " Uppdaterad efter nytt besök."
+    version = rekommendation.katalogversion
+    rekommendation.rekommendera_verksamheter(profil, verksamheter)
+    assert rekommendation.katalogversion == version
+    assert rekommendation.cache_statistik()['träffar'] == 1
+
+    rekommendation.uppdatera_verksamhet(verksamhet)
+    rekommendation.rekommendera_verksamheter(profil, verksamheter)
+    assert rekommendation.katalogversion > version
+    assert rekommendation.cache_statistik()['inaktuella'] == 1
+    assert rekommendation._recensionsavtryck[verksamhet.verksamhet_id] == \
+        recensions_fingeravtryck(verksamhet.recensioner)
@@ -0,0 +1,72 @@
+# Tester för det inkrementella temaindexet
+# Ett synkat index ska alltid ge samma poäng som ett nybyggt över samma poster
+
+import numpy as np
+
+from neurohus.ai.teman import TemaIndex
+
+POSTER = [
+    {'id': 1, 'innehåll': "Bra personal och bra bemötande"},
+    {'id': 2, 'innehåll': "Dålig mat men bra personal"},
+    {'id': 3, 'innehåll': "Kommunen svarar aldrig, dålig kommunikation"},
+    {'id': 4, 'innehåll': "Ok"},
+    {'id': 5, 'innehåll': "Stöd i vardagen och bra bemötande"},
+]
+
+
+def _poäng_per_term(index: TemaIndex) -> dict:
+    return {term: p for term, p in zip(index._termer, index.poäng()) if p > 0}
+
+
+def _som_nybyggt(index: TemaIndex, poster) -> None:
+    referens = TemaIndex()
+    referens.lägg_till_poster(poster)
+    assert index.antal_dokument == referens.antal_dokument
+    faktiska, förväntade = _poäng_per_term(index), _poäng_per_term(referens)
+    assert faktiska.keys() == förväntade.keys()
+    for term, poäng in förväntade.items():
+        assert np.isclose(faktiska[term], poäng)
+    assert index.toppteman(5) == referens.toppteman(5)
+
+
+def test_ändring_borttagning_och_omordning_före_sista_posten():
+    index = TemaIndex()
+    assert index.lägg_till_poster(POSTER) == 5
+
+    ändrade = [dict(p) for p in POSTER]
+    ändrade[1]['innehåll'] = "Fantastisk mat och trevlig personal"
+    del ändrade[2]
+    ändrade[0], ändrade[2] = ändrade[2], ändrade[0]
+    assert index.lägg_till_poster(ändrade) == 1
+    _som_nybyggt(index, ändrade)
+    assert 'dålig' not in index.toppteman(20)
+
+    # Oförändrad korpus i annan ordning är ingen ändring
+    assert index.lägg_till_poster(list(reversed(ändrade))) == 0
+    _som_nybyggt(index, ändrade)
+
+
+def test_beskärning_håller_vokabulären_begränsad():
+    poster = [{'id': i, 'innehåll': f"bra personal ovanligt{i}"} for i in range(40)]
+    index = TemaIndex(max_features=5, max_termer=20)
+    index.lägg_till_poster(poster)
+    assert len(index._termer) <= 20
+    assert {'bra', 'personal', 'bra personal'} <= set(index.vokabulär)
+
+    # Borttagning efter beskärning drar bara av kvarvarande kolumner
+    index.lägg_till_poster(poster[:10])
+    assert index.antal_dokument == 10
+    assert (index._dokumentfrekvens[:len(index._termer)] >= 0).all()
+    assert index._dokumentfrekvens[index.vokabulär['bra']] == 10
+
+
+def test_spara_och_ladda_behåller_postbidragen(tmp_path):
+    index = TemaIndex()
+    index.lägg_till_poster(POSTER)
+    sökväg = tmp_path / "teman.npz"
+    index.spara(str(sökväg))
+
+    laddat = TemaIndex.ladda(str(sökväg))
+    kvar = POSTER[:2] + POSTER[3:]
+    assert laddat.lägg_till_poster(kvar) == 0
+    _som_nybyggt(laddat, kvar)
@@ -0,0 +1,43 @@
+# Tester för trendanalys av alla kommuner i ett svep
+# Jämför mot analys av en kommun i taget
+
+from neurohus.ai import TrendAnalys
+from neurohus.ai.sentiment import SentimentCache
+
+POSTER = [
+    {'id': 1, 'kommun': 'Ale', 'kategori': 'stöd', 'innehåll': "bra personal", 'skapad': "2024-01-05"},
+    {'id': 2, 'kommun': 'Borås', 'kategori': 'stöd', 'innehåll': "dålig mat och dålig mat igen",
+     'skapad': "2024-01-07"},
+    {'id': 3, 'kommun': 'Borås', 'kategori': 'stöd', 'innehåll': "kommunen svarar aldrig",
+     'skapad': "2024-02-01"},
+    {'id': 4, 'kommun': 'Borås', 'kategori': 'stöd',
+     'innehåll': "personalen på boendet lyssnar men kommunen har långa köer till stödet",
+     'skapad': "2024-02-11"},
+    {'id': 5, 'kommun': 'Crange', 'kategori': 'stöd', 'innehåll': "trygg vardag", 'skapad': "2024-03-02"},
+    {'id': 6, 'kommun': 'Crange', 'kategori': 'stöd', 'innehåll': "trygg vardag, trygg personal",
+     'skapad': "2024-03-09"},
+]
+
+
+def _teman(resultat) -> list:
+    return resultat['tema_analys']['vanligaste_teman']
+
+
+def test_teman_för_alla_kommuner_hör_till_kommunens_egna_poster():
+    analys = TrendAnalys(sentiment_cache=SentimentCache(max_i_minnet=0))
+    alla = analys.analysera_alla_kommuner(POSTER)
+    assert set(alla) == {'Ale', 'Borås', 'Crange'}
+
+    for kommun, resultat in alla.items():
+        enskild = analys.analysera_trender(POSTER, kommun=kommun)
+        egna = _teman(enskild)
+        if len(egna) < 10:
+            # Hela kommunens vokabulär ryms i topplistan
+            assert set(_teman(resultat)) == set(egna)
+        else:
+            termer = set(analys.vektoriserare.fit(
+                [p['innehåll'] for p in POSTER if p['kommun'] == kommun]).get_feature_names_out())
+            assert set(_teman(resultat)) <= termer
+            assert len(_teman(resultat)) == 10
+
+    assert set(_teman(alla['Ale'])) == {'bra', 'personal', 'bra personal'}